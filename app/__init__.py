@@ -2,9 +2,19 @@ from flask import Flask
 from flask_bootstrap import Bootstrap
 from flask_sqlalchemy import SQLAlchemy
 from config import config
+from .prices import PriceClient
+from .jobs import JobManager
+from .shared import SharedPanels
+from .profiling import MemoryProfiler
+from .symbols import SymbolUniverse
 
 bootstrap = Bootstrap()
 db = SQLAlchemy()
+prices = PriceClient()
+jobs = JobManager()
+shared = SharedPanels()
+memory = MemoryProfiler()
+symbols = SymbolUniverse()
 
 
 def create_app(config_name):
@@ -14,6 +24,11 @@ def create_app(config_name):
 
     bootstrap.init_app(app)
     db.init_app(app)
+    prices.init_app(app)
+    symbols.init_app(app)
+    memory.init_app(app)
+    jobs.init_app(app)
+    shared.init_app(app)
 
     from .main import main as main_blueprint
     app.register_blueprint(main_blueprint)
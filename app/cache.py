@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# table name -> callbacks run when this process writes to the table
+write_callbacks = {}
+
+
+class LRUCache(object):
+    """
+    LRU Cache Object
+
+    -Thread-safe in-process cache for computed results
+    -Evicts least recently used entries beyond maxsize
+    -Expires entries older than ttl seconds
+
+    Parameters
+    =========
+    maxsize : integer
+        maximum number of entries kept
+    ttl : float
+        seconds an entry stays valid (None keeps entries until evicted)
+    """
+
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return default
+            stamp, value = entry
+            if self.ttl is not None and time.time() - stamp > self.ttl:
+                del self.entries[key]
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.time(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def invalidate_on_write(tables, callback):
+    # run callback after any INSERT / UPDATE / DELETE on tables in this process -
+    # ORM flushes, bulk mappings and Query.update / delete alike - and again
+    # once the writing transaction commits or rolls back
+    for table in tables:
+        callbacks = write_callbacks.setdefault(table, [])
+        if callback not in callbacks:
+            callbacks.append(callback)
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def watch_writes(conn, cursor, statement, parameters, context, executemany):
+    if context is None or context.compiled is None or not (context.isinsert or context.isupdate or context.isdelete):
+        return
+    table = getattr(context.compiled.statement, 'table', None)
+    if table is not None and table.name in write_callbacks:
+        conn.info.setdefault('written_tables', set()).add(table.name)
+        for callback in write_callbacks[table.name]:
+            callback()
+
+
+@event.listens_for(Engine, 'commit')
+@event.listens_for(Engine, 'rollback')
+def settle_writes(conn):
+    # results cached mid-transaction may hold uncommitted rows - drop them once settled
+    for table in conn.info.pop('written_tables', ()):
+        for callback in write_callbacks[table]:
+            callback()
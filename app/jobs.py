@@ -0,0 +1,206 @@
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobCancelled(Exception):
+    # raised inside a job's progress callback once cancellation is requested
+    pass
+
+
+def no_progress(done, total=None, message=None):
+    # default progress callback for engines run outside a job
+    pass
+
+
+class Job(object):
+    """
+    Job Object
+
+    -One long-running analytics call in a background thread
+    -Engines report progress through job.report - the callback also
+      raises JobCancelled, so work stops cooperatively between chunks
+    -Cancelled automatically when no client has watched it for a while
+
+    Parameters
+    =========
+    name : string
+        label shown on the progress page
+    redirect : string
+        url to open once the job is done (optional)
+    idle_timeout : float
+        seconds without a watcher before the job is treated as abandoned
+
+    Methods
+    =======
+    report:
+        record progress - raises JobCancelled if job should stop
+    cancel:
+        request cooperative cancellation
+    touch:
+        mark job as watched
+    state:
+        JSON-ready snapshot of status and progress
+    stream:
+        generator of Server-Sent Event messages until job finishes
+    """
+
+    def __init__(self, name, redirect=None, idle_timeout=30):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.redirect = redirect
+        self.idle_timeout = idle_timeout
+        self.status = 'running'
+        self.done = 0
+        self.total = None
+        self.message = 'Queued'
+        self.result = None
+        self.error = None
+        self.profile = []  # memory / timing records of profiled stages
+        self.seen = self.finished = time.time()
+        self.cancelled = threading.Event()
+        self.changed = threading.Condition()
+
+    def report(self, done, total=None, message=None):
+        if time.time() - self.seen > self.idle_timeout:
+            self.cancelled.set()
+        if self.cancelled.is_set():
+            raise JobCancelled(self.name)
+        with self.changed:
+            self.done, self.total = done, total
+            if message is not None:
+                self.message = message
+            self.changed.notify_all()
+
+    def finish(self, status, result=None, error=None):
+        with self.changed:
+            self.status, self.result, self.error = status, result, error
+            self.finished = time.time()
+            self.changed.notify_all()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def touch(self):
+        self.seen = time.time()
+
+    def state(self):
+        done = self.status == 'done'
+        return {'id': self.id, 'name': self.name, 'status': self.status, 'done': self.done,
+                'total': self.total, 'message': self.message, 'error': self.error,
+                'result': self.result if done else None, 'redirect': self.redirect if done else None,
+                'profile': self.profile}
+
+    def stream(self, heartbeat=10):
+        # one 'progress' event per change, comment lines as keep-alive,
+        # final event carries the closing status
+        last = None
+        while True:
+            self.touch()
+            state = self.state()
+            if state != last:
+                yield 'event: {}\ndata: {}\n\n'.format('progress' if state['status'] == 'running' else 'end',
+                                                       json.dumps(state))
+                last = state
+            if state['status'] != 'running':
+                return
+            with self.changed:
+                self.changed.wait(heartbeat)
+            if self.state() == last:
+                yield ': keep-alive\n\n'
+
+
+class JobManager(object):
+    """
+    Job Manager Object
+
+    -Runs analytics jobs on a small thread pool inside the app
+    -Each job gets its own app context (and database session)
+    -Finished jobs are forgotten after JOB_TTL seconds
+    -Single process only - the registry lives in this process's memory,
+      so /jobs/<id> is only found by the process that started the job;
+      serve the app from one threaded process (manage.py runserver, or
+      one worker with threads behind a WSGI server), never prefork
+    -Jobs share the process with request threads - engines draw on
+      their own matplotlib Figure, never on pyplot's global state
+
+    Parameters
+    =========
+    app : Flask app
+        optional app to configure manager from
+
+    Methods
+    =======
+    init_app:
+        configure manager from app config
+    submit:
+        start func(*args, progress=job.report) in the background
+    get:
+        look up a job by id
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.max_workers = 2
+        self.idle_timeout = 30
+        self.ttl = 600
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self._executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.max_workers = app.config.get('JOB_WORKERS', self.max_workers)
+        self.idle_timeout = app.config.get('JOB_IDLE_TIMEOUT', self.idle_timeout)
+        self.ttl = app.config.get('JOB_TTL', self.ttl)
+        app.extensions['jobs'] = self
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def submit(self, name, func, *args, **kwargs):
+        # start job - func must accept a progress keyword
+        redirect = kwargs.pop('redirect', None)
+        job = Job(name, redirect, self.idle_timeout)
+        with self.lock:
+            self.expire()
+            self.jobs[job.id] = job
+        self.executor.submit(self.run, job, func, args, kwargs)
+        return job
+
+    def run(self, job, func, args, kwargs):
+        profiler = self.app.extensions.get('memory_profiler')
+        with self.app.app_context():
+            try:
+                # first report also drops jobs cancelled or abandoned while queued
+                job.report(0, None, 'Started')
+                if profiler is not None and profiler.enabled:
+                    # stage records fill in as the job runs
+                    with profiler.collect() as job.profile:
+                        result = func(*args, progress=job.report, **kwargs)
+                else:
+                    result = func(*args, progress=job.report, **kwargs)
+            except JobCancelled:
+                job.finish('cancelled')
+            except Exception as e:
+                job.finish('failed', error=str(e))
+            else:
+                job.finish('done', result)
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def expire(self):
+        # drop finished jobs past their ttl
+        now = time.time()
+        for job_id in [job_id for job_id, job in self.jobs.items()
+                       if job.status != 'running' and now - job.finished > self.ttl]:
+            del self.jobs[job_id]
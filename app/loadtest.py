@@ -0,0 +1,209 @@
+import datetime as dt
+import json
+import threading
+import time
+from collections import defaultdict
+
+import numpy as np
+from sqlalchemy import event
+
+from . import db, prices
+from .models import Portfolio, Holding
+
+# routes driven by the load test and their share of traffic
+ROUTE_MIX = {'portfolio_main': 0.3, 'portfolio': 0.4, 'holding_edit': 0.25, 'optimize': 0.05}
+
+
+class LoadTest(object):
+    """
+    Load Test Object
+
+    -Seeds N portfolios x M holdings into a scratch database
+    -Drives concurrent traffic through the app with one test client per
+      thread - prices come from whatever source the app is configured
+      with (the 'loadtest' config uses the deterministic fake source)
+    -Records latency, errors and database queries per route
+      (queries of background jobs are not attributed to a route)
+
+    Parameters
+    =========
+    app : Flask app
+        app under test - its database is dropped and re-created
+    portfolios : integer
+        number of portfolios seeded
+    holdings : integer
+        holdings per portfolio
+    concurrency : integer
+        client threads
+    requests : integer
+        total requests across all threads
+    mix : dict
+        route name -> share of requests (default ROUTE_MIX)
+    seed : integer
+        seed for portfolio contents and request order
+
+    Methods
+    =======
+    seed_database:
+        create scratch schema and bulk insert portfolios and holdings
+    run:
+        send requests from all client threads
+    report:
+        per-route throughput, latency percentiles and query counts
+    """
+
+    def __init__(self, app, portfolios=20, holdings=25, concurrency=8, requests=400, mix=None, seed=0):
+        self.app = app
+        self.portfolios = portfolios
+        self.holdings = holdings
+        self.concurrency = concurrency
+        self.requests = requests
+        self.mix = mix or ROUTE_MIX
+        self.seed = seed
+        self.results = defaultdict(list)  # route -> [(seconds, queries, ok)]
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.elapsed = None
+        self.job_timeout = 300  # seconds a polled optimization may run before it counts as an error
+
+    def seed_database(self):
+        # bulk insert everything at once - prices fetched once per symbol
+        rng = np.random.RandomState(self.seed)
+        universe = ['L{:04d}'.format(i) for i in range(max(2 * self.holdings, 50))]
+        last = dict((sym, round(float(prices.last_price(sym)), 2)) for sym in universe)
+        today = dt.date.today()
+        with self.app.app_context():
+            db.drop_all()
+            db.create_all()
+            ports, books = [], []
+            for i in range(self.portfolios):
+                symbols = rng.choice(universe, self.holdings, replace=False)
+                shares = rng.randint(1, 200, self.holdings)
+                cash = float(rng.randint(1000, 50000))
+                invested = market_value = 0.0
+                book = []
+                for sym, count in zip(symbols, shares):
+                    purch_price = round(last[sym] * rng.uniform(0.7, 1.1), 2)
+                    value = int(count) * last[sym]
+                    book.append(dict(symbol=sym, shares=int(count), purch_date=today - dt.timedelta(days=365),
+                                     purch_price=purch_price, last_price=last[sym], market_value=value,
+                                     total_profit=round(int(count) * (last[sym] - purch_price), 2),
+                                     profit_percent=round(last[sym] / purch_price - 1, 4),
+                                     last_updated=str(today)))
+                    invested += int(count) * purch_price
+                    market_value += value
+                market_value += cash
+                profit = market_value - invested - cash
+                ports.append(dict(name='load{:04d}'.format(i), cash=cash, market_value=market_value,
+                                  invested=invested, total_profit=profit,
+                                  profit_percent=round(profit / invested, 4), num_holdings=self.holdings))
+                books.append(book)
+            db.session.bulk_insert_mappings(Portfolio, ports, return_defaults=True)
+            for port, book in zip(ports, books):
+                for row in book:
+                    row['portfolio_id'] = port['id']
+                    row['portfolio_percent'] = round(row['market_value'] / port['market_value'], 4)
+            db.session.bulk_insert_mappings(Holding, [row for book in books for row in book])
+            db.session.commit()
+            self.targets = [(port['name'], holding.id, holding.symbol)
+                            for port in ports for holding in Holding.query.filter_by(portfolio_id=port['id'])]
+            self.names = [port['name'] for port in ports]
+
+    def count_query(self, *args):
+        # engine hook - counts statements issued by the current client thread
+        if getattr(self.local, 'queries', None) is not None:
+            self.local.queries += 1
+
+    def request(self, route, send):
+        # time one request and record its query count
+        self.local.queries = 0
+        start = time.time()
+        try:
+            ok = send() < 400
+        except Exception:
+            ok = False
+        seconds = time.time() - start
+        with self.lock:
+            self.results[route].append((seconds, self.local.queries, ok))
+        self.local.queries = None
+
+    def worker(self, count, seed):
+        rng = np.random.RandomState(seed)
+        routes = sorted(self.mix)
+        weights = np.array([self.mix[route] for route in routes], dtype=float)
+        client = self.app.test_client()
+        for route in rng.choice(routes, count, p=weights / weights.sum()):
+            name = self.names[rng.randint(len(self.names))]
+            if route == 'portfolio_main':
+                self.request(route, lambda: client.get('/portfolio_main').status_code)
+            elif route == 'portfolio':
+                self.request(route, lambda: client.get('/portfolio/' + name).status_code)
+            elif route == 'holding_edit':
+                name, holding_id, symbol = self.targets[rng.randint(len(self.targets))]
+                with client.session_transaction() as session:
+                    session['portfolio'] = name
+                url = '/portfolio/{}/{}/holding_edit/{}'.format(name, symbol, holding_id)
+                shares = int(rng.randint(1, 200))
+                self.request(route, lambda: client.post(url, data={'new_shares': shares}).status_code)
+            elif route == 'optimize':
+                self.optimize(client, name)
+
+    def optimize(self, client, name):
+        # submission is timed as 'optimize', the background job as 'optimize_job'
+        form = {'start_date': str(dt.date.today() - dt.timedelta(weeks=26)), 'risk_free': 1.0,
+                'estimator': 'sample', 'sampling': 'sobol', 'min_weight': 0.0, 'max_weight': 100.0,
+                'turnover': 0.0}
+        response = {}
+
+        def submit():
+            response['r'] = client.post('/portfolio/{}/optimal/ask'.format(name), data=form)
+            return response['r'].status_code
+        start = time.time()
+        self.request('optimize', submit)
+        location = response.get('r') and response['r'].headers.get('Location', '')
+        if not location or '/jobs/' not in location:
+            return
+        # poll like the progress page does - polling also keeps the job watched
+        # a job the app no longer knows (expired, or started by another process) is an error
+        status = 'running'
+        while status == 'running':
+            time.sleep(0.1)
+            poll = client.get('/api/jobs/' + location.rsplit('/', 1)[-1])
+            if poll.status_code != 200:
+                status = 'missing'
+            elif time.time() - start > self.job_timeout:
+                status = 'timeout'
+            else:
+                status = json.loads(poll.get_data(as_text=True))['status']
+        with self.lock:
+            self.results['optimize_job'].append((time.time() - start, 0, status == 'done'))
+
+    def run(self):
+        # split requests across threads and send them all
+        engine = db.get_engine(self.app)
+        event.listen(engine, 'before_cursor_execute', self.count_query)
+        counts = [self.requests // self.concurrency + (i < self.requests % self.concurrency)
+                  for i in range(self.concurrency)]
+        threads = [threading.Thread(target=self.worker, args=(count, self.seed + i + 1))
+                   for i, count in enumerate(counts)]
+        start = time.time()
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            self.elapsed = time.time() - start
+            event.remove(engine, 'before_cursor_execute', self.count_query)
+        return self.report()
+
+    def report(self):
+        # one row per route - latencies in milliseconds
+        rows = []
+        for route in sorted(self.results):
+            seconds, queries, ok = (np.array(col) for col in zip(*self.results[route]))
+            p50, p90, p99 = np.percentile(seconds * 1000, (50, 90, 99))
+            rows.append({'route': route, 'requests': len(seconds), 'errors': int((~ok).sum()),
+                         'per_second': len(seconds) / self.elapsed, 'p50': p50, 'p90': p90, 'p99': p99,
+                         'max': seconds.max() * 1000, 'queries': queries.mean()})
+        return rows
@@ -0,0 +1,275 @@
+from .. import shared
+from ..jobs import no_progress
+from .panel import return_panel, portfolio_symbols
+from .batch import solve_max_sharpe
+from .constraints import OptimizationError
+from .risk import exposure_weights
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import datetime as dt
+import hashlib
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+
+class RollingMoments(object):
+    """
+    Rolling Moments Object
+
+    -Windowed mean and covariance of a return panel
+    -Slides forward by adding new rows and removing old ones
+      instead of recomputing the window from scratch
+    -Sums are accumulated in float64 whatever the panel dtype
+
+    Parameters
+    =========
+    rets : array (days x symbols)
+        daily log returns
+    window : integer
+        number of days in estimation window
+    """
+
+    def __init__(self, rets, window):
+        self.rets = rets
+        self.window = window
+        self.start = self.end = 0
+        self.s1 = np.zeros(rets.shape[1])
+        self.s2 = np.zeros((rets.shape[1], rets.shape[1]))
+
+    def advance(self, end):
+        # move window to rows [end - window, end)
+        start = max(0, end - self.window)
+        if start >= self.end:
+            # no overlap with current window - rebuild
+            block = self.rets[start:end].astype(np.float64)
+            self.s1 = block.sum(axis=0)
+            self.s2 = block.T.dot(block)
+        else:
+            add = self.rets[self.end:end].astype(np.float64)
+            drop = self.rets[self.start:start].astype(np.float64)
+            self.s1 += add.sum(axis=0) - drop.sum(axis=0)
+            self.s2 += add.T.dot(add) - drop.T.dot(drop)
+        self.start, self.end = start, end
+
+    def mean(self):
+        return self.s1 / (self.end - self.start)
+
+    def cov(self):
+        n = self.end - self.start
+        mean = self.s1 / n
+        return (self.s2 - n * np.outer(mean, mean)) / (n - 1)
+
+
+def drawdown(equity):
+    # maximum peak-to-trough loss of an equity curve
+    return float(np.max(1 - equity / np.maximum.accumulate(equity)))
+
+
+def curve_stats(equity, turnover=0.0):
+    # summary statistics of a daily equity curve starting at 1
+    rets = equity[1:] / equity[:-1] - 1
+    years = len(rets) / 252.0
+    vol = float(rets.std() * np.sqrt(252)) if len(rets) > 1 else 0.0
+    ann = float(equity[-1] ** (1 / years) - 1) if years else 0.0
+    return {'total_return': float(equity[-1] - 1), 'annual_return': ann, 'volatility': vol,
+            'sharpe': ann / vol if vol else 0.0, 'max_drawdown': drawdown(equity), 'turnover': float(turnover)}
+
+
+def walk_forward(rets, window=126, rebalance=21, cost=0.001, rf=0.0, progress=None):
+    """ Returns equity curve and statistics of a rolling max-Sharpe strategy.
+
+    Parameters
+    ==========
+    rets : array (days x symbols)
+        daily log returns
+    window : integer
+        estimation window in days
+    rebalance : integer
+        days between re-optimizations
+    cost : float
+        transaction cost per unit of turnover
+    rf : float
+        risk-free interest rate
+    progress : callable
+        progress(done, total, message) after each rebalance - may raise to cancel
+
+    Returns
+    =======
+    equity : array
+        daily strategy value from end of first window, starting at 1
+    stats : dict
+        return, volatility, Sharpe ratio, drawdown and turnover
+    """
+    progress = progress or no_progress
+    starts = range(window, len(rets), rebalance)
+    growth = np.exp(rets)
+    moments = RollingMoments(rets, window)
+    weights = np.zeros(rets.shape[1])
+    value = 1.0
+    turnover = 0.0
+    curves = [np.ones(1)]
+    for i, start in enumerate(starts):
+        # re-optimize on trailing window and pay for turnover
+        moments.advance(start)
+        try:
+            target = solve_max_sharpe((moments.mean() * 252, moments.cov() * 252, rf))
+        except OptimizationError:
+            # no solution on this window - keep holding unless nothing is held yet
+            if not weights.any():
+                raise
+            target = weights
+        traded = np.abs(target - weights).sum()
+        turnover += traded
+        value *= 1 - cost * traded
+
+        # hold until next rebalance - drift is vectorized over the block
+        block = np.cumprod(growth[start:start + rebalance], axis=0)
+        path = value * block.dot(target)
+        curves.append(path)
+        value = path[-1]
+        weights = target * block[-1] / block[-1].dot(target)
+        progress(i + 1, len(starts), 'Rebalances tested')
+    equity = np.concatenate(curves)
+    return equity, curve_stats(equity, turnover)
+
+
+def buy_and_hold(rets, weights, window=126):
+    # equity curve of fixed initial weights over same period as walk_forward
+    block = np.cumprod(np.exp(rets[window:]), axis=0)
+    equity = np.concatenate([np.ones(1), block.dot(weights / weights.sum())])
+    return equity, curve_stats(equity)
+
+
+def run_backtest(args):
+    # single grid point - module-level so it can be shipped to worker processes
+    # rets may be the path of a shared panel, memory-mapped instead of unpickled
+    # a point without a solution on its first window comes back as its error
+    rets, window, rebalance, cost, rf = args
+    if isinstance(rets, str):
+        rets = np.load(rets, mmap_mode='r')
+    try:
+        equity, stats = walk_forward(rets, window, rebalance, cost, rf)
+    except OptimizationError as e:
+        return {'error': str(e)}
+    return stats
+
+
+def grid_search(rets, windows, rebalances, costs, rf=0.0, processes=None, progress=None):
+    # run every (window, rebalance, cost) combination across a process pool
+    # queued grid points are cancelled if progress raises; failed points carry 'error'
+    progress = progress or no_progress
+    params = list(itertools.product(windows, rebalances, costs))
+    # with shared panels, workers map one copy of the returns rather than each task carrying it
+    rets = np.ascontiguousarray(rets)
+    key = ('backtest', hashlib.sha1(rets.tobytes()).hexdigest(), rets.shape)
+    # pinned - workers open the file by path, so it must not be evicted before the grid is done
+    paths = shared.publish(key, {'rets': rets}, pin=True)
+    source = paths['rets'] if paths else rets
+    tasks = [(source, window, rebalance, cost, rf) for window, rebalance, cost in params]
+    stats = [None] * len(tasks)
+    pool = ProcessPoolExecutor(max_workers=processes)
+    futures = {}
+    try:
+        futures = dict((pool.submit(run_backtest, task), i) for i, task in enumerate(tasks))
+        for done, future in enumerate(as_completed(futures)):
+            stats[futures[future]] = future.result()
+            progress(done + 1, len(tasks), 'Grid points tested')
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+    finally:
+        pool.shutdown(wait=False)
+        shared.release(key)
+    return [dict(window=window, rebalance=rebalance, cost=cost, **result)
+            for (window, rebalance, cost), result in zip(params, stats)]
+
+
+def portfolio_grid(portfolio, start_date, windows, rebalances, costs, rf=0.0, processes=None, progress=None):
+    # grid search over a portfolio's return panel - best Sharpe ratio first, failed points last
+    rets = return_panel(portfolio_symbols(portfolio), start_date)
+    windows = [window for window in windows if window < len(rets)]
+    if not windows:
+        raise ValueError('Not enough history for any window - {} days of returns'.format(len(rets)))
+    results = grid_search(rets.values, windows, rebalances, costs, rf, processes, progress)
+    return sorted(results, key=lambda result: ('error' not in result, result.get('sharpe', 0.0)), reverse=True)
+
+
+# class definition for portfolio backtest
+# to hold methods and attributes needed while backtesting
+class PortfolioBacktest(object):
+    """
+    Portfolio Backtest Object
+
+    -Walk-forward test of rolling max-Sharpe rebalancing
+    -Compares against buy-and-hold of current holding weights
+    -Plots both equity curves into static folder
+
+    Parameters
+    =========
+    portfolio : Portfolio model
+        input portfolio to be backtested
+    start_date : datetime.date
+        start of historical returns (first window is used for estimation)
+    window : integer
+        estimation window in days
+    rebalance : integer
+        days between re-optimizations
+    cost : float
+        transaction cost per unit of turnover
+    rf : float
+        risk-free interest rate
+
+    Methods
+    =======
+    initialize_parameters:
+        load cached return panel and current weights
+    run:
+        run strategy and benchmark
+    plot_equity:
+        plot equity curves into static folder
+    """
+
+    def __init__(self, portfolio, start_date, window=126, rebalance=21, cost=0.001, rf=0.0):
+        # initialize input parameters
+        self.portfolio = portfolio  # portfolio to backtest
+        self.start_date = start_date  # start date for historical returns
+        self.window = window  # estimation window in days
+        self.rebalance = rebalance  # days between rebalances
+        self.cost = cost  # cost per unit turnover
+        self.rf = rf  # risk-free interest rate
+
+        self.initialize_parameters()
+        self.run()
+        self.plot_equity()
+
+    def initialize_parameters(self):
+        self.symbols = portfolio_symbols(self.portfolio)
+        self.weights = exposure_weights(self.portfolio, self.symbols)
+        self.rets = return_panel(self.symbols, self.start_date)
+        if len(self.rets) <= self.window:
+            raise ValueError('Not enough history for a {} day window'.format(self.window))
+
+    def run(self):
+        rets = self.rets.values
+        self.equity, self.stats = walk_forward(rets, self.window, self.rebalance, self.cost, self.rf)
+        self.bench_equity, self.bench_stats = buy_and_hold(rets, self.weights, self.window)
+        self.dates = self.rets.index[self.window - 1:]
+
+    def plot_equity(self):
+        # own figure, not pyplot state - requests plot from several threads
+        fig = Figure(figsize=(10, 6))
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
+        ax.plot(self.dates, self.equity, lw=2.0, label='Optimized (rebalanced)')
+        ax.plot(self.dates, self.bench_equity, lw=2.0, label='Current weights (buy and hold)')
+        ax.grid(True)
+        ax.set_ylabel('Growth of $1', fontsize=18)
+        ax.set_title('Walk-forward backtest: ' + self.portfolio.name, fontsize=20, y=1.02)
+        ax.legend(loc=0)
+        fig.savefig(basedir[:-4] + 'static/backtest.png', bbox_inches='tight')
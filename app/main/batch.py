@@ -0,0 +1,229 @@
+from .. import db
+from ..jobs import no_progress
+from ..models import Portfolio
+from .panel import universe_fetch, price_panel, return_panel, covariance_panel
+from .book import holdings_book
+from .estimators import as_estimate
+from .constraints import OptimizationError, checked_weights, solve_constrained, round_shares
+from .hrp import solve_hrp
+
+import numpy as np
+import scipy.optimize as sco
+import datetime as dt
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def solve_max_sharpe(args):
+    # maximize Sharpe ratio for one portfolio - long only, fully invested
+    # cov may be a matrix or covariance estimate (dense or factor form)
+    # module-level so it can be shipped to worker processes
+    # optional fourth item is a warm-start weight vector - a failed warm
+    # start is retried from equal weights before OptimizationError is raised
+    mu, cov, rf = args[:3]
+    equal = np.ones(len(mu)) / len(mu)
+    x0 = args[3] if len(args) > 3 and args[3] is not None else equal
+    cov = as_estimate(cov)
+
+    def neg_sharpe(weights):
+        return -(weights.dot(mu) - rf) / np.sqrt(cov.variance(weights))
+
+    def neg_sharpe_grad(weights):
+        vol = np.sqrt(cov.variance(weights))
+        excess = weights.dot(mu) - rf
+        return -(mu * vol - excess * cov.product(weights) / vol) / vol ** 2
+
+    def solve(start):
+        return sco.minimize(neg_sharpe, start, jac=neg_sharpe_grad, method='SLSQP',
+                            bounds=[(0, 1)] * len(mu),
+                            constraints=({'type': 'eq', 'fun': lambda weights: weights.sum() - 1},))
+    result = solve(x0)
+    if not result.success and x0 is not equal:
+        result = solve(equal)
+    return checked_weights(result)
+
+
+def solve_chunk(tasks, solver=solve_max_sharpe):
+    # several max-Sharpe problems per worker round trip
+    # a failed solve comes back as its OptimizationError so the other portfolios still run
+    results = []
+    for task in tasks:
+        try:
+            results.append(solver(task))
+        except OptimizationError as e:
+            results.append(e)
+    return results
+
+
+# class definition for batch optimizer
+# to hold methods and attributes needed while optimizing all portfolios
+class BatchOptimizer(object):
+    """
+    Batch Optimizer Object
+
+    -Optimizes many portfolios in one pass
+    -Fetches prices for the union of symbols once; each portfolio's
+      return panel and covariance are sliced from it over its own
+      history (shared by portfolios holding the same symbols)
+    -Covariance may come from any estimator, including a factor model
+    -Solves the portfolios across cores
+    -Optionally applies weight limits, group caps and a turnover penalty
+    -Or allocates by hierarchical risk parity instead of max-Sharpe
+    -Portfolios the optimizer fails on are skipped and listed in failed
+    -Writes every <name>_opt portfolio in one transaction at integer shares
+
+    Parameters
+    =========
+    portfolios : list of Portfolio models
+        portfolios to optimize (default: every non-optimal portfolio)
+    start_date : datetime.date
+        start of time-span for historical return analysis
+    rf : float
+        risk-free interest rate
+    processes : integer
+        worker processes for solving (default: one per core)
+    estimator : string
+        covariance estimator ('sample', 'ledoit_wolf', 'ewma', 'pca')
+    constraints : PortfolioConstraints
+        optional limits applied to every portfolio (max-Sharpe only)
+    allocation : string
+        'max_sharpe' or 'hrp' (hierarchical risk parity)
+
+    Methods
+    =======
+    build_panel:
+        load price panels, annualized mean returns and covariances per portfolio
+    optimize:
+        solve weights for each portfolio in parallel, reporting
+        progress per chunk - pending chunks are cancelled if progress raises
+    shares:
+        integer share counts for a portfolio's optimal weights
+    write_optimal_portfolios:
+        stage all solved optimal portfolios and commit once
+    """
+
+    def __init__(self, portfolios=None, start_date=None, rf=0.0, processes=None, estimator='sample',
+                 constraints=None, allocation='max_sharpe'):
+        # initialize input parameters
+        if portfolios is None:
+            portfolios = [port for port in Portfolio.query.order_by(Portfolio.name).all()
+                          if not port.name.endswith('_opt')]
+        self.portfolios = [port for port in portfolios if port.num_holdings > 2]
+        self.start_date = start_date or dt.date.today() - dt.timedelta(weeks=26)
+        self.rf = rf
+        self.processes = processes
+        self.estimator = estimator
+        self.constraints = constraints
+        self.allocation = allocation
+        self.weights = {}
+        self.failed = {}  # portfolio name -> reason no weights were found
+
+    def build_panel(self):
+        # one price fetch over the union of all symbols - moments per portfolio
+        self.book = holdings_book([port.id for port in self.portfolios])
+        self.symbols = {port.name: self.book.symbols_of(port.id) for port in self.portfolios}
+        universe = sorted(set(sym for syms in self.symbols.values() for sym in syms))
+        fetch = universe_fetch(universe, self.start_date)
+        self.moments = {}  # portfolio name -> (annualized mean, covariance) over its own history
+        self.last_prices = {}
+        for port in self.portfolios:
+            symbols = self.symbols[port.name]
+            rets = return_panel(symbols, self.start_date, fetch=fetch)
+            cov = covariance_panel(symbols, self.start_date, estimator=self.estimator, fetch=fetch)
+            self.moments[port.name] = (rets.mean().values * 252, cov.scaled(252))
+            self.last_prices.update(price_panel(symbols, self.start_date, fetch=fetch).iloc[-1].to_dict())
+
+    def optimize(self, progress=None):
+        # solve all portfolios in parallel from sliced mean/covariance
+        progress = progress or no_progress
+        self.build_panel()
+        tasks = []
+        ports = []  # portfolios with a task, in task order
+        solver = solve_max_sharpe if self.constraints is None else solve_constrained
+        if self.allocation == 'hrp':
+            solver = solve_hrp
+        for port in self.portfolios:
+            mu, cov = self.moments[port.name]
+            if self.constraints is None or self.allocation == 'hrp':
+                tasks.append((mu, cov, self.rf))
+            else:
+                try:
+                    problem = self.constraints.problem(self.symbols[port.name])
+                except ValueError as e:
+                    # limits infeasible for this portfolio's symbols - the others are still solved
+                    self.failed[port.name] = str(e)
+                    continue
+                # turnover measured against (and warm-started from) current weights
+                current = self.book.weights(port.id, self.symbols[port.name])
+                current = current / current.sum() if current.sum() > 0 else None
+                tasks.append((mu, cov, self.rf, problem, self.constraints.turnover,
+                              current))
+            ports.append(port)
+        workers = self.processes or os.cpu_count() or 1
+        chunk = max(1, len(tasks) // (4 * workers))
+        results = [None] * len(tasks)
+        pool = ProcessPoolExecutor(max_workers=workers)
+        futures = {}
+        try:
+            futures = dict((pool.submit(solve_chunk, tasks[i:i + chunk], solver), i) for i in range(0, len(tasks), chunk))
+            solved = 0
+            for future in as_completed(futures):
+                i = futures[future]
+                results[i:i + chunk] = future.result()
+                solved += len(tasks[i:i + chunk])
+                progress(solved, len(tasks), 'Optimized portfolios')
+        except BaseException:
+            # cancelled or failed - drop queued chunks so workers go idle
+            for future in futures:
+                future.cancel()
+            raise
+        finally:
+            pool.shutdown(wait=False)
+        for port, weights in zip(ports, results):
+            if isinstance(weights, OptimizationError):
+                self.failed[port.name] = str(weights)
+            else:
+                self.weights[port.name] = dict(zip(self.symbols[port.name], weights))
+        return self.weights
+
+    def shares(self, port):
+        # integer share counts for one portfolio's optimal weights
+        symbols = self.symbols[port.name]
+        prices = np.array([round(self.last_prices[sym], 2) for sym in symbols])
+        weights = np.array([self.weights[port.name][sym] for sym in symbols])
+        max_weights = None
+        if self.constraints is not None and self.allocation != 'hrp':
+            max_weights = self.constraints.problem(symbols)[1]
+        return dict(zip(symbols, round_shares(weights, prices, port.market_value - port.cash, max_weights)))
+
+    def write_optimal_portfolios(self):
+        # stage every optimal portfolio at integer shares and commit once
+        solved = [port for port in self.portfolios if port.name in self.weights]
+        staged = 0
+        try:
+            for port in solved:
+                try:
+                    shares = self.shares(port)
+                except ValueError as e:
+                    # no usable last price to size holdings - skipped like a failed solve
+                    self.failed[port.name] = str(e)
+                    del self.weights[port.name]
+                    continue
+                port.stage_optimal_portfolio(self.weights[port.name], self.last_prices, shares)
+                staged += 1
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return staged
+
+
+def optimize_all(start_date=None, rf=0.0, processes=None, estimator='sample', constraints=None,
+                 allocation='max_sharpe'):
+    # optimize every portfolio and write the _opt portfolios in one transaction
+    batch = BatchOptimizer(start_date=start_date, rf=rf, processes=processes, estimator=estimator,
+                           constraints=constraints, allocation=allocation)
+    if batch.portfolios:
+        batch.optimize()
+        batch.write_optimal_portfolios()
+    return batch
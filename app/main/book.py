@@ -0,0 +1,157 @@
+from flask import current_app, has_app_context
+from .. import db
+from ..cache import LRUCache, invalidate_on_write
+from ..models import Portfolio, Holding
+
+import numpy as np
+
+# snapshots of every holding ('book') or of a few portfolios (('book', ids)) -
+# all dropped whenever this process writes to holdings or portfolios, and after
+# BOOK_CACHE_TTL for other processes' writes, so a write costs single-portfolio
+# pages one scoped reload instead of a reload of every holding
+book_cache = LRUCache(maxsize=64)
+generation = 0  # bumped on every invalidation - stale loads are not cached
+
+
+def invalidate_book():
+    global generation
+    generation += 1
+    book_cache.clear()
+
+
+invalidate_on_write((Holding.__tablename__, Portfolio.__tablename__), invalidate_book)
+
+
+# class definition for holdings book
+# to hold columnar holding data shared by analytics
+class HoldingsBook(object):
+    """
+    Holdings Book Object
+
+    -Read-only columnar snapshot of every holding, or of the holdings
+      of a few portfolios
+    -One NumPy array per column (portfolio id, symbol id, shares, purchase
+      price and date, last price, market value), ordered by portfolio then holding id -
+      each portfolio's holdings are one contiguous slice
+    -Loaded with one query per table - weights, percentages and totals
+      are vectorized operations instead of walks over Holding objects
+
+    Parameters
+    =========
+    holdings : list of tuples
+        (id, portfolio_id, symbol, shares, purch_price, purch_date, last_price, market_value)
+        ordered by portfolio id then holding id
+    portfolios : list of tuples
+        (id, name, cash, market_value)
+    portfolio_ids : tuple of integers
+        portfolios the book was loaded for (None for every portfolio)
+
+    Methods
+    =======
+    load:
+        build book from database, optionally for a few portfolios only
+    rows:
+        slice of a portfolio's holdings in every column
+    symbols_of:
+        unique symbols of a portfolio in holding order
+    exposure:
+        market value per symbol of a portfolio
+    weights:
+        exposure as fraction of portfolio market value (cash is the remainder)
+    weight_matrix:
+        weights of many portfolios over one symbol universe
+    percents:
+        portfolio percent of each holding of a portfolio
+    """
+
+    def __init__(self, holdings, portfolios, portfolio_ids=None):
+        self.portfolio_ids = portfolio_ids
+        columns = list(zip(*holdings)) if holdings else [()] * 8
+        ids, port_ids, symbols, shares, purch_price, purch_date, last_price, market_value = columns
+        self.symbols = sorted(set(symbols))  # symbol id -> symbol
+        self.symbol_index = dict((sym, i) for i, sym in enumerate(self.symbols))
+        self.holding_id = np.array(ids, dtype=np.int64)
+        self.portfolio_id = np.array(port_ids, dtype=np.int64)
+        self.symbol_id = np.array([self.symbol_index[sym] for sym in symbols], dtype=np.int32)
+        self.shares = np.array(shares, dtype=float)
+        self.purch_price = np.array([price or 0.0 for price in purch_price], dtype=float)
+        self.purch_date = np.array(purch_date, dtype='datetime64[D]')
+        self.last_price = np.array([price or 0.0 for price in last_price], dtype=float)
+        self.market_value = np.array([value or 0.0 for value in market_value], dtype=float)
+
+        # portfolio aggregates and contiguous holding slices
+        self.names = dict((port_id, name) for port_id, name, _, _ in portfolios)
+        self.cash = dict((port_id, cash or 0.0) for port_id, _, cash, _ in portfolios)
+        self.values = dict((port_id, value or 0.0) for port_id, _, _, value in portfolios)
+        starts = np.r_[0, np.flatnonzero(np.diff(self.portfolio_id)) + 1]
+        stops = np.r_[starts[1:], len(self.portfolio_id)]
+        self.slices = dict((int(self.portfolio_id[a]), slice(int(a), int(b))) for a, b in zip(starts, stops) if b > a)
+
+    @classmethod
+    def load(cls, portfolio_ids=None):
+        holdings = db.session.query(Holding.id, Holding.portfolio_id, Holding.symbol, Holding.shares,
+                                    Holding.purch_price, Holding.purch_date, Holding.last_price, Holding.market_value)
+        portfolios = db.session.query(Portfolio.id, Portfolio.name, Portfolio.cash, Portfolio.market_value)
+        if portfolio_ids is not None:
+            portfolio_ids = tuple(sorted(set(portfolio_ids)))
+            holdings = holdings.filter(Holding.portfolio_id.in_(portfolio_ids))
+            portfolios = portfolios.filter(Portfolio.id.in_(portfolio_ids))
+        return cls(holdings.order_by(Holding.portfolio_id, Holding.id).all(), portfolios.all(), portfolio_ids)
+
+    def rows(self, portfolio_id):
+        return self.slices.get(portfolio_id, slice(0, 0))
+
+    def symbols_of(self, portfolio_id):
+        # unique symbols in holding order
+        ids = self.symbol_id[self.rows(portfolio_id)]
+        _, first = np.unique(ids, return_index=True)
+        return [self.symbols[i] for i in ids[np.sort(first)]]
+
+    def exposure(self, portfolio_id, symbols):
+        # market value per symbol - repeated holdings of a symbol are summed
+        rows = self.rows(portfolio_id)
+        total = np.bincount(self.symbol_id[rows], self.market_value[rows], minlength=len(self.symbols))
+        return np.array([total[self.symbol_index[sym]] if sym in self.symbol_index else 0.0 for sym in symbols])
+
+    def weights(self, portfolio_id, symbols):
+        return self.exposure(portfolio_id, symbols) / self.values[portfolio_id]
+
+    def weight_matrix(self, portfolio_ids, symbols):
+        # (portfolios x symbols) weights in one pass over the book
+        index = np.full(len(self.symbols), -1, dtype=np.int64)
+        for j, sym in enumerate(symbols):
+            if sym in self.symbol_index:
+                index[self.symbol_index[sym]] = j
+        weights = np.zeros((len(portfolio_ids), len(symbols)))
+        for row, port_id in enumerate(portfolio_ids):
+            rows = self.rows(port_id)
+            cols = index[self.symbol_id[rows]]
+            keep = cols >= 0
+            np.add.at(weights[row], cols[keep], self.market_value[rows][keep] / self.values[port_id])
+        return weights
+
+    def percents(self, portfolio_id):
+        # one entry per holding - zeros while the portfolio has no value
+        rows = self.rows(portfolio_id)
+        value = self.values.get(portfolio_id)
+        return self.market_value[rows] / value if value else np.zeros(rows.stop - rows.start)
+
+
+def holdings_book(portfolio_ids=None):
+    # shared book snapshot - a cached full book answers every question, otherwise
+    # only the requested portfolios are loaded; loads are only cached if no write
+    # happened meanwhile
+    if has_app_context():
+        book_cache.ttl = current_app.config.get('BOOK_CACHE_TTL')
+    book = book_cache.get('book')
+    if book is not None or portfolio_ids is None:
+        key = 'book'
+    else:
+        key = ('book', tuple(sorted(set(portfolio_ids))))
+        book = book_cache.get(key)
+    if book is None:
+        started = generation
+        book = HoldingsBook.load(None if key == 'book' else key[1])
+        if started == generation:
+            book_cache.set(key, book)
+    return book
@@ -0,0 +1,191 @@
+from .estimators import as_estimate
+
+import numpy as np
+import scipy.optimize as sco
+import scipy.sparse as sps
+
+
+class OptimizationError(Exception):
+    # raised when the optimizer finds no usable weights for a portfolio
+    pass
+
+
+def checked_weights(result):
+    # weights of a scipy result - failed or non-finite solves raise OptimizationError
+    if not result.success or not np.isfinite(result.x).all():
+        raise OptimizationError('Optimizer failed: {}'.format(result.message))
+    return result.x
+
+
+class PortfolioConstraints(object):
+    """
+    Portfolio Constraints Object
+
+    -Compliance rules applied inside the optimizer instead of by hand
+    -Per-holding minimum / maximum weights
+    -Group caps on the summed weight of a set of symbols
+    -Turnover penalty against current holding weights
+
+    Parameters
+    =========
+    min_weight : float or dict
+        minimum weight of every holding, or per-symbol minimums
+    max_weight : float or dict
+        maximum weight of every holding, or per-symbol maximums
+    groups : dict
+        group name -> (list of symbols, maximum summed weight)
+    turnover : float
+        Sharpe ratio given up per unit of turnover (sum of |w - current|)
+
+    Methods
+    =======
+    problem:
+        bounds, sparse group membership matrix and caps for a symbol list
+    """
+
+    def __init__(self, min_weight=0.0, max_weight=1.0, groups=None, turnover=0.0):
+        self.min_weight = min_weight
+        self.max_weight = max_weight
+        self.groups = groups or {}
+        self.turnover = turnover
+
+    def limit(self, value, symbols, default):
+        # per-symbol array - symbols missing from a dict are unconstrained
+        if isinstance(value, dict):
+            return np.array([float(value.get(sym, default)) for sym in symbols])
+        return np.full(len(symbols), float(value))
+
+    def problem(self, symbols):
+        lo = self.limit(self.min_weight, symbols, 0.0)
+        hi = self.limit(self.max_weight, symbols, 1.0)
+        if lo.sum() > 1 + 1e-9 or hi.sum() < 1 - 1e-9 or (lo > hi).any():
+            raise ValueError('Weight limits cannot add up to a fully invested portfolio')
+
+        # one sparse row per group that holds any of the symbols
+        index = {sym: i for i, sym in enumerate(symbols)}
+        rows, cols, caps = [], [], []
+        for name in sorted(self.groups):
+            members, cap = self.groups[name]
+            idx = [index[sym] for sym in members if sym in index]
+            if idx:
+                rows += [len(caps)] * len(idx)
+                cols += idx
+                caps.append(float(cap))
+        groups = sps.csr_matrix((np.ones(len(cols)), (rows, cols)), shape=(len(caps), len(symbols)))
+        return lo, hi, groups, np.array(caps)
+
+
+def parse_groups(text):
+    # 'AAPL MSFT: 40; XOM CVX: 25' -> {'group 1': (['AAPL', 'MSFT'], 0.4), ...}
+    groups = {}
+    for i, part in enumerate(p for p in (text or '').split(';') if p.strip()):
+        if ':' not in part:
+            raise ValueError('Group caps look like "AAPL MSFT: 40; XOM CVX: 25"')
+        members, cap = part.rsplit(':', 1)
+        members = [sym.upper() for sym in members.replace(',', ' ').split()]
+        try:
+            cap = float(cap) / 100
+        except ValueError:
+            raise ValueError('Group cap "{}" is not a percentage'.format(cap.strip()))
+        if not members or not 0 <= cap <= 1:
+            raise ValueError('Group caps need symbols and a cap between 0 and 100%')
+        groups['group {}'.format(i + 1)] = (members, cap)
+    return groups
+
+
+def start_weights(current, lo, hi):
+    # warm start - current weights pushed inside bounds and rescaled to sum to one
+    x0 = np.clip(current if current is not None and current.sum() > 0 else np.ones(len(lo)) / len(lo), lo, hi)
+    for _ in range(len(x0)):
+        gap = 1 - x0.sum()
+        free = (x0 < hi) if gap > 0 else (x0 > lo)
+        if abs(gap) < 1e-12 or not free.any():
+            break
+        x0[free] = np.clip(x0[free] + gap / free.sum(), lo[free], hi[free])
+    return x0
+
+
+def solve_constrained(args):
+    """ Returns max-Sharpe weights under position limits, group caps and turnover penalty.
+
+    Module-level so it can be shipped to worker processes. The covariance
+    may be a factor model, which is never densified, and group caps are
+    kept as a sparse membership matrix.
+
+    Parameters
+    ==========
+    args : tuple
+        (mu, cov, rf, problem, turnover, current) where problem is the
+        tuple from PortfolioConstraints.problem and current the weights
+        used both for the turnover penalty and as warm start
+    """
+    mu, cov, rf, problem, turnover, current = args
+    cov = as_estimate(cov)
+    lo, hi, groups, caps = problem
+    current = np.zeros(len(mu)) if current is None else np.asarray(current, dtype=float)
+    smooth = 1e-6  # smooths |w - current| at zero so the penalty has a gradient
+
+    def objective(weights):
+        vol = np.sqrt(cov.variance(weights))
+        trade = np.sqrt((weights - current) ** 2 + smooth ** 2)
+        return -(weights.dot(mu) - rf) / vol + turnover * trade.sum()
+
+    def gradient(weights):
+        vol = np.sqrt(cov.variance(weights))
+        excess = weights.dot(mu) - rf
+        grad = -(mu * vol - excess * cov.product(weights) / vol) / vol ** 2
+        diff = weights - current
+        return grad + turnover * diff / np.sqrt(diff ** 2 + smooth ** 2)
+
+    constraints = [{'type': 'eq', 'fun': lambda weights: weights.sum() - 1, 'jac': lambda weights: np.ones(len(mu))}]
+    if groups.shape[0]:
+        # SLSQP wants a dense Jacobian - the sparse product keeps evaluations cheap
+        jac = -groups.toarray()
+        constraints.append({'type': 'ineq', 'fun': lambda weights: caps - groups.dot(weights),
+                            'jac': lambda weights: jac})
+    result = sco.minimize(objective, start_weights(current, lo, hi), jac=gradient, method='SLSQP',
+                          bounds=list(zip(lo, hi)), constraints=constraints)
+    return np.clip(checked_weights(result), lo, hi)
+
+
+def round_shares(weights, prices, capital, max_weights=None):
+    """ Returns integer share counts closest in value to target weights.
+
+    Starts from whole shares below every target, then spends leftover
+    capital one share at a time where it removes the most squared
+    tracking error - never exceeding capital or per-holding maximums,
+    unlike rounding each position independently.
+
+    Parameters
+    ==========
+    weights : array
+        target weights of capital
+    prices : array
+        share prices
+    capital : float
+        value to invest
+    max_weights : array
+        optional per-holding maximum weights
+    """
+    weights, prices = np.asarray(weights, dtype=float), np.asarray(prices, dtype=float)
+    # a missing or zero price would never use up capital - the search below would not end
+    if not (np.isfinite(prices) & (prices > 0)).all():
+        raise ValueError('Share prices must be positive to round weights to shares')
+    target = np.clip(weights, 0, None) * capital / prices
+    shares = np.floor(target + 1e-9)
+    cap = np.floor(np.asarray(max_weights) * capital / prices + 1e-9) if max_weights is not None else None
+    if cap is not None:
+        shares = np.minimum(shares, cap)
+    cash = capital - shares.dot(prices)
+    while True:
+        # squared value error removed by buying one more share
+        gain = prices * (2 * (target - shares) * prices - prices)
+        gain[prices > cash + 1e-9] = -np.inf
+        if cap is not None:
+            gain[shares + 1 > cap] = -np.inf
+        i = int(np.argmax(gain))
+        if gain[i] <= 0:
+            break
+        shares[i] += 1
+        cash -= prices[i]
+    return shares.astype(int)
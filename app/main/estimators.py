@@ -0,0 +1,191 @@
+import numpy as np
+
+
+class CovarianceEstimate(object):
+    """
+    Covariance Estimate Object
+
+    -Dense covariance matrix with the operations analytics need
+    -Shared interface with FactorCovariance so optimizer and
+      simulators never need to know which form they were given
+
+    Parameters
+    =========
+    cov : array (symbols x symbols)
+        covariance matrix
+
+    Methods
+    =======
+    variance:
+        portfolio variance for one or many weight vectors
+    product:
+        covariance times weights (gradient / marginal risk term)
+    sample:
+        draw correlated normal returns
+    correlate:
+        map independent standard normals (n x dims) to correlated draws
+        in the dtype of the normals
+    subset:
+        estimate restricted to a subset of symbols
+    scaled:
+        estimate multiplied by a constant (e.g. annualization)
+    dense:
+        full covariance matrix
+    """
+
+    def __init__(self, cov):
+        self.cov = np.asarray(cov, dtype=float)
+        self.dims = len(self.cov)  # independent normals needed per draw
+
+    def variance(self, weights):
+        weights = np.asarray(weights)
+        return (weights.dot(self.cov) * weights).sum(axis=-1)
+
+    def product(self, weights):
+        return np.asarray(weights).dot(self.cov)
+
+    def sample(self, n, rng):
+        return self.correlate(rng.standard_normal((n, self.dims)))
+
+    def correlate(self, z):
+        return z.dot(cov_root(self.cov).T.astype(z.dtype))
+
+    def subset(self, idx):
+        return CovarianceEstimate(self.cov[np.ix_(idx, idx)])
+
+    def scaled(self, factor):
+        return CovarianceEstimate(self.cov * factor)
+
+    def dense(self):
+        return self.cov
+
+
+class FactorCovariance(object):
+    """
+    Factor Covariance Object
+
+    -Low-rank covariance stored as loadings plus diagonal specific risk
+    -Cov = B B' + diag(d) is never formed - variance, products and
+      sampling cost O(k*f) instead of O(k^2)
+
+    Parameters
+    =========
+    loadings : array (symbols x factors)
+        factor loadings B
+    specific : array (symbols)
+        specific (idiosyncratic) variances d
+
+    Methods
+    =======
+    same interface as CovarianceEstimate
+    """
+
+    def __init__(self, loadings, specific):
+        self.loadings = np.asarray(loadings, dtype=float)
+        self.specific = np.asarray(specific, dtype=float)
+        self.dims = self.loadings.shape[1] + len(self.specific)  # factor then specific normals
+
+    def variance(self, weights):
+        weights = np.asarray(weights)
+        return (weights.dot(self.loadings) ** 2).sum(axis=-1) + (weights ** 2 * self.specific).sum(axis=-1)
+
+    def product(self, weights):
+        weights = np.asarray(weights)
+        return weights.dot(self.loadings).dot(self.loadings.T) + weights * self.specific
+
+    def sample(self, n, rng):
+        return self.correlate(rng.standard_normal((n, self.dims)))
+
+    def correlate(self, z):
+        f = self.loadings.shape[1]
+        return z[:, :f].dot(self.loadings.T.astype(z.dtype)) + z[:, f:] * np.sqrt(self.specific).astype(z.dtype)
+
+    def subset(self, idx):
+        return FactorCovariance(self.loadings[idx], self.specific[idx])
+
+    def scaled(self, factor):
+        return FactorCovariance(self.loadings * np.sqrt(factor), self.specific * factor)
+
+    def dense(self):
+        return self.loadings.dot(self.loadings.T) + np.diag(self.specific)
+
+
+def cov_root(cov):
+    # matrix root for correlated draws - falls back to eigen-decomposition
+    # when the covariance is not positive definite
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        vals, vecs = np.linalg.eigh(cov)
+        return vecs * np.sqrt(np.clip(vals, 0, None))
+
+
+def sample_covariance(rets):
+    # plain sample covariance
+    return CovarianceEstimate(np.cov(rets, rowvar=False).reshape(rets.shape[1], rets.shape[1]))
+
+
+def ledoit_wolf(rets):
+    # Ledoit-Wolf shrinkage towards scaled identity
+    x = rets - rets.mean(axis=0)
+    n, p = x.shape
+    s = x.T.dot(x) / n
+    mu = np.trace(s) / p
+    delta = ((s - mu * np.eye(p)) ** 2).sum() / p
+    beta = ((x ** 2).sum(axis=1) ** 2).sum() - n * (s ** 2).sum()
+    beta = min(beta / (n ** 2 * p), delta)
+    shrinkage = beta / delta if delta else 0.0
+    return CovarianceEstimate((shrinkage * mu * np.eye(p) + (1 - shrinkage) * s) * n / (n - 1))
+
+
+def ewma(rets, decay=0.94):
+    # exponentially weighted covariance - RiskMetrics decay by default
+    weights = decay ** np.arange(len(rets))[::-1]
+    weights /= weights.sum()
+    x = rets - weights.dot(rets)
+    return CovarianceEstimate((x * weights[:, None]).T.dot(x))
+
+
+def pca_factor(rets, factors=5):
+    # statistical factor model from leading principal components
+    # thin SVD of the return panel - the k x k matrix is never built
+    x = rets - rets.mean(axis=0)
+    n = len(x)
+    factors = min(factors, min(x.shape) - 1)
+    u, s, vt = np.linalg.svd(x, full_matrices=False)
+    loadings = vt[:factors].T * s[:factors] / np.sqrt(n - 1)
+    total = (x ** 2).sum(axis=0) / (n - 1)
+    specific = np.clip(total - (loadings ** 2).sum(axis=1), 1e-12, None)
+    return FactorCovariance(loadings, specific)
+
+
+ESTIMATORS = {'sample': sample_covariance,
+              'ledoit_wolf': ledoit_wolf,
+              'ewma': ewma,
+              'pca': pca_factor}
+
+
+def estimate_covariance(rets, method='sample', **kwargs):
+    # covariance estimate of daily returns using named estimator
+    if method not in ESTIMATORS:
+        raise ValueError('Unknown covariance estimator: {}'.format(method))
+    return ESTIMATORS[method](np.asarray(rets, dtype=float), **kwargs)
+
+
+def as_estimate(cov):
+    # wrap plain matrices so callers can pass either form
+    return cov if hasattr(cov, 'variance') else CovarianceEstimate(cov)
+
+
+def estimate_arrays(estimate):
+    # arrays that fully describe an estimate - for the shared panel cache
+    if isinstance(estimate, FactorCovariance):
+        return {'loadings': estimate.loadings, 'specific': estimate.specific}
+    return {'cov': estimate.dense()}
+
+
+def from_arrays(arrays):
+    # inverse of estimate_arrays - memory-mapped arrays are used without copying
+    if 'loadings' in arrays:
+        return FactorCovariance(arrays['loadings'], arrays['specific'])
+    return CovarianceEstimate(arrays['cov'])
@@ -1,9 +1,22 @@
 import datetime as dt
-from pandas_datareader import data as web
+from .. import prices, symbols
+from .constraints import parse_groups
 from flask_wtf import Form
 from wtforms import StringField, FloatField, SubmitField, DateField, SelectField, IntegerField
 from wtforms.validators import DataRequired, NumberRange, ValidationError, Optional
 
+# covariance estimators offered for optimization, simulation and risk
+ESTIMATOR_CHOICES = [('sample', 'Sample covariance'), ('ledoit_wolf', 'Ledoit-Wolf shrinkage'),
+                     ('ewma', 'Exponentially weighted (EWMA)'), ('pca', 'PCA factor model')]
+
+# sampling schemes offered for weight and path simulation
+SAMPLING_CHOICES = [('pseudo', 'Pseudo-random'), ('antithetic', 'Antithetic variates'),
+                    ('moment', 'Moment matching'), ('sobol', 'Sobol (quasi-random)'),
+                    ('halton', 'Halton (quasi-random)')]
+
+# allocation engines offered for optimization
+ALLOCATION_CHOICES = [('max_sharpe', 'Maximum Sharpe ratio'), ('hrp', 'Hierarchical risk parity')]
+
 
 # define PortfolioForm to add new portfolios
 class PortfolioForm(Form):
@@ -35,11 +48,14 @@ class HoldingForm(Form):
     purch_date = DateField('Date purchased: (YYYY-DD-MM)', default=dt.date.today())
     submit = SubmitField('Add Holding')
 
-    # ensure symbol entered is one that yahoo finance has data for
+    # ensure symbol entered is listed - checked against the local symbol
+    # universe when one is installed, otherwise by fetching its price
     def validate_symbol(form, field):
-        try:
-            test = web.DataReader(str(field.data).capitalize(), 'yahoo')
-        except:
+        symbol = str(field.data).strip().upper()
+        if symbols.enabled:
+            if symbol not in symbols:
+                raise ValidationError('No symbol under that name found')
+        elif not prices.validate(symbol):
             raise ValidationError('No symbol under that name found')
 
 
@@ -54,11 +70,14 @@ class HoldingEditForm(Form):
     new_purch_date = DateField('Enter new date purchased', validators=[Optional()])
     submit = SubmitField('Edit Holding')
 
-    # ensure symbol entered is one that yahoo finance has data for
+    # ensure symbol entered is listed - checked against the local symbol
+    # universe when one is installed, otherwise by fetching its price
     def validate_symbol(form, field):
-        try:
-            test = web.DataReader(str(field.data).capitalize(), 'yahoo')
-        except:
+        symbol = str(field.data).strip().upper()
+        if symbols.enabled:
+            if symbol not in symbols:
+                raise ValidationError('No symbol under that name found')
+        elif not prices.validate(symbol):
             raise ValidationError('No symbol under that name found')
 
 
@@ -68,8 +87,36 @@ class OptimizationForm(Form):
                            validators=[DataRequired()], default=dt.date.today() - dt.timedelta(weeks=26))
     risk_free = FloatField('Risk-free interest rate: ( % )', default=1.0,
                            validators=[NumberRange(min=0, max=None, message='No negative interest rates')])
+    estimator = SelectField('Covariance estimator:', choices=ESTIMATOR_CHOICES, default='sample')
+    sampling = SelectField('Weight sampling:', choices=SAMPLING_CHOICES, default='sobol')
+    allocation = SelectField('Allocation:', choices=ALLOCATION_CHOICES, default='max_sharpe')
+    min_weight = FloatField('Minimum weight per holding: ( % )', default=0.0,
+                            validators=[NumberRange(min=0, max=100, message='Not a valid weight')])
+    max_weight = FloatField('Maximum weight per holding: ( % )', default=100.0,
+                            validators=[NumberRange(min=0, max=100, message='Not a valid weight')])
+    group_caps = StringField('Group caps: ( e.g. AAPL MSFT: 40; XOM CVX: 25 )', validators=[Optional()])
+    turnover = FloatField('Turnover penalty: ( Sharpe ratio per 100% turnover )', default=0.0,
+                          validators=[NumberRange(min=0, max=None, message='No negative penalties')])
     submit = SubmitField('Generate Optimal Portfolio')
 
+    # ensure group caps can be parsed into symbol lists and percentages
+    def validate_group_caps(form, field):
+        try:
+            parse_groups(field.data)
+        except ValueError as e:
+            raise ValidationError(str(e))
+
+    # ensure weight limits leave room for a fully invested portfolio
+    def validate_max_weight(form, field):
+        if form.min_weight.data is not None and field.data is not None and field.data < form.min_weight.data:
+            raise ValidationError('Maximum weight is below minimum weight')
+
+    # risk parity weights come from clustering alone - limits are not applied
+    def validate_allocation(form, field):
+        if field.data == 'hrp' and (form.min_weight.data or (form.max_weight.data or 100) < 100 or
+                                    (form.group_caps.data or '').strip() or form.turnover.data):
+            raise ValidationError('Weight limits, group caps and turnover apply to maximum Sharpe only')
+
 
 class SimulationForm(Form):
     # form to enter time-span of returns used for portfolio simulation
@@ -81,9 +128,39 @@ class SimulationForm(Form):
                          validators=[DataRequired()], default=2500)
     risk_free = FloatField('Risk-free interest rate: ( % )', default=1.0,
                            validators=[NumberRange(min=0, max=None, message='No negative interest rates')])
+    estimator = SelectField('Covariance estimator:', choices=ESTIMATOR_CHOICES, default='sample')
+    sampling = SelectField('Path sampling:', choices=SAMPLING_CHOICES, default='sobol')
     submit = SubmitField('Generate Portfolio Simulations')
 
 
+class RiskForm(Form):
+    # form to enter return window and VaR parameters for portfolio risk
+    start_date = DateField('Start date for historical returns: (YYYY-DD-MM) - Default: 6 months',
+                           validators=[DataRequired()], default=dt.date.today() - dt.timedelta(weeks=26))
+    confidence = FloatField('Confidence level: ( % )', default=95.0,
+                            validators=[NumberRange(min=50, max=99.9, message='Confidence must be 50%% - 99.9%%')])
+    horizon = IntegerField('Horizon (trading days):', default=1,
+                           validators=[NumberRange(min=1, max=252, message='Horizon must be 1 - 252 days')])
+    estimator = SelectField('Covariance estimator:', choices=ESTIMATOR_CHOICES, default='sample')
+    sampling = SelectField('Monte Carlo sampling:', choices=SAMPLING_CHOICES, default='sobol')
+    submit = SubmitField('Calculate Risk')
+
+
+class BacktestForm(Form):
+    # form to enter walk-forward backtest parameters
+    start_date = DateField('Start date for historical returns: (YYYY-DD-MM) - Default: 2 years',
+                           validators=[DataRequired()], default=dt.date.today() - dt.timedelta(weeks=104))
+    window = IntegerField('Estimation window (trading days):', default=126,
+                          validators=[NumberRange(min=20, max=None, message='Window must be at least 20 days')])
+    rebalance = IntegerField('Days between rebalances:', default=21,
+                             validators=[NumberRange(min=1, max=None, message='Must rebalance at least every day')])
+    cost = FloatField('Transaction cost: ( basis points of turnover )', default=10.0,
+                      validators=[NumberRange(min=0, max=None, message='No negative costs')])
+    risk_free = FloatField('Risk-free interest rate: ( % )', default=1.0,
+                           validators=[NumberRange(min=0, max=None, message='No negative interest rates')])
+    submit = SubmitField('Run Backtest')
+
+
 # define TickerForm class for adding new HDF5 ticker data
 class TickerForm(Form):
     symbol = StringField('Stock symbol:', validators=[DataRequired()])
@@ -0,0 +1,63 @@
+from ..cache import LRUCache
+from .batch import solve_max_sharpe
+from .constraints import solve_constrained
+from .hrp import hrp_weights
+
+import numpy as np
+import datetime as dt
+
+# frontier results per (symbols, window, estimator, sampling, constraints)
+# - everything that does not depend on the risk-free rate
+frontier_cache = LRUCache(maxsize=32, ttl=6 * 3600)
+
+
+def frontier_key(symbols, start, end, estimator, sampling, samples, bounds):
+    # cache key - risk-free rate deliberately left out
+    return (tuple(symbols), str(start), str(end or dt.date.today()), estimator, sampling, samples, tuple(bounds))
+
+
+def tangency_portfolio(frontier, rf, constraints=None, current=None):
+    """ Returns max-Sharpe weights, return and volatility for risk-free rate rf.
+
+    Solved from the cached annualized mean / covariance, warm-started
+    from the last tangency found for this frontier, which is kept as
+    solver state for the next rate. With constraints the solve is
+    warm-started from the current holding weights instead.
+
+    Parameters
+    ==========
+    frontier : dict
+        cached frontier entry with 'mu', 'cov' and 'weights'
+    rf : float
+        risk-free interest rate
+    constraints : PortfolioConstraints
+        optional weight limits, group caps and turnover penalty
+    current : array
+        current holding weights, in frontier symbol order
+    """
+    if constraints is not None:
+        problem = constraints.problem(frontier['symbols'])
+        weights = solve_constrained((frontier['mu'], frontier['cov'], rf, problem, constraints.turnover, current))
+    else:
+        weights = solve_max_sharpe((frontier['mu'], frontier['cov'], rf, frontier.get('weights')))
+        frontier['weights'] = weights
+    ret = float(weights.dot(frontier['mu']))
+    vol = float(np.sqrt(frontier['cov'].variance(weights)))
+    return weights, ret, vol
+
+
+def hrp_portfolio(frontier):
+    """ Returns hierarchical risk parity weights, return and volatility.
+
+    Weights come from the cached covariance alone - mean returns only
+    place the portfolio on the frontier plot.
+
+    Parameters
+    ==========
+    frontier : dict
+        cached frontier entry with 'mu' and 'cov'
+    """
+    weights = hrp_weights(frontier['cov'])
+    ret = float(weights.dot(frontier['mu']))
+    vol = float(np.sqrt(frontier['cov'].variance(weights)))
+    return weights, ret, vol
@@ -1,8 +1,19 @@
-from .. import db
+from .. import db, prices, memory
+from ..jobs import no_progress
 from ..models import Portfolio, Holding
+from .estimators import estimate_covariance
+from .panel import portfolio_symbols, float_dtype
+from .book import holdings_book
+from .sampling import sample_weights, gbm_paths
+from .frontier import frontier_cache, frontier_key, tangency_portfolio, hrp_portfolio
+from .constraints import round_shares
+from .risk import exposure_weights
 
 import numpy as np
-import matplotlib.pyplot as plt
+import pandas as pd
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.ticker import FuncFormatter
 import datetime as dt
 from dx import *
 import os
@@ -10,6 +21,20 @@ import os
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 
+# dx mean-variance portfolio that loads its price panel
+# through the shared price client instead of per-symbol DataReader calls
+class SourcedPortfolio(mean_variance_portfolio):
+    def load_data(self):
+        self.data = prices.get_panel(self.symbols, self.start_date, self.final_date, source=self.source)
+
+    def use_estimator(self, method):
+        # replace dx's sample covariance with a named estimator
+        rets = np.log(self.data / self.data.shift(1)).dropna()
+        cov = estimate_covariance(rets.values, method).dense()
+        self.raw_covariance = pd.DataFrame(cov, index=self.data.columns, columns=self.data.columns)
+        self.apply_weights()
+
+
 # class definition for portfolio plot
 # to hold methods and attributes needed while plotting
 class PortfolioPlot(object):
@@ -34,27 +59,35 @@ class PortfolioPlot(object):
         self.portfolio = portfolio  # portfolio to plot
 
         # plot portfolio into static folder
-        self.plot_portfolio()
+        with memory.stage('plot.portfolio'):
+            self.plot_portfolio()
 
     def plot_portfolio(self):
         # get sorted list of holdings and portfolio percentages
-        labels = [holding.symbol for holding in self.portfolio.holdings]
-        values = [holding.portfolio_percent for holding in self.portfolio.holdings]
+        book = holdings_book([self.portfolio.id])
+        rows = book.rows(self.portfolio.id)
+        labels = [book.symbols[i] for i in book.symbol_id[rows]]
+        values = book.percents(self.portfolio.id)
         pairs = [(values[i], labels[i]) for i in range(len(labels))]
         pairs = sorted(pairs, key=lambda val: val[0], reverse=True)
         values = [pair[0] for pair in pairs]
-        values.append(self.portfolio.cash / self.portfolio.market_value)
+        # empty portfolios have no value to split - drawn as all cash
+        value = self.portfolio.market_value
+        values.append(self.portfolio.cash / value if value else 1.0)
 
         # prep parameters for plotting and
         # plot portfolio pie chart into static folder
-        plt.title('Portfolio: ' + self.portfolio.name, fontsize=30, y=1.05)
-        patches, labels = plt.pie(values, startangle=90, pctdistance=0.65, counterclock=False, labeldistance=1.03)
-        plt.axis('equal')
+        # own figure, not pyplot state - requests plot from several threads
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot(111)
+        ax.set_title('Portfolio: ' + self.portfolio.name, fontsize=30, y=1.05)
+        patches, labels = ax.pie(values, startangle=90, pctdistance=0.65, counterclock=False, labeldistance=1.03)
+        ax.axis('equal')
         labels = [pair[1] for pair in pairs]
         labels.append('Cash')
-        plt.legend(patches, labels, bbox_to_anchor=(0.1, 1), fontsize=18)
-        plt.savefig(basedir[:-4] + 'static/portfolio_plot.png', bbox_inches='tight')
-        plt.close()
+        ax.legend(patches, labels, bbox_to_anchor=(0.1, 1), fontsize=18)
+        fig.savefig(basedir[:-4] + 'static/portfolio_plot.png', bbox_inches='tight')
 
 
 # class definition for optimized portfolio
@@ -65,7 +98,12 @@ class OptimizedPortfolio(object):
 
     -Used for optimizing portfolio in app
     -Simulates various holding weights
-    -Determines optimal portfolio (MPT methodology)
+    -Determines optimal portfolio (MPT methodology), optionally under
+      weight limits, group caps and a turnover penalty
+    -Caches frontier per (symbols, window, estimator, sampling, bounds) -
+      a new risk-free rate only re-derives the tangency portfolio
+    -Risk parity only loads mean and covariance - no weights are
+      simulated and no frontier is traced unless one is already cached
     -Creates new Portfolio in db with optimal holdings
     -Plots optimal portfolio on page with simulated returns
 
@@ -75,133 +113,207 @@ class OptimizedPortfolio(object):
         input portfolio to be optimized
     start_date : datetime.date
         start of time-span for historical return analysis
+    rf : float
+        risk-free interest rate
+    estimator : string
+        covariance estimator ('sample', 'ledoit_wolf', 'ewma', 'pca')
+    sampling : string
+        weight sampling scheme ('pseudo', 'antithetic', 'moment', 'sobol', 'halton')
+    samples : integer
+        number of simulated portfolio weights
+    constraints : PortfolioConstraints
+        optional limits applied to the optimal portfolio (not the plotted frontier)
+    allocation : string
+        'max_sharpe' (tangency portfolio) or 'hrp' (hierarchical risk parity)
+    progress : callable
+        progress(done, total, message) - may raise to cancel between steps
 
     Methods
     =======
     initialize_parameters:
-        initialize input parameters and portfolio market env. data
+        initialize input parameters and look up cached frontier
+    load_moments:
+        load dx portfolio and annualized mean / covariance
+    build_frontier:
+        load dx portfolio, simulate weights and trace efficient frontier
     simulate_optimize:
-        use MCS to simulate portfolio weights and optimize Sharpe's ratio
+        build (or reuse) frontier and find tangency (or risk parity) portfolio
     gen_eff_plot:
-        generate efficient frontier and begin to plot on MPL plot
+        plot simulated weights and efficient frontier on MPL plot
     plot_capm_opt_save:
         plot CAPM line (if works), plot optimal portfolio, save to static folder
     rebalance_opt_port:
-        create optimal portfolio and add optimal holdings to it
+        solve integer share counts and create optimal portfolio with them
     """
 
-    def __init__(self, portfolio, start_date, rf=0.01):
+    bounds = (0.0, 1.0)  # long-only weight bounds of every holding
+
+    def __init__(self, portfolio, start_date, rf=0.01, estimator='sample', sampling='pseudo', samples=500,
+                 constraints=None, allocation='max_sharpe', progress=None):
         # initialize input parameters
-        import numpy as np
         self.portfolio = portfolio  # portfolio to optimize
         self.start_date = start_date  # start date for historical returns
         self.rf = rf  # risk-free interest rate
+        self.estimator = estimator  # covariance estimator
+        self.sampling = sampling  # weight sampling scheme
+        self.samples = samples  # number of simulated weights
+        self.constraints = constraints  # weight limits, group caps, turnover penalty
+        self.allocation = allocation  # 'max_sharpe' or 'hrp' (hierarchical risk parity)
+        self.progress = progress or no_progress  # progress / cancellation callback
 
         # add dx parameters needed for portfolio
-        self.initialize_parameters()
+        with memory.stage('optimize.initialize'):
+            self.initialize_parameters()
 
         # simulate various portfolio weights
         # and optimize portfolio
-        self.simulate_optimize()
-        # generate efficient frontier
-        # and plot all on active plot
-        self.gen_eff_plot()
-        # try and plot CAPM line
-        # may fail with high-return portfolios
-        self.plot_capm_opt_save()
+        with memory.stage('optimize.frontier'):
+            self.simulate_optimize()
+        with memory.stage('optimize.plot'):
+            # plot simulations and efficient frontier
+            self.gen_eff_plot()
+            # try and plot CAPM line
+            # may fail with high-return portfolios
+            self.plot_capm_opt_save()
 
         # rebalance optimal portfolio
-        self.rebalance_opt_port()
+        with memory.stage('optimize.rebalance'):
+            self.rebalance_opt_port()
 
     def initialize_parameters(self):
+        # unique symbols and cached frontier for this window, if any
+        self.symbols = portfolio_symbols(self.portfolio)
+        self.key = frontier_key(self.symbols, self.start_date, dt.date.today(), self.estimator,
+                                self.sampling, self.samples, self.bounds)
+        self.frontier = frontier_cache.get(self.key)
+        # moments alone are cached apart - they do not depend on weight sampling
+        self.moments_key = frontier_key(self.symbols, self.start_date, dt.date.today(), self.estimator,
+                                        None, 0, self.bounds)
+        if self.frontier is None and self.allocation == 'hrp':
+            self.frontier = frontier_cache.get(self.moments_key)
+
+    def load_moments(self):
         # add dx parameters needed for portfolio
         self.ma = market_environment('ma', self.start_date)
-        self.ma.add_list('symbols', [holding.symbol for holding in self.portfolio.holdings])
+        self.ma.add_list('symbols', self.symbols)
         self.ma.add_constant('source', 'yahoo')
         self.ma.add_constant('final_date', dt.datetime.today())
         # create portfolio object
-        self.port = mean_variance_portfolio('optimizing_port', self.ma)
+        self.port = SourcedPortfolio('optimizing_port', self.ma)
+        if self.estimator != 'sample':
+            self.port.use_estimator(self.estimator)
+
+        # annualized moments kept as solver state - simulations and frontier left empty
+        log_rets = np.log(self.port.data / self.port.data.shift(1)).dropna()
+        return {'symbols': list(self.port.data.columns),
+                'rets': np.zeros(0), 'vols': np.zeros(0),
+                'evols': np.zeros(0), 'erets': np.zeros(0),
+                'mu': log_rets.mean().values * 252,
+                'cov': estimate_covariance(log_rets.values, self.estimator).scaled(252),
+                'last_prices': self.port.data.ffill().iloc[-1].to_dict(),
+                'weights': None}
+
+    def build_frontier(self):
+        frontier = self.load_moments()
 
-    def simulate_optimize(self):
         # Monte Carlo simulation for portfolio compositions
-        self.rets = []
-        self.vols = []
-        for w in range(500):
-            weights = np.random.random(self.portfolio.num_holdings)
-            weights /= sum(weights)
+        # steps: one per sampled weight plus one for the frontier
+        rets = []
+        vols = []
+        total = self.samples + 1
+        for i, weights in enumerate(sample_weights(self.samples, len(self.symbols), self.sampling)):
             r, v, sr = self.port.test_weights(weights)
-            self.rets.append(r)
-            self.vols.append(v)
-        self.rets = np.array(self.rets)
-        self.vols = np.array(self.vols)
-        self.port.optimize('Sharpe')
+            rets.append(r)
+            vols.append(v)
+            if i % 50 == 49:
+                self.progress(i + 1, total, 'Simulated portfolio weights')
+
+        # create efficient frontier - independent of risk-free rate
+        self.progress(self.samples, total, 'Tracing efficient frontier')
+        evols, erets = self.port.get_efficient_frontier(100)
+        self.progress(total, total, 'Efficient frontier done')
+        frontier.update({'rets': np.array(rets), 'vols': np.array(vols),
+                         'evols': np.asarray(evols), 'erets': np.asarray(erets)})
+        return frontier
+
+    def simulate_optimize(self):
+        # reuse cached frontier (or moments) or build and cache new ones
+        if self.frontier is None and self.allocation == 'hrp':
+            self.frontier = self.load_moments()
+            frontier_cache.set(self.moments_key, self.frontier)
+        elif self.frontier is None:
+            self.frontier = self.build_frontier()
+            frontier_cache.set(self.key, self.frontier)
+        self.rets, self.vols = self.frontier['rets'], self.frontier['vols']
+        self.evols, self.erets = self.frontier['evols'], self.frontier['erets']
+        if self.allocation == 'hrp':
+            # clustering-based weights - no covariance inversion, no risk-free rate
+            self.weights, self.optr, self.optv = hrp_portfolio(self.frontier)
+            self.progress(1, 1, 'Risk parity portfolio found')
+            return
+        # only the tangency portfolio depends on the risk-free rate
+        # (and constraints, which are warm-started from current holdings)
+        current = None
+        if self.constraints is not None:
+            current = exposure_weights(self.portfolio, self.frontier['symbols'])
+            current = current / current.sum() if current.sum() > 0 else None
+        self.weights, self.optr, self.optv = tangency_portfolio(self.frontier, self.rf, self.constraints, current)
+        self.progress(1, 1, 'Optimal portfolio found')
 
     def gen_eff_plot(self):
-        # create efficient frontier
-        self.evols, self.erets = self.port.get_efficient_frontier(100)
-        plt.figure(figsize=(10, 6))
-        # plot simulation and efficient frontier
-        plt.scatter(self.vols, self.rets, c=self.rets / self.vols, marker='o')
-        plt.scatter(self.evols, self.erets, c=self.erets / self.evols, marker='x')
-        plt.grid(True)
+        # own figure, not pyplot state - optimizations run in job threads
+        self.fig = Figure(figsize=(10, 6))
+        FigureCanvasAgg(self.fig)
+        ax = self.ax = self.fig.add_subplot(111)
+        # plot simulation and efficient frontier - empty for risk parity
+        if len(self.vols):
+            points = ax.scatter(self.vols, self.rets, c=self.rets / self.vols, marker='o')
+            ax.scatter(self.evols, self.erets, c=self.erets / self.evols, marker='x')
+            self.fig.colorbar(points, ax=ax, label='Sharpe Ratio')
+        ax.grid(True)
         # add lines at axis = 0
-        plt.axhline(0, color='k', ls='--', lw=2.0)
-        plt.axvline(0, color='k', ls='--', lw=2.0)
+        ax.axhline(0, color='k', ls='--', lw=2.0)
+        ax.axvline(0, color='k', ls='--', lw=2.0)
         # rescale axis
-        plt.xlim(xmin=-0.05)
-        plt.ylim(ymin=-0.1)
+        ax.set_xlim(left=-0.05)
+        ax.set_ylim(bottom=-0.1)
         # add labels and title
-        plt.xlabel(r'$\sigma$', fontsize=25)
-        plt.ylabel(r'$\mu$', fontsize=25)
-        plt.colorbar(label='Sharpe Ratio')
-        plt.title('Optimal Holding based on MCS (rf ={}%)'.format(self.rf * 100), fontsize=20, y=1.02)
+        ax.set_xlabel(r'$\sigma$', fontsize=25)
+        ax.set_ylabel(r'$\mu$', fontsize=25)
+        ax.set_title('Optimal Holding based on MCS (rf ={}%)'.format(self.rf * 100), fontsize=20, y=1.02)
 
     def plot_capm_opt_save(self):
-        try:
-            # gen CAPM line and optimal vol and ret
-            cml, optv, optr = self.port.get_capital_market_line(riskless_asset=self.rf)
-            plt.plot((0, 0.4), (cml(0), cml(0.4)), lw=2.0, label='CAPM Line')
-        except ValueError:
-            # calculate optimal vol and ret - no CAPM line
-            optv = self.port.get_volatility();
-            optr = self.port.get_portfolio_return()
-        finally:
-            plt.plot(optv, optr, 'y*', markersize=20, label='Optimal Portfolio')
-            # plot lines from opt portfolio
-            plt.plot((optv, optv), (0, optr), 'g-', lw=1.0)
-            plt.plot((0, optv), (optr, optr), 'g-', lw=1.0)
-            if optr > 0.75:
-                plt.xlim(xmax=round(2.5 * optv / 0.5, 0) * 0.5, xmin=-0.05)
-                plt.ylim(ymax=round(2.5 * optr / 0.5, 0) * 0.5, ymin=-0.1)
-            xlocs, xlabels = plt.xticks()
-            ylocs, ylabels = plt.yticks()
-            xlabels = ["{0:.0f}%".format(100 * xloc) for xloc in xlocs]
-            ylabels = ["{0:.0f}%".format(100 * yloc) for yloc in ylocs]
-            plt.xticks(xlocs, xlabels)
-            plt.yticks(ylocs, ylabels)
-            plt.legend(loc=0)
-            plt.savefig(basedir[:-4] + 'static/optimized_portfolio.png')
-            plt.close()
+        ax = self.ax
+        optv, optr = self.optv, self.optr
+        if optr > self.rf and self.allocation == 'max_sharpe':
+            # CAPM line through risk-free rate and tangency portfolio
+            slope = (optr - self.rf) / optv
+            ax.plot((0, 0.4), (self.rf, self.rf + slope * 0.4), lw=2.0, label='CAPM Line')
+        label = 'Risk Parity Portfolio' if self.allocation == 'hrp' else 'Optimal Portfolio'
+        ax.plot(optv, optr, 'y*', markersize=20, label=label)
+        # plot lines from opt portfolio
+        ax.plot((optv, optv), (0, optr), 'g-', lw=1.0)
+        ax.plot((0, optv), (optr, optr), 'g-', lw=1.0)
+        if optr > 0.75:
+            ax.set_xlim(right=round(2.5 * optv / 0.5, 0) * 0.5, left=-0.05)
+            ax.set_ylim(top=round(2.5 * optr / 0.5, 0) * 0.5, bottom=-0.1)
+        percent = FuncFormatter(lambda loc, pos: "{0:.0f}%".format(100 * loc))
+        ax.xaxis.set_major_formatter(percent)
+        ax.yaxis.set_major_formatter(percent)
+        ax.legend(loc=0)
+        self.fig.savefig(basedir[:-4] + 'static/optimized_portfolio.png')
 
     def rebalance_opt_port(self):
-        # create optimal portfolio in database
-        # if not already in
-        self.portfolio.create_optimal_portfolio()
-        self.opt_port = Portfolio.query.filter_by(name=self.portfolio.name + '_opt').first()
-
-        # rebalance opt_portfolio to optimal weights
-        total_balance = self.portfolio.market_value - self.portfolio.cash
-        for i in range(len(self.port.symbols)):
-            holding = Holding.query.filter_by(symbol=self.port.symbols[i], portfolio_id=self.opt_port.id).first()
-            new_mkval = self.port.weights[i] * total_balance
-            holding.shares = int(round(new_mkval / holding.last_price, 0))
-            holding.purch_price = holding.last_price
-            holding.update()
-        self.opt_port.update()
-
-        # adjust cash-holdings based on new invested total
-        self.opt_port.cash += (self.portfolio.market_value - self.opt_port.market_value)
-        self.opt_port.update()
+        # create or rebalance optimal portfolio in database
+        # integer shares solved from optimized weights and the prices
+        # already loaded for the optimization - committed once
+        symbols = self.frontier['symbols']
+        prices = np.array([round(self.frontier['last_prices'][sym], 2) for sym in symbols])
+        max_weights = self.constraints.problem(symbols)[1] if self.constraints is not None else None
+        shares = round_shares(self.weights, prices, self.portfolio.market_value - self.portfolio.cash, max_weights)
+        self.opt_port = self.portfolio.create_optimal_portfolio(dict(zip(symbols, self.weights)),
+                                                                self.frontier['last_prices'],
+                                                                dict(zip(symbols, shares)))
 
 
 # class definition for simulated portfolio
@@ -227,37 +339,102 @@ class SimulatedPortfolio(object):
         number of simulated paths for portfolio
     rf : float
         risk-free interest rate
+    estimator : string
+        covariance estimator ('sample', 'ledoit_wolf', 'ewma', 'pca')
+    sampling : string
+        path sampling scheme ('pseudo', 'antithetic', 'moment', 'sobol', 'halton')
+    progress : callable
+        progress(done, total, message) - may raise to cancel between path blocks
 
 
     Methods
     =======
     initialize_parameters:
         initialize input parameters and portfolio market env. data
+    generate_correlations:
+        estimate drift and covariance of daily log returns
+    simulate_paths:
+        simulate GBM price paths and portfolio values to end date
+    summarize:
+        terminal value statistics (float64 accumulators)
     """
 
-    def __init__(self, portfolio, start_date, end_date, paths, rf=0.01):
+    def __init__(self, portfolio, start_date, end_date, paths, rf=0.01, estimator='sample', sampling='pseudo',
+                 progress=None):
         # initialize input parameters
         self.portfolio = portfolio  # portfolio to simulate
         self.start_date = start_date  # start date for historical returns
         self.end_date = end_date  # end date for simulation
         self.paths = paths  # number of simulation paths
         self.rf = rf  # risk-free interest rate
+        self.estimator = estimator  # covariance estimator
+        self.sampling = sampling  # path sampling scheme
+        self.progress = progress or no_progress  # progress / cancellation callback
 
         # add dx parameters needed for portfolio
-        self.initialize_parameters()
+        with memory.stage('simulate.initialize'):
+            self.initialize_parameters()
 
         # determine correlations between instruments
-        self.generate_correlations()
+        with memory.stage('simulate.correlations'):
+            self.generate_correlations()
+
+        # simulate price paths and portfolio values
+        with memory.stage('simulate.paths'):
+            self.simulate_paths()
 
     def initialize_parameters(self):
         # add dx parameters needed for portfolio
         self.ma = market_environment('ma', self.start_date)
-        self.ma.add_list('symbols', [holding.symbol for holding in self.portfolio.holdings])
+        self.ma.add_list('symbols', portfolio_symbols(self.portfolio))
         self.ma.add_constant('source', 'google')
         self.ma.add_constant('final_date', dt.datetime.today())
         # create portfolio object
-        self.port = mean_variance_portfolio('optimizing_port', self.ma)
+        self.port = SourcedPortfolio('optimizing_port', self.ma)
+        if self.estimator != 'sample':
+            self.port.use_estimator(self.estimator)
 
     def generate_correlations(self):
-        # determine correlations between instruments
-        pass
+        # determine drift and covariance between instruments
+        rets = np.log(self.port.data / self.port.data.shift(1)).dropna()
+        self.mu = rets.mean().values
+        self.cov = estimate_covariance(rets.values, self.estimator)
+
+    def simulate_paths(self):
+        # GBM price paths to end date - valued with current shares plus cash
+        steps = max(int(np.busday_count(dt.date.today(), self.end_date)), 1)
+        last_prices = self.port.data.ffill().iloc[-1]
+        book = holdings_book([self.portfolio.id])
+        rows = book.rows(self.portfolio.id)
+        shares = dict.fromkeys(last_prices.index, 0)
+        for sym, count in zip(book.symbol_id[rows], book.shares[rows]):
+            shares[book.symbols[sym]] += count
+        # path tensor and values follow FLOAT_DTYPE - float32 fits twice the paths
+        dtype = float_dtype()
+        self.prices = gbm_paths(last_prices.values, self.mu, self.cov, steps, self.paths, self.sampling, dtype=dtype,
+                                progress=self.progress)
+        self.values = self.prices.dot(np.array([shares[sym] for sym in last_prices.index], dtype=dtype))
+        self.values += dtype.type(self.portfolio.cash)
+
+    def summarize(self):
+        # terminal value statistics - sums accumulated in float64
+        terminal = self.values[:, -1]
+        return {'mean': float(terminal.mean(dtype=np.float64)), 'std': float(terminal.std(dtype=np.float64)),
+                'percentiles': dict((q, float(v)) for q, v in
+                                    zip((5, 50, 95), np.percentile(terminal.astype(np.float64), (5, 50, 95))))}
+
+
+def optimize_portfolio(name, start_date, rf=0.01, estimator='sample', sampling='pseudo', constraints=None,
+                       allocation='max_sharpe', progress=None):
+    # background job entry - portfolio is loaded in the job's own session
+    portfolio = Portfolio.query.filter_by(name=name).first()
+    OptimizedPortfolio(portfolio, start_date, rf, estimator, sampling, constraints=constraints, allocation=allocation,
+                       progress=progress)
+
+
+def simulate_portfolio(name, start_date, end_date, paths, rf=0.01, estimator='sample', sampling='pseudo',
+                       progress=None):
+    # background job entry - returns terminal value statistics
+    portfolio = Portfolio.query.filter_by(name=name).first()
+    return SimulatedPortfolio(portfolio, start_date, end_date, paths, rf, estimator, sampling,
+                              progress=progress).summarize()
@@ -0,0 +1,83 @@
+from .estimators import as_estimate
+
+import numpy as np
+import scipy.cluster.hierarchy as sch
+from scipy.spatial.distance import squareform
+
+# linkage methods offered for clustering - 'single' is the classic HRP choice
+LINKAGE_METHODS = ('single', 'average', 'complete', 'ward')
+
+
+def correlation_distance(cov):
+    # d = sqrt((1 - rho) / 2) - 0 for perfectly correlated, 1 for opposite
+    vol = np.sqrt(np.diag(cov))
+    scale = np.where(vol > 0, vol, 1.0)
+    corr = np.clip(cov / np.outer(scale, scale), -1.0, 1.0)
+    # flat (zero variance) series are uncorrelated with everything
+    corr[vol == 0] = 0.0
+    corr[:, vol == 0] = 0.0
+    np.fill_diagonal(corr, 1.0)
+    return np.sqrt((1.0 - corr) / 2.0)
+
+
+def cluster_order(dist, method='single'):
+    # quasi-diagonalization - leaf order of the linkage tree puts
+    # similar symbols next to each other along the covariance diagonal
+    if len(dist) < 3:
+        return np.arange(len(dist))
+    link = sch.linkage(squareform(dist, checks=False), method=method)
+    return sch.leaves_list(link)
+
+
+def cluster_variance(cov, idx):
+    # variance of a cluster held at inverse-variance weights - diagonal only, no inversion
+    sub = cov[np.ix_(idx, idx)]
+    diag = np.diag(sub)
+    weights = 1.0 / np.where(diag > 0, diag, np.inf)
+    if not weights.sum():
+        return 0.0
+    weights /= weights.sum()
+    return float(weights.dot(sub).dot(weights))
+
+
+def recursive_bisection(cov, order):
+    # split the ordered symbols in halves and share weight
+    # between halves inversely to their cluster variance
+    weights = np.ones(len(order))
+    clusters = [np.asarray(order)]
+    while clusters:
+        clusters = [half for cluster in clusters if len(cluster) > 1
+                    for half in (cluster[:len(cluster) // 2], cluster[len(cluster) // 2:])]
+        for left, right in zip(clusters[::2], clusters[1::2]):
+            left_var, right_var = cluster_variance(cov, left), cluster_variance(cov, right)
+            alpha = 1.0 - left_var / (left_var + right_var) if left_var + right_var > 0 else 0.5
+            weights[left] *= alpha
+            weights[right] *= 1.0 - alpha
+    return weights
+
+
+def hrp_weights(cov, method='single'):
+    """ Returns hierarchical risk parity weights in covariance order.
+
+    Symbols are clustered on correlation distance, ordered so the
+    clusters sit along the covariance diagonal, then weight is split top
+    down between cluster halves by their inverse-variance risk. Only
+    diagonal blocks of the covariance are used - it is never inverted,
+    so large or singular covariances are fine.
+
+    Parameters
+    ==========
+    cov : array or covariance estimate
+        covariance of symbol returns (any scale)
+    method : string
+        linkage method, one of LINKAGE_METHODS
+    """
+    cov = as_estimate(cov).dense()
+    order = cluster_order(correlation_distance(cov), method)
+    return recursive_bisection(cov, order)
+
+
+def solve_hrp(args):
+    # solver with the same (mu, cov, rf, ...) task as solve_max_sharpe -
+    # only the covariance is used, so it can run in the batch worker pool
+    return hrp_weights(args[1])
@@ -0,0 +1,103 @@
+from flask import current_app
+from .. import db
+from ..cache import LRUCache, invalidate_on_write
+from ..models import Portfolio, Holding
+
+import base64
+import binascii
+import json
+
+# sortable listing columns - each backed by a (column, id) index
+PORTFOLIO_SORTS = {'name': Portfolio.name,
+                   'market_value': Portfolio.market_value,
+                   'total_profit': Portfolio.total_profit,
+                   'profit_percent': Portfolio.profit_percent}
+
+# precomputed summary row - portfolio aggregates only, no holdings loaded
+SUMMARY_COLUMNS = (Portfolio.id, Portfolio.name, Portfolio.cash, Portfolio.market_value,
+                   Portfolio.invested, Portfolio.total_profit, Portfolio.profit_percent,
+                   Portfolio.num_holdings)
+
+# cached pages - dropped once any portfolio row is written in this process,
+# including bulk mappings and Query.update
+summary_cache = LRUCache(maxsize=256)
+invalidate_on_write((Portfolio.__tablename__,), summary_cache.clear)
+
+
+class CursorError(ValueError):
+    # raised for a page cursor that was not produced by encode_cursor
+    pass
+
+
+def encode_cursor(value, row_id):
+    # opaque keyset cursor for (sort value, id) of last row on a page
+    return base64.urlsafe_b64encode(json.dumps([value, row_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(str(cursor)).decode())
+    except (ValueError, TypeError, binascii.Error):
+        raise CursorError('Invalid page cursor')
+    if not isinstance(row_id, int) or isinstance(value, (list, dict)):
+        raise CursorError('Invalid page cursor')
+    return value, row_id
+
+
+def like_prefix(prefix):
+    # LIKE pattern for names starting with prefix - % and _ in prefix match literally
+    return prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def keyset_page(query, column, id_column, descending, after, per_page):
+    # page through query ordered by (column, id) starting after cursor
+    # rows with a NULL sort value follow all others, ordered by id
+    value, row_id = decode_cursor(after) if after else (None, None)
+    rows = []
+    if not after or value is not None:
+        page = query.filter(column.isnot(None))
+        if after:
+            if descending:
+                page = page.filter(db.or_(column < value, db.and_(column == value, id_column < row_id)))
+            else:
+                page = page.filter(db.or_(column > value, db.and_(column == value, id_column > row_id)))
+        if descending:
+            page = page.order_by(column.desc(), id_column.desc())
+        else:
+            page = page.order_by(column.asc(), id_column.asc())
+        rows = page.limit(per_page + 1).all()
+    if len(rows) <= per_page:
+        nulls = query.filter(column.is_(None))
+        if after and value is None:
+            nulls = nulls.filter(id_column < row_id if descending else id_column > row_id)
+        nulls = nulls.order_by(id_column.desc() if descending else id_column.asc())
+        rows += nulls.limit(per_page + 1 - len(rows)).all()
+    return rows[:per_page], len(rows) > per_page
+
+
+def portfolio_page(sort='market_value', order='desc', prefix=None, after=None, per_page=25):
+    # one page of portfolio summary rows and cursor for next page
+    summary_cache.ttl = current_app.config.get('PORTFOLIO_LIST_CACHE_TTL')
+    key = (sort, order, prefix, after, per_page)
+    cached = summary_cache.get(key)
+    if cached is not None:
+        return cached
+
+    if sort not in PORTFOLIO_SORTS:
+        sort = 'market_value'
+    query = Portfolio.query.with_entities(*SUMMARY_COLUMNS)
+    if prefix:
+        query = query.filter(Portfolio.name.like(like_prefix(prefix), escape='\\'))
+    rows, more = keyset_page(query, PORTFOLIO_SORTS[sort], Portfolio.id, order != 'asc', after, per_page)
+    summaries = [row._asdict() for row in rows]
+    cursor = encode_cursor(summaries[-1][sort], summaries[-1]['id']) if more else None
+
+    summary_cache.set(key, (summaries, cursor))
+    return summaries, cursor
+
+
+def holding_page(portfolio, after=None, per_page=50):
+    # one page of holdings by portfolio percent and cursor for next page
+    rows, more = keyset_page(portfolio.holdings, Holding.portfolio_percent, Holding.id, True, after, per_page)
+    cursor = encode_cursor(rows[-1].portfolio_percent, rows[-1].id) if more else None
+    return rows, cursor
@@ -0,0 +1,103 @@
+from flask import current_app, has_app_context
+from .. import prices, shared
+from ..cache import LRUCache
+from .estimators import estimate_covariance, estimate_arrays, from_arrays
+from .book import holdings_book
+
+import numpy as np
+import pandas as pd
+import datetime as dt
+
+# price and return panels shared by analytics within this process -
+# misses fall back to panels other processes published to shared memory
+panel_cache = LRUCache(maxsize=64, ttl=3600)
+
+
+def float_dtype(dtype=None):
+    # explicit dtype, else app's FLOAT_DTYPE, else float64
+    if dtype is None:
+        dtype = current_app.config.get('FLOAT_DTYPE', 'float64') if has_app_context() else 'float64'
+    return np.dtype(dtype)
+
+
+def attach_frame(key):
+    # zero-copy frame over a shared panel, None if no process published it
+    entry = shared.attach(key)
+    if entry is None:
+        return None
+    arrays, meta = entry
+    return pd.DataFrame(arrays['values'], index=pd.DatetimeIndex(arrays['index']), columns=meta['columns'],
+                        copy=False)
+
+
+def publish_frame(key, data):
+    shared.publish(key, {'values': data.values, 'index': data.index.values}, {'columns': list(data.columns)})
+
+
+def universe_fetch(symbols, start, end=None):
+    # raw prices of many symbols, fetched once on first use - each portfolio's
+    # panel is sliced from it and aligned on its own, so a recently listed symbol
+    # only shortens the history of portfolios that hold it
+    frame = []
+
+    def fetch(subset):
+        if not frame:
+            frame.append(prices.get_panel(list(symbols), start, end))
+        return frame[0][list(subset)]
+    return fetch
+
+
+def price_panel(symbols, start, end=None, dtype=None, fetch=None):
+    # aligned daily prices - one column per symbol, rows where all symbols trade
+    # (fetch: optional universe_fetch to slice from instead of fetching symbols)
+    end = end or dt.date.today()
+    dtype = float_dtype(dtype)
+    key = ('prices', tuple(symbols), str(start), str(end), dtype.name)
+    data = panel_cache.get(key)
+    if data is None:
+        data = attach_frame(key)
+        if data is None:
+            data = fetch(symbols) if fetch is not None else prices.get_panel(list(symbols), start, end)
+            # days none of these symbols trade only exist in a wider universe
+            data = data.dropna(how='all').ffill().dropna().astype(dtype)
+            publish_frame(key, data)
+        panel_cache.set(key, data)
+    return data
+
+
+def return_panel(symbols, start, end=None, dtype=None, fetch=None):
+    # aligned daily log returns for symbols
+    end = end or dt.date.today()
+    dtype = float_dtype(dtype)
+    key = ('returns', tuple(symbols), str(start), str(end), dtype.name)
+    rets = panel_cache.get(key)
+    if rets is None:
+        rets = attach_frame(key)
+        if rets is None:
+            data = price_panel(symbols, start, end, dtype, fetch)
+            rets = np.log(data / data.shift(1)).iloc[1:]
+            publish_frame(key, rets)
+        panel_cache.set(key, rets)
+    return rets
+
+
+def covariance_panel(symbols, start, end=None, estimator='sample', dtype=None, fetch=None):
+    # daily log return covariance estimate - cached and shared like the panels
+    end = end or dt.date.today()
+    dtype = float_dtype(dtype)
+    key = ('covariance', tuple(symbols), str(start), str(end), dtype.name, estimator)
+    cov = panel_cache.get(key)
+    if cov is None:
+        entry = shared.attach(key)
+        if entry is not None:
+            cov = from_arrays(entry[0])
+        else:
+            cov = estimate_covariance(return_panel(symbols, start, end, dtype, fetch).values, estimator)
+            shared.publish(key, estimate_arrays(cov))
+        panel_cache.set(key, cov)
+    return cov
+
+
+def portfolio_symbols(portfolio):
+    # unique symbols of portfolio in holding order
+    return holdings_book([portfolio.id]).symbols_of(portfolio.id)
@@ -0,0 +1,315 @@
+from flask import render_template
+from .. import create_app, db, memory
+from ..jobs import JobCancelled, no_progress
+from ..models import Portfolio
+from .panel import return_panel, covariance_panel, portfolio_symbols
+from .batch import solve_max_sharpe
+from .hrp import solve_hrp
+from .risk import PortfolioRisk, exposure_weights
+from .valuation import PortfolioValuation
+from .functions import SimulatedPortfolio
+
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+import datetime as dt
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# sections run for every portfolio, in order
+REPORT_SECTIONS = ('valuation', 'optimization', 'simulation', 'risk')
+# output formats - charts as html (png pages) / pdf, data as json / parquet
+REPORT_FORMATS = ('html', 'pdf', 'json', 'parquet')
+
+worker_app = None  # app of a report worker process - created on its first task
+
+
+def deadline_progress(deadline):
+    # progress callback that cancels work once the report window is over
+    if deadline is None:
+        return no_progress
+
+    def progress(done, total=None, message=None):
+        if time.time() > deadline:
+            raise JobCancelled('Report deadline reached')
+    return progress
+
+
+# class definition for portfolio report
+# to hold methods and attributes needed while reporting on a portfolio
+class PortfolioReport(object):
+    """
+    Portfolio Report Object
+
+    -Runs valuation, optimization, simulation and risk for one portfolio
+      without touching the database or app/static - results go to one
+      output directory per portfolio
+    -Optimal weights are reported only - no _opt portfolio is written
+    -Charts saved as PNG (embedded in report.html) and PDF, data tables
+      as JSON and Parquet (CSV where pandas has no Parquet support)
+    -A failed section is recorded and the others still run; past the
+      deadline the remaining sections are skipped
+
+    Parameters
+    =========
+    portfolio : Portfolio model
+        input portfolio to report on
+    directory : string
+        output directory for this portfolio
+    start_date : datetime.date
+        start of time-span for historical returns (default: 6 months)
+    end_date : datetime.date
+        end date of simulation paths (default: 6 months ahead)
+    rf : float
+        risk-free interest rate
+    paths : integer
+        number of simulation paths
+    estimator : string
+        covariance estimator ('sample', 'ledoit_wolf', 'ewma', 'pca')
+    sampling : string
+        path / Monte Carlo sampling scheme
+    allocation : string
+        'max_sharpe' or 'hrp' (hierarchical risk parity)
+    formats : tuple of strings
+        subset of REPORT_FORMATS
+    progress : callable
+        progress(done, total, message) - may raise to stop the report
+
+    Methods
+    =======
+    run:
+        run every section and write outputs, returning the summary
+    valuation:
+        daily value, invested and profit series
+    optimization:
+        current against optimal weights
+    simulation:
+        percentile bands of simulated portfolio value
+    risk:
+        VaR / ES by method and component VaR per holding
+    write:
+        write charts, data files and report.html
+    """
+
+    def __init__(self, portfolio, directory, start_date=None, end_date=None, rf=0.01, paths=2500,
+                 estimator='sample', sampling='sobol', allocation='max_sharpe', formats=REPORT_FORMATS, progress=None):
+        # initialize input parameters
+        self.portfolio = portfolio  # portfolio to report on
+        self.directory = directory  # output directory for this portfolio
+        self.start_date = start_date or dt.date.today() - dt.timedelta(weeks=26)
+        self.end_date = end_date or dt.date.today() + dt.timedelta(weeks=26)
+        self.rf = rf  # risk-free interest rate
+        self.paths = paths  # simulation paths
+        self.estimator = estimator  # covariance estimator
+        self.sampling = sampling  # sampling scheme
+        self.allocation = allocation  # allocation engine
+        self.formats = formats  # output formats
+        self.progress = progress or no_progress  # progress / deadline callback
+
+        self.summary = {'name': portfolio.name, 'market_value': portfolio.market_value, 'cash': portfolio.cash,
+                        'status': 'done', 'errors': {}}
+        self.tables = {}  # section -> DataFrame written as data
+        self.charts = {}  # section -> chart file stem
+
+    def run(self):
+        # sections in order - failures are recorded, the deadline stops the rest
+        started = time.time()
+        os.makedirs(self.directory, exist_ok=True)
+        with memory.collect() as profile:
+            for i, section in enumerate(REPORT_SECTIONS):
+                try:
+                    self.progress(i, len(REPORT_SECTIONS), section)
+                    with memory.stage('report.' + section):
+                        getattr(self, section)()
+                except JobCancelled:
+                    self.summary['status'] = 'timeout'
+                    break
+                except Exception as e:
+                    db.session.rollback()
+                    self.summary['errors'][section] = '{}: {}'.format(type(e).__name__, e)
+                finally:
+                    plt.close('all')
+        if profile:
+            # memory / timing per stage when MEMORY_PROFILE is on
+            self.summary['profile'] = profile
+        if self.summary['errors'] and self.summary['status'] == 'done':
+            self.summary['status'] = 'partial'
+        self.summary['seconds'] = round(time.time() - started, 2)
+        self.write()
+        return self.summary
+
+    def valuation(self):
+        series = PortfolioValuation(self.portfolio).value_series()
+        self.tables['valuation'] = series
+        if len(series):
+            first, last = series.iloc[0], series.iloc[-1]
+            self.summary['valuation'] = {'start': str(series.index[0].date()), 'end': str(series.index[-1].date()),
+                                         'market_value': float(last.market_value),
+                                         'total_profit': float(last.total_profit),
+                                         'change': float(last.market_value - first.market_value)}
+        plt.figure(figsize=(10, 5))
+        plt.plot(series.index, series.market_value, lw=1.5, label='Market value')
+        plt.plot(series.index, series.invested + series.cash, lw=1.0, ls='--', label='Invested + cash')
+        plt.grid(True)
+        plt.legend(loc=0)
+        plt.title('Value: ' + self.portfolio.name, fontsize=16)
+        self.save_chart('valuation')
+
+    def optimization(self):
+        # weights from the shared return panel / covariance - nothing written back
+        symbols = portfolio_symbols(self.portfolio)
+        rets = return_panel(symbols, self.start_date)
+        mu = rets.mean().values * 252
+        cov = covariance_panel(symbols, self.start_date, estimator=self.estimator).scaled(252)
+        solver = solve_hrp if self.allocation == 'hrp' else solve_max_sharpe
+        weights = solver((mu, cov, self.rf))
+        current = exposure_weights(self.portfolio, symbols)
+        current = current / current.sum() if current.sum() > 0 else current
+        self.tables['optimization'] = pd.DataFrame({'current': current, 'optimal': weights}, index=symbols,
+                                                   columns=['current', 'optimal'])
+        ret, vol = float(weights.dot(mu)), float(np.sqrt(cov.variance(weights)))
+        self.summary['optimization'] = {'allocation': self.allocation, 'return': ret, 'volatility': vol,
+                                        'sharpe': (ret - self.rf) / vol if vol else None,
+                                        'turnover': float(np.abs(weights - current).sum() / 2)}
+        self.tables['optimization'].plot(kind='bar', figsize=(10, 5), grid=True)
+        plt.title('Weights: ' + self.portfolio.name, fontsize=16)
+        self.save_chart('optimization')
+
+    def simulation(self):
+        sim = SimulatedPortfolio(self.portfolio, self.start_date, self.end_date, self.paths, self.rf, self.estimator,
+                                 self.sampling, progress=self.progress)
+        bands = np.percentile(sim.values.astype(np.float64), (5, 50, 95), axis=0)
+        self.tables['simulation'] = pd.DataFrame(bands.T, columns=['p5', 'p50', 'p95'])
+        self.summary['simulation'] = sim.summarize()
+        steps = np.arange(bands.shape[1])
+        plt.figure(figsize=(10, 5))
+        plt.fill_between(steps, bands[0], bands[2], alpha=0.3, label='5% - 95%')
+        plt.plot(steps, bands[1], lw=1.5, label='Median')
+        plt.grid(True)
+        plt.legend(loc=0)
+        plt.xlabel('Trading days')
+        plt.title('Simulated value: ' + self.portfolio.name, fontsize=16)
+        self.save_chart('simulation')
+
+    def risk(self):
+        results = PortfolioRisk(self.portfolio, self.start_date, estimator=self.estimator,
+                                sampling=self.sampling).results
+        self.tables['risk'] = pd.DataFrame({'weight': results['weights'], 'marginal': results['marginal'],
+                                            'component': results['component']}, index=results['symbols'],
+                                           columns=['weight', 'marginal', 'component'])
+        self.summary['risk'] = dict((method, results[method]) for method in ('historical', 'parametric', 'monte_carlo'))
+        self.tables['risk'].component.plot(kind='bar', figsize=(10, 5), grid=True)
+        plt.title('Component VaR: ' + self.portfolio.name, fontsize=16)
+        self.save_chart('risk')
+
+    def save_chart(self, section):
+        # png backs the html report, pdf stands alone
+        if 'html' in self.formats:
+            plt.savefig(os.path.join(self.directory, section + '.png'), bbox_inches='tight')
+        if 'pdf' in self.formats:
+            plt.savefig(os.path.join(self.directory, section + '.pdf'), bbox_inches='tight')
+        plt.close()
+        self.charts[section] = section
+
+    def write(self):
+        # data files per section, summary.json and report.html
+        files = []
+        for section, frame in self.tables.items():
+            if 'json' in self.formats:
+                frame.to_json(os.path.join(self.directory, section + '.json'), orient='split', date_format='iso')
+                files.append(section + '.json')
+            if 'parquet' in self.formats:
+                files.append(write_parquet(frame, os.path.join(self.directory, section)))
+        self.summary['files'] = files
+        with open(os.path.join(self.directory, 'summary.json'), 'w') as f:
+            json.dump(self.summary, f, indent=2, default=str)
+        if 'html' in self.formats:
+            tables = dict((section, frame.tail(10).to_html(float_format='{:.4f}'.format) if section == 'valuation'
+                           else frame.to_html(float_format='{:.4f}'.format))
+                          for section, frame in self.tables.items())
+            with open(os.path.join(self.directory, 'report.html'), 'w') as f:
+                f.write(render_template('report/portfolio_report.html', summary=self.summary, charts=self.charts,
+                                        tables=tables, sections=REPORT_SECTIONS))
+
+
+def write_parquet(frame, stem):
+    # parquet needs pandas >= 0.21 plus pyarrow or fastparquet - csv otherwise
+    try:
+        frame.to_parquet(stem + '.parquet')
+        return os.path.basename(stem) + '.parquet'
+    except (AttributeError, ImportError):
+        frame.to_csv(stem + '.csv')
+        return os.path.basename(stem) + '.csv'
+
+
+def report_task(config_name, name, directory, deadline, options):
+    # worker process entry - one app per worker, portfolio loaded in its own session
+    global worker_app
+    if worker_app is None:
+        plt.switch_backend('Agg')
+        worker_app = create_app(config_name)
+    with worker_app.app_context():
+        progress = deadline_progress(deadline)
+        portfolio = Portfolio.query.filter_by(name=name).first()
+        report = PortfolioReport(portfolio, os.path.join(directory, name), progress=progress, **options)
+        return report.run()
+
+
+def report_all(config_name, directory, names=None, processes=None, minutes=None, progress=None, **options):
+    """ Writes reports for many portfolios across worker processes.
+
+    Each worker builds its own app from config_name and reports on one
+    portfolio at a time. With minutes set, sections that would start
+    (and simulation blocks that would run) after the window are skipped,
+    so a nightly run ends on time with whatever finished. Returns the
+    per-portfolio summaries, also written to index.json / index.html.
+
+    Parameters
+    ==========
+    config_name : string
+        app config for workers (same database as the caller)
+    directory : string
+        output directory - one subdirectory per portfolio
+    names : list of strings
+        portfolios to report (default: every non-optimal portfolio)
+    processes : integer
+        worker processes (default: one per core)
+    minutes : float
+        time window for the whole run
+    options : keywords
+        passed on to PortfolioReport
+    """
+    progress = progress or no_progress
+    if names is None:
+        names = [port.name for port in Portfolio.query.order_by(Portfolio.name).all()
+                 if port.num_holdings and not port.name.endswith('_opt')]
+    deadline = time.time() + minutes * 60 if minutes else None
+    os.makedirs(directory, exist_ok=True)
+    results = {}
+    pool = ProcessPoolExecutor(max_workers=processes or os.cpu_count() or 1)
+    futures = {}
+    try:
+        futures = dict((pool.submit(report_task, config_name, name, directory, deadline, options), name)
+                       for name in names)
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = {'name': name, 'status': 'failed', 'errors': {'report': str(e)}}
+            progress(len(results), len(names), 'Reported ' + name)
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        raise
+    finally:
+        pool.shutdown(wait=False)
+
+    summaries = [results[name] for name in names]
+    with open(os.path.join(directory, 'index.json'), 'w') as f:
+        json.dump({'created': str(dt.datetime.now()), 'portfolios': summaries}, f, indent=2, default=str)
+    with open(os.path.join(directory, 'index.html'), 'w') as f:
+        f.write(render_template('report/report_index.html', summaries=summaries, created=dt.datetime.now()))
+    return summaries
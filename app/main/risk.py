@@ -0,0 +1,205 @@
+from ..cache import LRUCache
+from ..models import Portfolio
+from .panel import universe_fetch, return_panel, portfolio_symbols, float_dtype
+from .book import holdings_book
+from .estimators import estimate_covariance
+from .sampling import normals
+
+import numpy as np
+import datetime as dt
+import hashlib
+import json
+from scipy.stats import norm
+
+# risk results per (weights hash, window, confidence, horizon, paths)
+risk_cache = LRUCache(maxsize=512, ttl=6 * 3600)
+
+
+def var_table(rets, weights, confidence=0.95, horizon=1, paths=10000, seed=None, estimator='sample',
+              sampling='pseudo', dtype=np.float64):
+    """ Returns VaR / ES for each row of weights as fractions of value.
+
+    Parameters
+    ==========
+    rets : array (days x symbols)
+        daily log returns
+    weights : array (portfolios x symbols)
+        value weights of each portfolio - cash is the remainder
+    confidence : float
+        VaR confidence level
+    horizon : integer
+        horizon in trading days
+    paths : integer
+        Monte Carlo sample count
+    estimator : string
+        covariance estimator for parametric and Monte Carlo methods
+    sampling : string
+        Monte Carlo sampling scheme ('pseudo', 'antithetic', 'moment', 'sobol', 'halton')
+    dtype : numpy dtype
+        dtype of Monte Carlo draws - tail sums are always accumulated in float64
+
+    Returns
+    =======
+    table : dict
+        arrays keyed by method and measure, plus marginal / component VaR
+    """
+    rets = np.expm1(np.asarray(rets, dtype=float))
+    weights = np.atleast_2d(weights)
+    alpha = 1 - confidence
+    scale = np.sqrt(horizon)
+
+    # historical simulation - every portfolio at once
+    pnl = rets.dot(weights.T)
+    hist_var = -np.percentile(pnl, alpha * 100, axis=0)
+    tail = pnl <= -hist_var
+    hist_es = -(pnl * tail).sum(axis=0) / np.maximum(tail.sum(axis=0), 1)
+
+    # parametric (delta-normal)
+    mu = rets.mean(axis=0)
+    cov = estimate_covariance(rets, estimator)
+    mu_p = weights.dot(mu)
+    sigma_p = np.sqrt(cov.variance(weights))
+    z = norm.ppf(alpha)
+    par_var = -(mu_p * horizon + z * sigma_p * scale)
+    par_es = -(mu_p * horizon - sigma_p * scale * norm.pdf(z) / alpha)
+
+    # Monte Carlo - one set of correlated draws shared by all portfolios
+    rng = np.random.RandomState(seed)
+    dtype = np.dtype(dtype)
+    shocks = normals(paths, cov.dims, sampling, rng).astype(dtype, copy=False)
+    draws = cov.correlate(shocks) * dtype.type(scale) + (mu * horizon).astype(dtype)
+    sims = draws.dot(weights.T.astype(dtype))
+    mc_var = -np.percentile(sims, alpha * 100, axis=0).astype(np.float64)
+    tail = sims <= -mc_var
+    mc_es = -(sims * tail).sum(axis=0, dtype=np.float64) / np.maximum(tail.sum(axis=0), 1)
+
+    # marginal and component VaR - components sum to the volatility part of parametric VaR
+    marginal = -z * scale * cov.product(weights) / np.where(sigma_p > 0, sigma_p, 1)[:, None]
+    component = weights * marginal
+
+    return {'historical': {'var': hist_var * scale, 'es': hist_es * scale},
+            'parametric': {'var': par_var, 'es': par_es},
+            'monte_carlo': {'var': mc_var, 'es': mc_es},
+            'marginal': marginal, 'component': component}
+
+
+def risk_key(symbols, weights, start, end, confidence, horizon, paths, estimator, sampling):
+    # cache key - hash of symbol weights plus window and parameters
+    book = json.dumps(sorted((sym, round(float(w), 6)) for sym, w in zip(symbols, weights)))
+    digest = hashlib.sha1(book.encode()).hexdigest()
+    return (digest, str(start), str(end), confidence, horizon, paths, estimator, sampling)
+
+
+def unpack(table, i, symbols, weights, value):
+    # per-portfolio result from row i of a var_table
+    result = {'value': value, 'symbols': list(symbols), 'weights': [float(w) for w in weights]}
+    for method in ('historical', 'parametric', 'monte_carlo'):
+        result[method] = {measure: float(table[method][measure][i]) for measure in ('var', 'es')}
+    result['marginal'] = [float(x) for x in table['marginal'][i]]
+    result['component'] = [float(x) for x in table['component'][i]]
+    return result
+
+
+def exposure_weights(portfolio, symbols):
+    # value weight of each symbol in portfolio - cash makes up the remainder
+    return holdings_book([portfolio.id]).exposure(portfolio.id, symbols) / portfolio.market_value
+
+
+# class definition for portfolio risk
+# to hold methods and attributes needed while measuring risk
+class PortfolioRisk(object):
+    """
+    Portfolio Risk Object
+
+    -Historical-simulation, parametric and Monte Carlo VaR / ES
+    -Marginal and component VaR per holding from the covariance
+    -Results cached per (weights, window, confidence, horizon, paths)
+
+    Parameters
+    =========
+    portfolio : Portfolio model
+        input portfolio to be measured
+    start_date : datetime.date
+        start of time-span for historical returns
+    confidence : float
+        VaR confidence level
+    horizon : integer
+        horizon in trading days
+    paths : integer
+        number of Monte Carlo samples
+    estimator : string
+        covariance estimator ('sample', 'ledoit_wolf', 'ewma', 'pca')
+    sampling : string
+        Monte Carlo sampling scheme ('pseudo', 'antithetic', 'moment', 'sobol', 'halton')
+
+    Methods
+    =======
+    initialize_parameters:
+        determine symbols and value weights of portfolio
+    calculate:
+        compute (or load cached) risk measures
+    """
+
+    def __init__(self, portfolio, start_date, confidence=0.95, horizon=1, paths=10000, estimator='sample',
+                 sampling='pseudo'):
+        # initialize input parameters
+        self.portfolio = portfolio  # portfolio to measure
+        self.start_date = start_date  # start date for historical returns
+        self.end_date = dt.date.today()  # end date for historical returns
+        self.confidence = confidence  # VaR confidence level
+        self.horizon = horizon  # horizon in trading days
+        self.paths = paths  # Monte Carlo samples
+        self.estimator = estimator  # covariance estimator
+        self.sampling = sampling  # Monte Carlo sampling scheme
+
+        self.initialize_parameters()
+        self.calculate()
+
+    def initialize_parameters(self):
+        self.symbols = portfolio_symbols(self.portfolio)
+        self.weights = exposure_weights(self.portfolio, self.symbols)
+
+    def calculate(self):
+        key = risk_key(self.symbols, self.weights, self.start_date, self.end_date,
+                       self.confidence, self.horizon, self.paths, self.estimator, self.sampling)
+        self.results = risk_cache.get(key)
+        if self.results is None:
+            rets = return_panel(self.symbols, self.start_date, self.end_date)
+            table = var_table(rets.values, self.weights, self.confidence, self.horizon, self.paths,
+                              estimator=self.estimator, sampling=self.sampling, dtype=float_dtype())
+            self.results = unpack(table, 0, self.symbols, self.weights, self.portfolio.market_value)
+            risk_cache.set(key, self.results)
+        return self.results
+
+
+def risk_all(portfolios=None, start_date=None, confidence=0.95, horizon=1, paths=10000, estimator='sample',
+             sampling='pseudo'):
+    # risk for many portfolios from one price fetch - portfolios holding the same
+    # symbols share a return panel and a set of draws, and each panel is the one
+    # PortfolioRisk builds, so both cache the same figures under risk_key
+    if portfolios is None:
+        portfolios = Portfolio.query.order_by(Portfolio.name).all()
+    portfolios = [port for port in portfolios if port.num_holdings]
+    start_date = start_date or dt.date.today() - dt.timedelta(weeks=26)
+    end_date = dt.date.today()
+    if not portfolios:
+        return {}
+
+    # one book load for every portfolio asked about
+    book = holdings_book([port.id for port in portfolios])
+    groups = {}
+    for port in portfolios:
+        groups.setdefault(tuple(book.symbols_of(port.id)), []).append(port)
+    fetch = universe_fetch(sorted(set(sym for syms in groups for sym in syms)), start_date, end_date)
+
+    results = {}
+    for symbols, ports in groups.items():
+        weights = book.weight_matrix([port.id for port in ports], symbols)
+        rets = return_panel(symbols, start_date, end_date, fetch=fetch)
+        table = var_table(rets.values, weights, confidence, horizon, paths, estimator=estimator,
+                          sampling=sampling, dtype=float_dtype())
+        for row, port in enumerate(ports):
+            results[port.name] = unpack(table, row, symbols, weights[row], port.market_value)
+            risk_cache.set(risk_key(symbols, weights[row], start_date, end_date,
+                                    confidence, horizon, paths, estimator, sampling), results[port.name])
+    return results
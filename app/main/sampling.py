@@ -0,0 +1,259 @@
+from ..jobs import no_progress
+from .estimators import as_estimate
+
+import numpy as np
+from scipy.stats import norm
+
+# sampling schemes shared by the weight sampler, path simulator and Monte Carlo VaR
+SCHEMES = ('pseudo', 'antithetic', 'moment', 'sobol', 'halton')
+
+# Joe-Kuo direction numbers (s, a, m_1 ... m_s) for Sobol dimensions 2 - 21
+# dimension 1 is the van der Corput sequence in base 2
+SOBOL_DIRECTIONS = [(1, 0, (1,)),
+                    (2, 1, (1, 3)),
+                    (3, 1, (1, 3, 1)),
+                    (3, 2, (1, 1, 1)),
+                    (4, 1, (1, 1, 3, 3)),
+                    (4, 4, (1, 3, 5, 13)),
+                    (5, 2, (1, 1, 5, 5, 17)),
+                    (5, 4, (1, 1, 5, 5, 5)),
+                    (5, 7, (1, 1, 7, 11, 19)),
+                    (5, 11, (1, 1, 5, 1, 1)),
+                    (5, 13, (1, 1, 1, 3, 11)),
+                    (5, 14, (1, 3, 5, 5, 31)),
+                    (6, 1, (1, 3, 3, 9, 7, 49)),
+                    (6, 13, (1, 1, 1, 15, 21, 21)),
+                    (6, 16, (1, 3, 1, 13, 27, 49)),
+                    (6, 19, (1, 1, 1, 15, 7, 5)),
+                    (6, 22, (1, 3, 1, 15, 13, 25)),
+                    (6, 25, (1, 1, 5, 5, 19, 61)),
+                    (7, 1, (1, 3, 7, 11, 23, 15, 103)),
+                    (7, 4, (1, 3, 7, 13, 13, 15, 69))]
+SOBOL_BITS = 32
+SOBOL_MAX_DIM = len(SOBOL_DIRECTIONS) + 1
+
+
+def sobol_directions(dim):
+    # direction integers v[j, i] for first dim dimensions
+    v = [[1 << (SOBOL_BITS - 1 - i) for i in range(SOBOL_BITS)]]
+    for s, a, m in SOBOL_DIRECTIONS[:dim - 1]:
+        row = [m[i] << (SOBOL_BITS - 1 - i) for i in range(s)]
+        for i in range(s, SOBOL_BITS):
+            x = row[i - s] ^ (row[i - s] >> s)
+            for r in range(1, s):
+                if (a >> (s - 1 - r)) & 1:
+                    x ^= row[i - r]
+            row.append(x)
+        v.append(row)
+    return np.array(v, dtype=np.int64)
+
+
+def sobol(n, dim, skip=0, shift=None):
+    # Sobol points skip ... skip + n - 1 in gray-code order, digitally shifted by shift
+    v = sobol_directions(dim)
+    index = np.arange(skip, skip + n, dtype=np.int64)
+    gray = index ^ (index >> 1)
+    x = np.zeros((n, dim), dtype=np.int64)
+    for bit in range(SOBOL_BITS):
+        x[(gray >> bit) & 1 == 1] ^= v[:, bit]
+    if shift is not None:
+        x ^= shift
+    return (x + 0.5) / 2.0 ** SOBOL_BITS
+
+
+def primes(count):
+    # first count primes - Halton bases
+    found = []
+    candidate = 2
+    while len(found) < count:
+        if all(candidate % p for p in found if p * p <= candidate):
+            found.append(candidate)
+        candidate += 1
+    return found
+
+
+def halton(n, dim, skip=0, shift=None):
+    # Halton points skip + 1 ... skip + n (origin skipped), shifted mod 1 by shift
+    x = np.empty((n, dim))
+    for j, base in enumerate(primes(dim)):
+        i = np.arange(skip + 1, skip + n + 1)
+        f, r = 1.0, np.zeros(n)
+        while i.any():
+            f /= base
+            r += f * (i % base)
+            i //= base
+        x[:, j] = r
+    if shift is not None:
+        x = (x + shift) % 1.0
+    return x
+
+
+class Sampler(object):
+    """
+    Sampler Object
+
+    -Draws successive blocks of one uniform / normal stream
+    -Quasi-random sequences continue across blocks under a single
+      randomization, so chunked draws match one large draw
+    -Quasi-random schemes cover the leading dimensions - Sobol up to
+      SOBOL_MAX_DIM, Halton up to any count - and dimensions past the
+      Sobol table are padded with pseudo-random draws, so callers should
+      order dimensions by importance (see brownian_bridge)
+
+    Parameters
+    =========
+    dim : integer
+        dimensions per draw
+    scheme : string
+        'pseudo', 'antithetic', 'moment', 'sobol' or 'halton'
+    rng : numpy.random.RandomState
+        random source for draws and randomization
+
+    Methods
+    =======
+    uniforms:
+        next n x dim uniform draws
+    normals:
+        next n x dim standard normal draws
+    """
+
+    def __init__(self, dim, scheme='pseudo', rng=None):
+        if scheme not in SCHEMES:
+            raise ValueError('Unknown sampling scheme: {}'.format(scheme))
+        self.dim = dim
+        self.scheme = scheme
+        self.rng = rng or np.random.RandomState()
+        self.index = 0  # quasi-random points already drawn
+        if scheme == 'sobol':
+            self.qdim = min(dim, SOBOL_MAX_DIM)
+            shift = self.rng.randint(0, 2 ** 16, size=(2, self.qdim)).astype(np.int64)
+            self.shift = (shift[0] << 16) | shift[1]
+        elif scheme == 'halton':
+            self.shift = self.rng.random_sample(dim)
+
+    def uniforms(self, n):
+        if self.scheme == 'sobol':
+            x = sobol(n, self.qdim, self.index, self.shift)
+            self.index += n
+            return x if self.qdim == self.dim else np.hstack([x, self.rng.random_sample((n, self.dim - self.qdim))])
+        if self.scheme == 'halton':
+            x = halton(n, self.dim, self.index, self.shift)
+            self.index += n
+            return x
+        if self.scheme == 'antithetic':
+            half = self.rng.random_sample(((n + 1) // 2, self.dim))
+            return np.vstack([half, 1 - half])[:n]
+        if self.scheme == 'moment':
+            return norm.cdf(self.normals(n))
+        return self.rng.random_sample((n, self.dim))
+
+    def normals(self, n):
+        if self.scheme == 'pseudo':
+            return self.rng.standard_normal((n, self.dim))
+        if self.scheme == 'antithetic':
+            half = self.rng.standard_normal(((n + 1) // 2, self.dim))
+            return np.vstack([half, -half])[:n]
+        if self.scheme == 'moment':
+            # match first two sample moments of every dimension exactly
+            z = self.rng.standard_normal((n, self.dim))
+            return (z - z.mean(axis=0)) / z.std(axis=0)
+        return norm.ppf(self.uniforms(n))
+
+
+def uniforms(n, dim, scheme='pseudo', rng=None):
+    # n x dim uniform draws from the named sampling scheme
+    return Sampler(dim, scheme, rng).uniforms(n)
+
+
+def normals(n, dim, scheme='pseudo', rng=None):
+    # n x dim standard normal draws from the named sampling scheme
+    return Sampler(dim, scheme, rng).normals(n)
+
+
+def bridge_order(steps):
+    # (point, left, right) construction order - terminal point first, then bisection
+    order = [(steps, 0, None)]
+    intervals = [(0, steps)]
+    while intervals:
+        left, right = intervals.pop(0)
+        if right - left > 1:
+            mid = (left + right) // 2
+            order.append((mid, left, right))
+            intervals += [(left, mid), (mid, right)]
+    return order
+
+
+def brownian_bridge(z):
+    # unit-step Brownian increments from normals ordered by bridge importance
+    # z is (paths x steps x channels) - axis 1 follows bridge_order, not time
+    paths, steps = z.shape[:2]
+    w = np.zeros((paths, steps + 1) + z.shape[2:], dtype=z.dtype)
+    for k, (point, left, right) in enumerate(bridge_order(steps)):
+        if right is None:
+            w[:, point] = np.sqrt(point) * z[:, k]
+        else:
+            mean = ((right - point) * w[:, left] + (point - left) * w[:, right]) / float(right - left)
+            w[:, point] = mean + np.sqrt((point - left) * (right - point) / float(right - left)) * z[:, k]
+    return np.diff(w, axis=1)
+
+
+def sample_weights(n, k, scheme='pseudo', rng=None):
+    # n random long-only weight vectors over k symbols summing to one
+    weights = uniforms(n, k, scheme, rng)
+    return weights / weights.sum(axis=1, keepdims=True)
+
+
+def sample_returns(n, mu, cov, scheme='pseudo', rng=None):
+    # n correlated one-period return draws with mean mu
+    cov = as_estimate(cov)
+    return cov.correlate(normals(n, cov.dims, scheme, rng)) + mu
+
+
+def gbm_paths(s0, mu, cov, steps, paths, scheme='pseudo', rng=None, dtype=np.float64, chunk=2048,
+              progress=None):
+    """ Returns simulated prices (paths x steps + 1 x symbols) under correlated GBM.
+
+    Parameters
+    ==========
+    s0 : array (symbols)
+        starting prices
+    mu : array (symbols)
+        mean daily log returns
+    cov : array or covariance estimate
+        covariance of daily log returns
+    steps : integer
+        number of daily steps
+    paths : integer
+        number of paths
+    scheme : string
+        sampling scheme - quasi-random schemes are built with a Brownian
+        bridge so the leading dimensions set the terminal values
+    rng : numpy.random.RandomState
+        random source
+    dtype : numpy dtype
+        dtype of the path tensor - float32 halves its memory
+    chunk : integer
+        paths built per block between progress reports
+    progress : callable
+        progress(done, total, message) - may raise to cancel between blocks
+    """
+    cov = as_estimate(cov)
+    dtype = np.dtype(dtype)
+    progress = progress or no_progress
+    # one stream across blocks keeps quasi-random sequences intact
+    # dimension order is (step, channel) so every channel's terminal draw comes first
+    sampler = Sampler(steps * cov.dims, scheme, rng)
+    drift = np.asarray(mu, dtype=dtype)
+    out = np.zeros((paths, steps + 1, len(mu)), dtype=dtype)
+    for start in range(0, paths, chunk):
+        n = min(chunk, paths - start)
+        block = sampler.normals(n).astype(dtype, copy=False).reshape(n, steps, cov.dims)
+        if scheme in ('sobol', 'halton'):
+            block = brownian_bridge(block)
+        shocks = cov.correlate(block.reshape(-1, cov.dims)).reshape(n, steps, -1)
+        # build log prices in place in the output tensor
+        np.cumsum(shocks + drift, axis=1, out=out[start:start + chunk, 1:])
+        progress(start + n, paths, 'Simulated paths')
+    np.exp(out, out=out)
+    out *= np.asarray(s0, dtype=dtype)
+    return out
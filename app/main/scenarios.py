@@ -0,0 +1,154 @@
+from .panel import return_panel
+from .book import holdings_book
+
+import numpy as np
+import scipy.sparse as sps
+import datetime as dt
+
+
+def parse_shocks(text):
+    # 'TECH: -20; XOM CVX: 5' -> {'TECH': -0.2, 'XOM': 0.05, 'CVX': 0.05}
+    shocks = {}
+    for part in (p for p in (text or '').split(';') if p.strip()):
+        if ':' not in part:
+            raise ValueError('Shocks look like "AAPL MSFT: -20; XOM: 5"')
+        names, shock = part.rsplit(':', 1)
+        try:
+            shock = float(shock) / 100
+        except ValueError:
+            raise ValueError('Shock "{}" is not a percentage'.format(shock.strip()))
+        for name in names.replace(',', ' ').split():
+            shocks[name.upper()] = shock
+    return shocks
+
+
+def parse_group(text):
+    # 'TECH: AAPL MSFT GOOG' -> ('TECH', ['AAPL', 'MSFT', 'GOOG'])
+    if ':' not in (text or ''):
+        raise ValueError('Groups look like "TECH: AAPL MSFT GOOG"')
+    name, members = text.split(':', 1)
+    name, members = name.strip().upper(), [sym.upper() for sym in members.replace(',', ' ').split()]
+    if not name or not members:
+        raise ValueError('Group "{}" needs a name and symbols'.format(text.strip()))
+    return name, members
+
+
+# class definition for scenario engine
+# to hold methods and attributes needed while stress testing
+class ScenarioEngine(object):
+    """
+    Scenario Engine Object
+
+    -Stress tests every portfolio at once
+    -All holdings are one sparse (portfolios x symbols) matrix of
+      market value, built from (portfolio index, symbol index, shares)
+    -Scenarios are rows of symbol returns - P&L of every portfolio in
+      every scenario is one sparse matrix product
+    -Scenarios from hand-set shocks (by symbol or group), factor shocks
+      propagated through betas, or replayed historical windows
+
+    Parameters
+    =========
+    portfolios : list of Portfolio models
+        portfolios to stress (default: every portfolio)
+
+    Methods
+    =======
+    load:
+        load holdings from the shared book into the sparse exposure matrix
+    shock_scenarios:
+        return matrix from symbol / group shocks
+    factor_scenarios:
+        return matrix from factor shocks and historical betas
+    historical_scenarios:
+        return matrix of every rolling window in a historical period
+    pnl:
+        P&L of every portfolio in every scenario
+    summary:
+        per-portfolio worst, mean and best scenario results
+    """
+
+    def __init__(self, portfolios=None):
+        # initialize input parameters
+        self.portfolios = portfolios
+
+        # load holdings into sparse exposure matrix
+        self.load()
+
+    def load(self):
+        # holdings come from the shared book - rows become (portfolio, symbol, shares)
+        ids = [port.id for port in self.portfolios] if self.portfolios is not None else None
+        book = holdings_book(ids)
+        ids = list(book.names) if ids is None else ids
+        ids = sorted((port_id for port_id in ids if port_id in book.names), key=book.names.get)
+        self.names = [book.names[port_id] for port_id in ids]
+        self.values = np.array([book.values[port_id] for port_id in ids])
+        slices = [book.rows(port_id) for port_id in ids]
+        rows = np.concatenate([np.arange(s.start, s.stop) for s in slices] + [np.zeros(0, dtype=int)])
+        port_idx = np.repeat(np.arange(len(ids)), np.array([s.stop - s.start for s in slices], dtype=int))
+        used, sym_idx = np.unique(book.symbol_id[rows], return_inverse=True)
+        self.symbols = [book.symbols[i] for i in used]
+
+        # compact holding arrays - duplicates of a symbol are summed by the matrix
+        self.port_idx = port_idx.astype(np.int32)
+        self.sym_idx = sym_idx.astype(np.int32)
+        self.shares = book.shares[rows]
+        self.prices = np.zeros(len(self.symbols))
+        self.prices[self.sym_idx] = book.last_price[rows]
+        self.exposure = sps.csr_matrix((self.shares * self.prices[self.sym_idx], (self.port_idx, self.sym_idx)),
+                                       shape=(len(self.names), len(self.symbols)))
+
+    def shock_scenarios(self, scenarios, groups=None):
+        # one row per scenario - keys are symbols or group names, symbols win over groups
+        # keys that are neither a held symbol nor a group are rejected, not skipped
+        groups = groups or {}
+        index = dict((sym, j) for j, sym in enumerate(self.symbols))
+        unknown = sorted(set(name for shocks in scenarios for name in shocks
+                             if name not in index and name not in groups))
+        if unknown:
+            raise ValueError('Not a held symbol or group: {}'.format(', '.join(unknown)))
+        returns = np.zeros((len(scenarios), len(self.symbols)))
+        for i, shocks in enumerate(scenarios):
+            for name, shock in shocks.items():
+                if name in groups:
+                    idx = [index[sym] for sym in groups[name] if sym in index]
+                    returns[i, idx] = shock
+            for name, shock in shocks.items():
+                if name in index:
+                    returns[i, index[name]] = shock
+        return returns
+
+    def factor_scenarios(self, scenarios, start, end=None):
+        # factor moves (e.g. a sector ETF or rates proxy) spread to every symbol
+        # through betas from a least-squares fit of daily log returns
+        factors = sorted(set(name for shocks in scenarios for name in shocks))
+        rets = return_panel(self.symbols + [f for f in factors if f not in self.symbols], start, end)
+        betas = np.linalg.lstsq(rets[factors].values, rets[self.symbols].values)[0]
+        shocks = np.array([[shocks.get(f, 0.0) for f in factors] for shocks in scenarios])
+        # shocks are simple returns - betas apply in log space
+        return np.expm1(np.log1p(shocks).dot(betas))
+
+    def historical_scenarios(self, start, end=None, window=1):
+        # every overlapping window of `window` days in the period, replayed on today's book
+        rets = return_panel(self.symbols, start, end or dt.date.today()).values.astype(float)
+        cumulative = np.vstack([np.zeros(len(self.symbols)), np.cumsum(rets, axis=0)])
+        return np.expm1(cumulative[window:] - cumulative[:-window])
+
+    def pnl(self, returns):
+        # (portfolios x scenarios) dollar P&L - one sparse product for all books
+        returns = np.atleast_2d(returns)
+        return np.asarray(self.exposure.dot(returns.T))
+
+    def summary(self, returns):
+        # per-portfolio worst / mean / best P&L across scenarios
+        # without scenarios nothing moves - zero P&L and no worst scenario
+        pnl = self.pnl(returns)
+        if not pnl.shape[1]:
+            return [{'name': name, 'value': float(self.values[i]), 'worst': 0.0, 'worst_scenario': None,
+                     'worst_percent': 0.0, 'mean': 0.0, 'best': 0.0} for i, name in enumerate(self.names)]
+        values = np.where(self.values > 0, self.values, 1.0)[:, None]
+        worst = pnl.argmin(axis=1)
+        return [{'name': name, 'value': float(self.values[i]), 'worst': float(pnl[i, worst[i]]),
+                 'worst_scenario': int(worst[i]), 'worst_percent': float(pnl[i, worst[i]] / values[i, 0]),
+                 'mean': float(pnl[i].mean()), 'best': float(pnl[i].max())}
+                for i, name in enumerate(self.names)]
@@ -0,0 +1,141 @@
+from sqlalchemy.exc import IntegrityError
+from .. import db, prices
+from ..models import PortfolioSnapshot, HoldingSnapshot, SNAPSHOT_ATTEMPTS
+from .book import holdings_book
+
+import numpy as np
+import pandas as pd
+import datetime as dt
+
+
+# class definition for portfolio valuation
+# to hold methods and attributes needed while valuing history
+class PortfolioValuation(object):
+    """
+    Portfolio Valuation Object
+
+    -Computes daily market value and P&L series for a portfolio
+    -Vectorized over a (dates x holdings) price panel
+    -Holdings only count from their purchase date onwards
+    -History assumes the current holdings and cash were held throughout -
+      each holding counts today's shares from its purchase date, past
+      sales, share edits and cash changes are not replayed
+    -Prices are forward-filled over gaps; days a held symbol has no
+      price yet are skipped rather than valued at zero
+    -Materializes series into portfolio_snapshots incrementally
+
+    Parameters
+    =========
+    portfolio : Portfolio model
+        input portfolio to be valued
+
+    Methods
+    =======
+    load_holdings:
+        load holding symbols, shares, purchase prices and dates into arrays
+    value_series:
+        return DataFrame of daily value, invested and profit
+    update_snapshots:
+        append snapshot rows for days not yet materialized
+    missing_snapshots:
+        snapshot rows for days after the last materialized one
+    """
+
+    def __init__(self, portfolio):
+        # initialize input parameters
+        self.portfolio = portfolio  # portfolio to value
+
+        # load holdings into arrays
+        self.load_holdings()
+
+    def load_holdings(self):
+        # load holdings into arrays aligned by position
+        book = holdings_book([self.portfolio.id])
+        rows = book.rows(self.portfolio.id)
+        self.symbols = [book.symbols[i] for i in book.symbol_id[rows]]
+        self.shares = book.shares[rows]
+        self.purch_price = book.purch_price[rows]
+        self.purch_date = book.purch_date[rows]
+
+    def value_series(self, start=None, end=None):
+        # daily value and P&L series between start and end (defaults: first purchase, today)
+        end = end or dt.date.today()
+        start = start or (self.purch_date.min().astype(object) if self.symbols else end)
+        if not self.symbols or start > end:
+            return pd.DataFrame(columns=['cash', 'market_value', 'invested', 'total_profit'])
+
+        # pad window so forward-filling has a price before start
+        panel = prices.get_panel(sorted(set(self.symbols)), start - dt.timedelta(days=7), end)
+        panel = panel.ffill()
+        panel = panel[panel.index >= pd.Timestamp(start)]
+        px = panel[self.symbols].values
+
+        # position matrix - shares held on each date by each holding
+        dates = panel.index.values.astype('datetime64[D]')
+        held = dates[:, None] >= self.purch_date[None, :]
+        # a held symbol without any price so far would read as a total loss
+        priced = ~(held & np.isnan(px)).any(axis=1)
+        panel, px, held = panel[priced], np.where(np.isnan(px[priced]), 0.0, px[priced]), held[priced]
+        position = np.where(held, self.shares[None, :], 0.0)
+
+        cash = self.portfolio.cash
+        market_value = (position * px).sum(axis=1) + cash
+        invested = position.dot(self.purch_price)
+        return pd.DataFrame({'cash': cash,
+                             'market_value': market_value,
+                             'invested': invested,
+                             'total_profit': market_value - invested - cash},
+                            index=panel.index)
+
+    def update_snapshots(self):
+        # append snapshots for days after the last materialized one
+        # up to yesterday - today's row is recorded by Portfolio.update
+        for attempt in range(SNAPSHOT_ATTEMPTS):
+            rows = self.missing_snapshots()
+            if not rows:
+                return 0
+            try:
+                db.session.bulk_insert_mappings(PortfolioSnapshot, rows)
+                db.session.commit()
+                return len(rows)
+            except IntegrityError:
+                # a concurrent backfill committed some of these days first -
+                # start again after the last day it wrote
+                db.session.rollback()
+                if attempt == SNAPSHOT_ATTEMPTS - 1:
+                    raise
+
+    def missing_snapshots(self):
+        # snapshot rows for days after the last materialized one up to yesterday
+        end = dt.date.today() - dt.timedelta(days=1)
+        last = db.session.query(db.func.max(PortfolioSnapshot.date)) \
+            .filter(PortfolioSnapshot.portfolio_id == self.portfolio.id,
+                    PortfolioSnapshot.date <= end).scalar()
+        start = last + dt.timedelta(days=1) if last else None
+        if start and start > end:
+            return []
+        series = self.value_series(start, end)
+        return [dict(portfolio_id=self.portfolio.id, date=date.date(), cash=row.cash,
+                     market_value=round(row.market_value, 2), invested=round(row.invested, 2),
+                     total_profit=round(row.total_profit, 2))
+                for date, row in series.iterrows()]
+
+
+def equity_curve(portfolio, start=None, end=None):
+    # materialized daily history - single range read on (portfolio_id, date)
+    end = end or dt.date.today()
+    start = start or end - dt.timedelta(days=365)
+    return PortfolioSnapshot.query.filter(PortfolioSnapshot.portfolio_id == portfolio.id,
+                                          PortfolioSnapshot.date >= start,
+                                          PortfolioSnapshot.date <= end) \
+        .order_by(PortfolioSnapshot.date).all()
+
+
+def holding_history(portfolio, start=None, end=None):
+    # recorded holding rows - single range read on (portfolio_id, date)
+    end = end or dt.date.today()
+    start = start or end - dt.timedelta(days=365)
+    return HoldingSnapshot.query.filter(HoldingSnapshot.portfolio_id == portfolio.id,
+                                        HoldingSnapshot.date >= start,
+                                        HoldingSnapshot.date <= end) \
+        .order_by(HoldingSnapshot.date, HoldingSnapshot.symbol).all()
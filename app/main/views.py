@@ -1,10 +1,17 @@
-from flask import render_template, session, redirect, url_for, flash, abort
-from .. import db
-from ..models import Portfolio, Holding
+from flask import render_template, session, redirect, url_for, flash, abort, jsonify, request, current_app, Response
+from .. import db, prices, jobs, memory, symbols
+from ..models import Portfolio, Holding, PortfolioSnapshot, HoldingSnapshot, Ticker_Dataset
+from ..prices import PriceSourceError
 from . import main
 from .forms import TickerForm, PortfolioForm, PortfolioEditForm, \
-    HoldingForm, HoldingEditForm, OptimizationForm, SimulationForm
-from .functions import OptimizedPortfolio, PortfolioPlot
+    HoldingForm, HoldingEditForm, OptimizationForm, SimulationForm, RiskForm, BacktestForm
+from .functions import PortfolioPlot, optimize_portfolio, simulate_portfolio
+from .valuation import PortfolioValuation, equity_curve
+from .listing import CursorError, portfolio_page, holding_page
+from .risk import PortfolioRisk
+from .backtest import PortfolioBacktest
+from .constraints import OptimizationError, PortfolioConstraints, parse_groups
+from .panel import portfolio_symbols
 
 import datetime as dt
 
@@ -29,11 +36,54 @@ def test_route():
 def portfolio_main():
     if not session.get('last_update', None) == str(dt.date.today()):
         portfolio_data = Portfolio.query.order_by(Portfolio.name).all()
-        for port in portfolio_data: port.update()
+        # backfill missed days first - today's row is recorded by the refresh
+        # (all valuations share one holdings book, refreshes invalidate it)
+        for port in portfolio_data:
+            PortfolioValuation(port).update_snapshots()
+        for port in portfolio_data:
+            port.update()
         session['last_update'] = str(dt.date.today())
         flash('Holding prices updated!')
-    portfolio_data = Portfolio.query.order_by(Portfolio.market_value.desc()).all()
-    return render_template('portfolio/portfolio_main.html', portfolio_data=portfolio_data)
+    sort = request.args.get('sort', 'market_value')
+    order = request.args.get('order', 'desc')
+    prefix = request.args.get('q') or None
+    try:
+        portfolio_data, next_cursor = portfolio_page(sort, order, prefix, request.args.get('after'),
+                                                     current_app.config['PORTFOLIOS_PER_PAGE'])
+    except CursorError:
+        abort(400)
+    return render_template('portfolio/portfolio_main.html', portfolio_data=portfolio_data,
+                           next_cursor=next_cursor, sort=sort, order=order, q=prefix)
+
+
+# route for compact JSON listing of portfolio summaries
+@main.route('/api/portfolios')
+def portfolio_list():
+    try:
+        portfolio_data, next_cursor = portfolio_page(request.args.get('sort', 'market_value'),
+                                                     request.args.get('order', 'desc'),
+                                                     request.args.get('q') or None,
+                                                     request.args.get('after'),
+                                                     min(request.args.get('per_page', 100, type=int), 1000))
+    except CursorError:
+        abort(400)
+    return jsonify(portfolios=portfolio_data, next=next_cursor)
+
+
+# route for symbol autocomplete - listed symbols starting with ?q=
+@main.route('/api/symbols')
+def symbol_search():
+    limit = min(request.args.get('limit', 10, type=int), 100)
+    return jsonify(symbols=symbols.complete(request.args.get('q', ''), limit))
+
+
+# route for metadata of one listed symbol
+@main.route('/api/symbols/<symbol>')
+def symbol_lookup(symbol):
+    row = symbols.lookup(symbol)
+    if row is None:
+        abort(404)
+    return jsonify(row)
 
 
 # route for adding new portfolios
@@ -61,9 +111,27 @@ def portfolio(name):
         abort(404)
     else:
         session['portfolio'] = str(portfolio.name)
-    holding_data = portfolio.holdings.order_by(Holding.portfolio_percent.desc()).all()
+    try:
+        holding_data, next_cursor = holding_page(portfolio, request.args.get('after'),
+                                                 current_app.config['HOLDINGS_PER_PAGE'])
+    except CursorError:
+        abort(400)
     PortfolioPlot(portfolio)
-    return render_template('portfolio/portfolio.html', name=name, holding_data=holding_data, cash=portfolio.cash)
+    return render_template('portfolio/portfolio.html', name=name, holding_data=holding_data, cash=portfolio.cash,
+                           portfolio=portfolio, next_cursor=next_cursor)
+
+
+# route for daily value history of a portfolio
+@main.route('/portfolio/<name>/history')
+def portfolio_history(name):
+    portfolio = Portfolio.query.filter_by(name=name).first()
+    if portfolio is None:
+        abort(404)
+    snapshots = equity_curve(portfolio)
+    return jsonify(name=name,
+                   dates=[str(snap.date) for snap in snapshots],
+                   market_value=[snap.market_value for snap in snapshots],
+                   total_profit=[snap.total_profit for snap in snapshots])
 
 
 # route for adding new portfolios
@@ -103,6 +171,8 @@ def portfolio_delete_ask(name):
 def portfolio_delete():
     portfolio = Portfolio.query.filter_by(name=session['portfolio']).first()
     holdinglist = Holding.query.filter_by(portfolio_id=portfolio.id).all()
+    PortfolioSnapshot.query.filter_by(portfolio_id=portfolio.id).delete()
+    HoldingSnapshot.query.filter_by(portfolio_id=portfolio.id).delete()
     db.session.delete(portfolio)
     for holding in holdinglist:
         db.session.delete(holding)
@@ -125,8 +195,22 @@ def portfolio_optimal_ask(name):
         risk_free = round(form.risk_free.data, 4)
         portfolio = Portfolio.query.filter_by(name=name).first()
         if portfolio.num_holdings > 2:
-            OptimizedPortfolio(portfolio, start_date, risk_free / 100.0)
-            return redirect(url_for('.portfolio_optimized', name=name + '_opt'))
+            # limits only passed on when they differ from an unconstrained long-only portfolio
+            constraints = None
+            groups = parse_groups(form.group_caps.data)
+            if form.min_weight.data or form.max_weight.data < 100 or groups or form.turnover.data:
+                constraints = PortfolioConstraints(form.min_weight.data / 100.0, form.max_weight.data / 100.0,
+                                                   groups, form.turnover.data)
+                try:
+                    constraints.problem(portfolio_symbols(portfolio))
+                except ValueError as e:
+                    flash(str(e))
+                    return render_template('portfolio/optimal/portfolio_optimal_ask.html', name=name, form=form)
+            # run in background - progress page follows it and opens result when done
+            job = jobs.submit('Optimizing ' + name, optimize_portfolio, name, start_date, risk_free / 100.0,
+                              form.estimator.data, form.sampling.data, constraints, form.allocation.data,
+                              redirect=url_for('.portfolio_optimized', name=name + '_opt'))
+            return redirect(url_for('.job', job_id=job.id))
         else:
             flash('Must have more than 2 holdings in your portfolio to run optimization!')
             return redirect(url_for('.portfolio',name=name))
@@ -151,6 +235,8 @@ def portfolio_optimized_revert(name):
     opt_port = Portfolio.query.filter_by(name=opt_name).first()
     for holding in opt_port.holdings:
         db.session.delete(holding)
+    PortfolioSnapshot.query.filter_by(portfolio_id=opt_port.id).delete()
+    HoldingSnapshot.query.filter_by(portfolio_id=opt_port.id).delete()
     db.session.delete(opt_port)
     session['portfolio'] = None
 
@@ -165,6 +251,8 @@ def portfolio_optimized_rebalance(name):
     act_port = Portfolio.query.filter_by(name=act_name).first()
     for holding in act_port.holdings:
         db.session.delete(holding)
+    PortfolioSnapshot.query.filter_by(portfolio_id=act_port.id).delete()
+    HoldingSnapshot.query.filter_by(portfolio_id=act_port.id).delete()
     db.session.delete(act_port)
     opt_port = Portfolio.query.filter_by(name=opt_name).first()
     opt_port.name = act_name
@@ -174,6 +262,28 @@ def portfolio_optimized_rebalance(name):
     return redirect(url_for('.portfolio_main'))
 
 
+# route for walk-forward backtest of optimized weights
+@main.route('/portfolio/<name>/backtest', methods=['GET', 'POST'])
+def portfolio_backtest(name):
+    portfolio = Portfolio.query.filter_by(name=name).first()
+    if portfolio is None:
+        abort(404)
+    form = BacktestForm()
+    backtest = None
+    if form.validate_on_submit():
+        if portfolio.num_holdings > 2:
+            try:
+                backtest = PortfolioBacktest(portfolio, form.start_date.data, form.window.data, form.rebalance.data,
+                                             form.cost.data / 10000.0, round(form.risk_free.data, 4) / 100.0)
+            except (ValueError, OptimizationError) as e:
+                flash(str(e))
+            except PriceSourceError:
+                flash('No price data found for the holdings of ' + name + '!')
+        else:
+            flash('Must have more than 2 holdings in your portfolio to run a backtest!')
+    return render_template('portfolio/optimal/portfolio_backtest.html', name=name, form=form, backtest=backtest)
+
+
 #######################
 # simulation routes
 #######################
@@ -187,11 +297,93 @@ def portfolio_simulate_ask(name):
         start_date = form.start_date.data
         risk_free = round(form.risk_free.data, 4)
         portfolio = Portfolio.query.filter_by(name=name).first()
-        OptimizedPortfolio(portfolio, start_date, risk_free)
-        return redirect(url_for('.portfolio_simulated', name=name + '_opt'))
+        if not portfolio.num_holdings:
+            flash('Must have holdings in your portfolio to run a simulation!')
+            return redirect(url_for('.portfolio', name=name))
+        # run in background - terminal value statistics are shown on progress page
+        job = jobs.submit('Simulating ' + name, simulate_portfolio, name, start_date, form.end_date.data,
+                          form.paths.data, risk_free / 100.0, form.estimator.data, form.sampling.data)
+        return redirect(url_for('.job', job_id=job.id))
     return render_template('portfolio/simulation/portfolio_simulate_ask.html', name=name, form=form)
 
 
+#######################
+# job routes
+#######################
+
+
+# route for progress page of a background job
+@main.route('/jobs/<job_id>')
+def job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        abort(404)
+    return render_template('jobs/job.html', job=job.state())
+
+
+# route for Server-Sent Events stream of job progress
+@main.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        abort(404)
+    return Response(job.stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# route for JSON job state - polling fallback for clients without SSE
+@main.route('/api/jobs/<job_id>')
+def job_state(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        abort(404)
+    job.touch()
+    return jsonify(job.state())
+
+
+# route for recent memory / timing records of profiled stages (MEMORY_PROFILE)
+@main.route('/api/memory')
+def memory_profile():
+    return jsonify(enabled=memory.enabled, budgets=memory.budgets(), stages=memory.history())
+
+
+# route for cancelling a job - work stops at its next progress report
+@main.route('/jobs/<job_id>/cancel', methods=['POST'])
+def job_cancel(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        abort(404)
+    job.cancel()
+    flash(job.name + ' cancelled!')
+    return redirect(url_for('.job', job_id=job_id))
+
+
+#######################
+# risk routes
+#######################
+
+
+# route for VaR / ES of a portfolio - defaults served from risk cache
+@main.route('/portfolio/<name>/risk', methods=['GET', 'POST'])
+def portfolio_risk(name):
+    portfolio = Portfolio.query.filter_by(name=name).first()
+    if portfolio is None:
+        abort(404)
+    form = RiskForm()
+    if not portfolio.num_holdings:
+        flash('Must have holdings in your portfolio to measure risk!')
+        return redirect(url_for('.portfolio', name=name))
+    if form.validate_on_submit():
+        start_date, confidence, horizon = form.start_date.data, form.confidence.data, form.horizon.data
+        estimator, sampling = form.estimator.data, form.sampling.data
+    else:
+        # GET or rejected POST - default measures, with any field errors shown on the form
+        start_date, confidence, horizon = form.start_date.default, form.confidence.default, form.horizon.default
+        estimator, sampling = form.estimator.default, form.sampling.default
+    risk = PortfolioRisk(portfolio, start_date, confidence / 100.0, horizon, estimator=estimator, sampling=sampling)
+    return render_template('portfolio/risk/portfolio_risk.html', name=name, form=form, risk=risk.results)
+
+
 #######################
 # holding routes
 #######################
@@ -202,12 +394,19 @@ def portfolio_simulate_ask(name):
 def holding_add(name):
     form = HoldingForm()
     if form.validate_on_submit():
-        Holding(symbol=str(form.symbol.data).upper(), shares=form.shares.data,
-                purch_date=form.purch_date.data,
-                purch_price=round(form.purch_price.data, 2),
-                portfolio_id=Portfolio.query.filter_by(name=session['portfolio']).first().id)
+        portfolio = Portfolio.query.filter_by(name=session['portfolio']).first()
+        try:
+            holding = Holding(symbol=str(form.symbol.data).strip().upper(), shares=form.shares.data,
+                              purch_date=form.purch_date.data,
+                              purch_price=round(form.purch_price.data, 2),
+                              portfolio_id=portfolio.id, commit=False)
+            # only the new holding is priced - portfolio moves by its value,
+            # committed together with the new row
+            portfolio.apply_delta(*holding.totals(), holdings=1)
+        except Exception:
+            db.session.rollback()
+            raise
         flash('Holding successfully added!')
-        Portfolio.query.filter_by(name=session['portfolio']).first().update()
         return redirect(url_for('.holding_add', name=name))
     return render_template('holding/holding_add.html', form=form, name=name)
 
@@ -218,14 +417,22 @@ def holding_edit(name, symbol, holding_id):
     form = HoldingEditForm()
     if form.validate_on_submit():
         holding = Holding.query.filter_by(id=holding_id).first()
+        market_value, invested = holding.totals()
         if form.new_shares.data or form.new_shares.data == 0:
             holding.shares = form.new_shares.data
         if form.new_purch_price.data or form.new_purch_price.data == 0:
             holding.purch_price = round(form.new_purch_price.data, 2)
         if form.new_purch_date.data:
             holding.purch_date = form.new_purch_date.data
-        db.session.add(holding)
-        Portfolio.query.filter_by(id=holding.portfolio_id).first().update()
+        portfolio = Portfolio.query.filter_by(id=holding.portfolio_id).first()
+        # apply change of this holding only - zero-share holdings are dropped
+        if holding.shares == 0:
+            db.session.delete(holding)
+            portfolio.apply_delta(-market_value, -invested, holdings=-1)
+        else:
+            holding.revalue()
+            new_market_value, new_invested = holding.totals()
+            portfolio.apply_delta(new_market_value - market_value, new_invested - invested)
         flash('Holding successfully edited!')
         return redirect(url_for('.portfolio', name=session['portfolio']))
     return render_template('holding/holding_edit.html', form=form, symbol=symbol)
@@ -245,9 +452,9 @@ def holding_delete_ask(name, symbol, holding_id):
 @main.route('/holding/<holding_id>/delete')
 def holding_delete(holding_id):
     holding = Holding.query.filter_by(id=holding_id).first()
-    portfolio_id = holding.portfolio_id
+    market_value, invested = holding.totals()
     db.session.delete(holding)
-    Portfolio.query.filter_by(id=portfolio_id).first().update()
+    Portfolio.query.filter_by(id=holding.portfolio_id).first().apply_delta(-market_value, -invested, holdings=-1)
     flash(str(holding.symbol).upper() + ' successfully deleted!')
     return redirect(url_for('.portfolio', name=session['portfolio']))
 
@@ -259,13 +466,7 @@ def holding_delete(holding_id):
 # route for ticker data management page
 @main.route('/ticker_data', methods=['GET', 'POST'])
 def ticker_data():
-    test1 = {'symbol': 'NVDA', 'name': 'Nvidia', 'start': dt.datetime(2013, 1, 1).date(),
-             'end': dt.datetime(2016, 12, 31).date(), 'freq': 'M', 'vals': 100,
-             'location': 'C:/Users/Admin/PythonData/MyPyFi/'}
-    test2 = {'symbol': 'AAPL', 'name': 'Apple', 'start': dt.datetime(2013, 1, 1).date(),
-             'end': dt.datetime(2016, 12, 31).date(), 'freq': 'M', 'vals': 100,
-             'location': 'C:/Users/Admin/PythonData/MyPyFi/'}
-    dataset = [test1, test2]
+    dataset = Ticker_Dataset.query.order_by(Ticker_Dataset.symbol, Ticker_Dataset.freq).all()
     return render_template('ticker/ticker_data.html', dataset=dataset)
 
 
@@ -274,6 +475,25 @@ def ticker_data():
 def ticker_add():
     form = TickerForm()
     if form.validate_on_submit():
-        pass
+        symbol = form.symbol.data.upper()
+        freq = form.freq.data
+        try:
+            data = prices.get_history(symbol, form.start.data, form.end.data)
+        except PriceSourceError:
+            flash('No price data found for ' + symbol + '!')
+            return render_template('ticker/ticker_add.html', form=form)
+        if freq not in ('B', 'D'):
+            data = data.resample(freq).last().dropna()
+        # write compact arrays to ticker store and record dataset
+        store = prices.get_source('store')
+        store.save(symbol, data, freq)
+        dataset = Ticker_Dataset.query.filter_by(symbol=symbol, freq=freq).first()
+        if dataset is not None:
+            db.session.delete(dataset)
+        db.session.add(Ticker_Dataset(symbol, form.name.data, data.index[0], data.index[-1], freq, len(data),
+                                      store.directory))
+        db.session.commit()
+        flash(symbol + ' data saved to ticker store!')
+        return redirect(url_for('.ticker_data'))
 
     return render_template('ticker/ticker_add.html', form=form)
@@ -1,9 +1,16 @@
-from . import db
+from . import db, prices
+from sqlalchemy.exc import IntegrityError
 import datetime as dt
 
+# attempts at writing snapshot rows when concurrent refreshes collide
+SNAPSHOT_ATTEMPTS = 3
+
 class Portfolio(db.Model):
     # model for base portfolio object
     __tablename__ = 'portfolios'
+    __table_args__ = (db.Index('ix_portfolios_market_value_id', 'market_value', 'id'),
+                      db.Index('ix_portfolios_total_profit_id', 'total_profit', 'id'),
+                      db.Index('ix_portfolios_profit_percent_id', 'profit_percent', 'id'))
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String(25), unique=True)    # name of portfolio
     cash = db.Column(db.Float)                      # cash holdings within portfolio
@@ -13,6 +20,7 @@ class Portfolio(db.Model):
     profit_percent = db.Column(db.Float)            # percent return on current amount invested - excludes cash holding
     num_holdings = db.Column(db.Integer)            # total number of holdings in portfolio - excludes cash holding
     holdings = db.relationship('Holding', backref='portfolio', lazy='dynamic')
+    snapshots = db.relationship('PortfolioSnapshot', backref='portfolio', lazy='dynamic')
 
     def __init__(self, name, cash):
         self.name = name
@@ -54,6 +62,22 @@ class Portfolio(db.Model):
         self.num_holdings = Holding.query.filter_by(portfolio_id=self.id).count()
         db.session.add(self)
 
+    def apply_delta(self, market_value, invested, holdings=0):
+        # incremental refresh after a single holding changed - no price fetches
+        # stored aggregates move by the holding's change, then every
+        # portfolio_percent is rescaled in one statement; the next full
+        # update() re-sums everything and records the day's snapshot
+        self.market_value += market_value
+        self.invested = (self.invested or 0.0) + invested
+        self.num_holdings = (self.num_holdings or 0) + holdings
+        self.update_profit()
+        db.session.flush()
+        if self.market_value:
+            ratio = db.cast(Holding.market_value / self.market_value, db.Numeric)
+            Holding.query.filter_by(portfolio_id=self.id) \
+                .update({Holding.portfolio_percent: db.func.round(ratio, 4)}, synchronize_session=False)
+        db.session.commit()
+
     def update(self):
         # update all holdings and overall portfolio
         for holding in self.holdings:
@@ -66,25 +90,112 @@ class Portfolio(db.Model):
             if holding.shares == 0:
                 db.session.delete(holding)
         db.session.commit()
+        self.record_snapshot()
+
+    def record_snapshot(self):
+        # record today's portfolio and holding rows in bulk, in their own transaction
+        # past days are append-only - today's rows stay open until the day ends
+        today = dt.date.today()
+        if self.id is None:
+            return
+        for attempt in range(SNAPSHOT_ATTEMPTS):
+            try:
+                self.write_snapshot(today)
+                db.session.commit()
+                return
+            except IntegrityError:
+                # a concurrent refresh committed today's row between our delete and insert -
+                # holdings are already committed, so replace its rows with ours
+                db.session.rollback()
+                if attempt == SNAPSHOT_ATTEMPTS - 1:
+                    raise
 
-    def create_optimal_portfolio(self):
-        old_port = Portfolio.query.filter_by(name=self.name+'_opt').first()
+    def write_snapshot(self, date):
+        # replace the portfolio and holding rows of date in the session
+        PortfolioSnapshot.query.filter_by(portfolio_id=self.id, date=date).delete(synchronize_session=False)
+        HoldingSnapshot.query.filter_by(portfolio_id=self.id, date=date).delete(synchronize_session=False)
+        db.session.bulk_insert_mappings(PortfolioSnapshot, [
+            dict(portfolio_id=self.id, date=date, cash=self.cash, market_value=self.market_value,
+                 invested=self.invested, total_profit=self.total_profit)])
+        db.session.bulk_insert_mappings(HoldingSnapshot, [
+            dict(portfolio_id=self.id, holding_id=holding.id, date=date, symbol=holding.symbol,
+                 shares=holding.shares, last_price=holding.last_price, purch_price=holding.purch_price,
+                 market_value=holding.market_value, total_profit=holding.total_profit,
+                 portfolio_percent=holding.portfolio_percent)
+            for holding in self.holdings if holding.shares])
+
+    def stage_optimal_portfolio(self, weights, last_prices, shares=None):
+        # stage <name>_opt at target weights in the session without committing
+        # weights, last_prices and shares are dicts keyed by symbol - no price fetches
+        # shares are integer counts solved by the optimizer - rounded from weights if missing
+        today = dt.date.today()
+        total_balance = self.market_value - self.cash
+        rows = []
+        for symbol, weight in weights.items():
+            price = round(last_prices[symbol], 2)
+            if shares is not None:
+                count = int(shares.get(symbol, 0))
+            else:
+                count = int(round(weight * total_balance / price, 0))
+            if count:
+                rows.append(dict(symbol=symbol, shares=count, purch_date=today, purch_price=price,
+                                 last_price=price, market_value=count * price, total_profit=0.0,
+                                 profit_percent=0.0, last_updated=str(today)))
+        invested = sum(row['market_value'] for row in rows)
+
+        # opt portfolio keeps same market value - difference is held in cash
+        port_row = dict(name=self.name + '_opt', cash=round(self.market_value - invested, 2),
+                        market_value=self.market_value, invested=invested, total_profit=0.0,
+                        profit_percent=0.0, num_holdings=len(rows))
+        old_port = Portfolio.query.filter_by(name=port_row['name']).first()
         if old_port:
-            for holding in old_port.holdings:
-                db.session.delete(holding)
-            db.session.delete(old_port)
-            db.session.commit()
-        opt_port = Portfolio(name=self.name+'_opt',cash=self.cash)
-        for holding in self.holdings:
-            Holding(holding.symbol,holding.shares,holding.purch_date,holding.purch_price,opt_port.id)
-        opt_port.update()
-        db.session.add(opt_port)
+            # update existing rows in place - insert new symbols, drop stale rows
+            port_row['id'] = old_port.id
+            existing, stale = {}, []
+            for holding_id, symbol in Holding.query.with_entities(Holding.id, Holding.symbol) \
+                    .filter_by(portfolio_id=old_port.id):
+                if symbol in weights and symbol not in existing:
+                    existing[symbol] = holding_id
+                else:
+                    stale.append(holding_id)
+            if stale:
+                Holding.query.filter(Holding.id.in_(stale)).delete(synchronize_session=False)
+            # past snapshots stay as history - today's open rows are re-recorded at the next refresh
+            PortfolioSnapshot.query.filter_by(portfolio_id=old_port.id, date=today).delete(synchronize_session=False)
+            HoldingSnapshot.query.filter_by(portfolio_id=old_port.id, date=today).delete(synchronize_session=False)
+            db.session.bulk_update_mappings(Portfolio, [port_row])
+        else:
+            existing = {}
+            db.session.bulk_insert_mappings(Portfolio, [port_row], return_defaults=True)
+        for row in rows:
+            row['portfolio_id'] = port_row['id']
+            row['portfolio_percent'] = round(row['market_value'] / self.market_value, 4)
+            if row['symbol'] in existing:
+                row['id'] = existing.pop(row['symbol'])
+        # symbols rounded down to zero shares are left over in existing
+        if existing:
+            Holding.query.filter(Holding.id.in_(list(existing.values()))).delete(synchronize_session=False)
+        db.session.bulk_update_mappings(Holding, [row for row in rows if 'id' in row])
+        db.session.bulk_insert_mappings(Holding, [row for row in rows if 'id' not in row])
+        return port_row['id']
 
+    def create_optimal_portfolio(self, weights, last_prices, shares=None):
+        # create or rebalance <name>_opt in a single transaction
+        try:
+            self.stage_optimal_portfolio(weights, last_prices, shares)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return Portfolio.query.filter_by(name=self.name + '_opt').first()
 
 
 class Holding(db.Model):
     # model for holdings associated with portfolios
     __tablename__ = 'holdings'
+    __table_args__ = (db.Index('ix_holdings_portfolio_percent_id', 'portfolio_id', 'portfolio_percent', 'id'),
+                      db.Index('ix_holdings_portfolio_symbol', 'portfolio_id', 'symbol'),
+                      db.Index('ix_holdings_symbol', 'symbol'))
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     symbol = db.Column(db.String(6))            # stock symbol
     shares = db.Column(db.Integer)              # number of shares held
@@ -98,25 +209,27 @@ class Holding(db.Model):
     last_updated = db.Column(db.String)         # date holding's last_price attribute was updated
     portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id'))
 
-    def __init__(self, symbol, shares, purch_date, purch_price, portfolio_id):
+    def __init__(self, symbol, shares, purch_date, purch_price, portfolio_id, commit=True):
+        # commit=False leaves the priced holding in the session for the caller's transaction
         self.symbol = symbol
         self.shares = shares
         self.purch_date = purch_date
         self.purch_price = purch_price
         self.portfolio_id = portfolio_id
-        self.update()
         db.session.add(self)
+        if commit:
+            self.update()
+        else:
+            self.price()
 
     def __repr__(self):
         return '<Name %r>' % self.symbol
 
     def update_last_price(self):
-        # update last_price from pandas_datareader module
+        # update last_price from shared price client
         # only if last_updated doesn't match today
-        import datetime as dt
         if not self.last_updated == str(dt.date.today()):
-            from pandas_datareader import data as web
-            self.last_price = round(web.DataReader(self.symbol, 'yahoo')['Adj Close'].iloc[-1], 2)
+            self.last_price = round(prices.last_price(self.symbol), 2)
             self.last_updated = str(dt.date.today())
         db.session.add(self)
 
@@ -131,22 +244,73 @@ class Holding(db.Model):
         self.profit_percent = round(self.last_price / self.purch_price - 1, 4)
         db.session.add(self)
 
+    def revalue(self):
+        # market value and profit from the stored last_price - no price fetch
+        self.update_market_value()
+        self.update_profit()
+
+    def totals(self):
+        # (market value, amount invested) this holding adds to its portfolio
+        return (self.market_value or 0.0), self.shares * self.purch_price
+
     def update_portfolio_percentage(self):
         # update percentage that this holding makes up of portfolio
         self.portfolio_percent = round(self.market_value / Portfolio.query.filter_by(id=self.portfolio_id).first().market_value,4)
         db.session.add(self)
 
-    def update(self):
+    def price(self):
+        # refresh last price and derived attributes without committing
         self.update_last_price()
         self.update_market_value()
         self.update_portfolio_percentage()
         self.update_profit()
+
+    def update(self):
+        self.price()
         db.session.commit()
 
 
+class PortfolioSnapshot(db.Model):
+    # model for daily portfolio valuation history
+    # one row per portfolio per day - read back as (portfolio_id, date) range scans
+    __tablename__ = 'portfolio_snapshots'
+    __table_args__ = (db.Index('ix_portfolio_snapshots_portfolio_date', 'portfolio_id', 'date', unique=True),)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)      # valuation date
+    cash = db.Column(db.Float)                      # cash holdings on date
+    market_value = db.Column(db.Float)              # market value of all holdings + cash on date
+    invested = db.Column(db.Float)                  # amount invested in holdings held on date
+    total_profit = db.Column(db.Float)              # profit of holdings held on date
+
+    def __repr__(self):
+        return '<Snapshot %r %s>' % (self.portfolio_id, self.date)
+
+
+class HoldingSnapshot(db.Model):
+    # model for daily holding history - appended in bulk at each portfolio refresh
+    __tablename__ = 'holding_snapshots'
+    __table_args__ = (db.Index('ix_holding_snapshots_portfolio_date', 'portfolio_id', 'date'),)
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id'), nullable=False)
+    holding_id = db.Column(db.Integer)              # holding row at time of snapshot - may since be deleted
+    date = db.Column(db.Date, nullable=False)      # snapshot date
+    symbol = db.Column(db.String(6))
+    shares = db.Column(db.Integer)
+    last_price = db.Column(db.Float)
+    purch_price = db.Column(db.Float)
+    market_value = db.Column(db.Float)
+    total_profit = db.Column(db.Float)
+    portfolio_percent = db.Column(db.Float)
+
+    def __repr__(self):
+        return '<Snapshot %r %s>' % (self.symbol, self.date)
+
+
 class Ticker_Dataset(db.Model):
-    # model definition for HDF5 ticker data storage
+    # model definition for datasets in on-disk ticker store
     __tablename__ = 'ticker_data'
+    __table_args__ = (db.Index('ix_ticker_data_symbol_freq', 'symbol', 'freq'),)
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     symbol = db.Column(db.String(6))
     name = db.Column(db.String(32))
@@ -165,5 +329,9 @@ class Ticker_Dataset(db.Model):
         self.vals = vals
         self.location = location
 
+    def load(self, start=None, end=None):
+        # stored prices of this dataset at its own frequency
+        return prices.get_source('store').fetch(self.symbol, start, end, self.freq)
+
     def __repr__(self):
         return '<Name %r>' % self.name
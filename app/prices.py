@@ -0,0 +1,414 @@
+import datetime as dt
+import hashlib
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class PriceSourceError(Exception):
+    # raised when a price source cannot return data for a symbol
+    pass
+
+
+class RateLimiter(object):
+    """
+    Rate Limiter Object
+
+    -Token bucket shared by all threads hitting one price source
+
+    Parameters
+    =========
+    rate : float
+        requests allowed per second (None or 0 disables limiting)
+    burst : integer
+        maximum number of requests allowed back-to-back
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.stamp = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        # block until a token is available
+        if not self.rate:
+            return
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class TimeoutSession(requests.Session):
+    # requests session applying a default timeout to every request
+    def __init__(self, timeout=None):
+        super(TimeoutSession, self).__init__()
+        self.timeout = timeout
+
+    def request(self, *args, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super(TimeoutSession, self).request(*args, **kwargs)
+
+
+class PriceSource(object):
+    # base class for price sources - subclasses implement fetch
+    name = None
+    recent_window = dt.timedelta(days=14)   # history requested when only the last price is needed
+
+    def fetch(self, symbol, start, end):
+        # return DataFrame of daily prices indexed by date
+        raise NotImplementedError
+
+
+class DataReaderSource(PriceSource):
+    """
+    DataReader Source Object
+
+    -Fetches daily prices through pandas_datareader
+    -Reuses a pooled HTTP session across all calls
+
+    Parameters
+    =========
+    name : string
+        pandas_datareader data source ('yahoo', 'google', ...)
+    session : requests.Session
+        pooled session passed through to pandas_datareader
+    """
+
+    def __init__(self, name, session):
+        self.name = name
+        self.session = session
+
+    def fetch(self, symbol, start, end):
+        from pandas_datareader import data as web
+        # retries are handled by the client - disable datareader's own loop
+        return web.DataReader(symbol, self.name, start, end, retry_count=0, session=self.session)
+
+
+class FileSource(PriceSource):
+    """
+    File Source Object
+
+    -Serves daily prices from CSV files on disk
+    -Deterministic stand-in for remote sources in tests
+
+    Parameters
+    =========
+    directory : string
+        folder holding one <SYMBOL>.csv file per symbol, indexed by Date
+    """
+
+    name = 'file'
+    recent_window = None    # serve the whole file - fixtures are not dated relative to today
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def fetch(self, symbol, start, end):
+        path = os.path.join(self.directory, symbol.upper() + '.csv')
+        if not os.path.exists(path):
+            raise PriceSourceError('No price file found for ' + symbol)
+        data = pd.read_csv(path, index_col=0, parse_dates=True).sort_index()
+        return data.loc[start:end]
+
+
+class FakeSource(PriceSource):
+    """
+    Fake Source Object
+
+    -Deterministic random-walk prices for any symbol
+    -Same symbol always gets same history - no network or files
+    -Optional latency per fetch to mimic a remote source under load
+
+    Parameters
+    =========
+    latency : float
+        seconds each fetch waits before returning
+    """
+
+    name = 'fake'
+    first_day = dt.date(2010, 1, 1)
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def fetch(self, symbol, start, end):
+        if self.latency:
+            time.sleep(self.latency)
+        days = pd.bdate_range(self.first_day, dt.date.today(), name='Date')
+        # per-symbol seed - histories only grow, earlier days never change
+        rng = np.random.RandomState(int(hashlib.md5(symbol.upper().encode()).hexdigest()[:8], 16))
+        drift, vol, first = rng.uniform(-0.0002, 0.0008), rng.uniform(0.01, 0.03), rng.uniform(20, 200)
+        close = first * np.exp(np.cumsum(rng.normal(drift - vol ** 2 / 2, vol, len(days))))
+        spread = close * rng.uniform(0, vol, len(days))
+        data = pd.DataFrame({'Open': np.r_[first, close[:-1]], 'High': close + spread, 'Low': close - spread,
+                             'Close': close, 'Volume': rng.randint(10 ** 5, 10 ** 7, len(days)),
+                             'Adj Close': close}, index=days,
+                            columns=['Open', 'High', 'Low', 'Close', 'Volume', 'Adj Close'])
+        return data.loc[start:end]
+
+
+class StoreSource(PriceSource):
+    """
+    Store Source Object
+
+    -Local on-disk ticker store - one .npz file per symbol
+    -Dates kept as int32 day offsets from 1970-01-01
+    -Price columns kept in store dtype (float32 halves file size),
+      volume kept as int64
+
+    Parameters
+    =========
+    directory : string
+        folder holding one <SYMBOL>.npz file per symbol - resampled
+        datasets are kept beside it as <SYMBOL>_<FREQ>.npz
+    dtype : string
+        float dtype used when saving price columns
+
+    Methods
+    =======
+    save:
+        write price DataFrame for a symbol and frequency, returns file path
+    fetch:
+        read stored prices for a symbol and frequency between start and end
+    """
+
+    name = 'store'
+    recent_window = None    # whole file is local - no need to narrow reads
+
+    def __init__(self, directory, dtype='float64'):
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+
+    def path(self, symbol, freq=None):
+        suffix = '' if freq in (None, 'B', 'D') else '_' + freq
+        return os.path.join(self.directory, symbol.upper() + suffix + '.npz')
+
+    def save(self, symbol, data, freq=None):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        data = data.sort_index()
+        arrays = {'days': data.index.values.astype('datetime64[D]').astype(np.int32),
+                  'columns': np.array([str(column) for column in data.columns])}
+        for column in data.columns:
+            dtype = np.int64 if column == 'Volume' else self.dtype
+            arrays[str(column)] = data[column].values.astype(dtype)
+        path = self.path(symbol, freq)
+        np.savez(path, **arrays)
+        return path
+
+    def fetch(self, symbol, start, end, freq=None):
+        # daily file unless a resampled frequency is asked for
+        path = self.path(symbol, freq)
+        if not os.path.exists(path):
+            raise PriceSourceError('No stored {} prices found for {}'.format(freq or 'daily', symbol))
+        with np.load(path) as stored:
+            days = stored['days']
+            keep = np.ones(len(days), dtype=bool)
+            if start is not None:
+                keep &= days >= day_offset(start)
+            if end is not None:
+                keep &= days <= day_offset(end)
+            index = pd.DatetimeIndex(days[keep].astype('datetime64[D]'), name='Date')
+            columns = [str(column) for column in stored['columns']]
+            return pd.DataFrame(dict((column, stored[column][keep]) for column in columns),
+                                index=index, columns=columns)
+
+
+def day_offset(date):
+    # int32 day offset from 1970-01-01 used by the ticker store
+    return np.int32((pd.Timestamp(date).normalize() - pd.Timestamp('1970-01-01')).days)
+
+
+class PriceClient(object):
+    """
+    Price Client Object
+
+    -Single entry point for all price access in app
+    -Pooled HTTP session shared by every remote source
+    -Bounded thread pool for concurrent fetches
+    -Per-source rate limiting and exponential backoff
+    -Coalesces duplicate in-flight requests for the same symbol
+
+    Parameters
+    =========
+    app : Flask app
+        optional app to configure client from
+
+    Methods
+    =======
+    init_app:
+        configure client from app config
+    get_history:
+        return daily price DataFrame for one symbol
+    get_histories:
+        fetch many symbols concurrently
+    get_panel:
+        return DataFrame of one price field, one column per symbol
+    last_price:
+        return most recent adjusted close for a symbol
+    validate:
+        check whether a source has data for a symbol
+    """
+
+    def __init__(self, app=None):
+        self.default_source = 'yahoo'
+        self.source_dir = None
+        self.store_dir = None
+        self.fake_latency = 0.0
+        self.dtype = 'float64'
+        self.max_workers = 8
+        self.timeout = 10
+        self.retries = 3
+        self.backoff = 0.5
+        self.rate_limits = {}
+        self.lock = threading.RLock()
+        self.reset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # configure client from app config
+        self.default_source = app.config.get('PRICE_SOURCE', self.default_source)
+        self.source_dir = app.config.get('PRICE_SOURCE_DIR', self.source_dir)
+        self.store_dir = app.config.get('PRICE_STORE_DIR', self.store_dir)
+        self.fake_latency = app.config.get('PRICE_FAKE_LATENCY', self.fake_latency)
+        self.dtype = app.config.get('FLOAT_DTYPE', self.dtype)
+        self.max_workers = app.config.get('PRICE_MAX_WORKERS', self.max_workers)
+        self.timeout = app.config.get('PRICE_TIMEOUT', self.timeout)
+        self.retries = app.config.get('PRICE_RETRIES', self.retries)
+        self.backoff = app.config.get('PRICE_BACKOFF', self.backoff)
+        self.rate_limits = app.config.get('PRICE_RATE_LIMITS', self.rate_limits)
+        self.reset()
+        app.extensions['prices'] = self
+
+    def reset(self):
+        # drop pooled session, workers and sources so they are rebuilt from config
+        with self.lock:
+            self._session = None
+            self._executor = None
+            self.sources = {}
+            self.limiters = {}
+            self.inflight = {}
+
+    @property
+    def session(self):
+        # pooled HTTP session - one connection pool per worker thread
+        if self._session is None:
+            session = TimeoutSession(self.timeout)
+            adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._session = session
+        return self._session
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def register_source(self, source, rate=None):
+        # add or replace a price source and its rate limiter
+        with self.lock:
+            self.sources[source.name] = source
+            self.limiters[source.name] = RateLimiter(rate, burst=self.max_workers)
+
+    def get_source(self, name=None):
+        name = name or self.default_source
+        if self.default_source in ('file', 'fake') and name != 'store':
+            # file and fake modes stand in for every remote source
+            name = self.default_source
+        if name not in self.sources:
+            if name == 'file':
+                source = FileSource(self.source_dir)
+            elif name == 'fake':
+                source = FakeSource(self.fake_latency)
+            elif name == 'store':
+                source = StoreSource(self.store_dir, self.dtype)
+            else:
+                source = DataReaderSource(name, self.session)
+            self.register_source(source, self.rate_limits.get(name))
+        return self.sources[name]
+
+    def _fetch(self, symbol, start, end, source):
+        # fetch symbol from source, retrying with exponential backoff
+        src = self.get_source(source)
+        limiter = self.limiters[src.name]
+        for attempt in range(self.retries + 1):
+            limiter.acquire()
+            try:
+                data = src.fetch(symbol, start, end)
+            except PriceSourceError:
+                raise
+            except Exception as e:
+                if attempt == self.retries:
+                    raise PriceSourceError('{} failed for {}: {}'.format(src.name, symbol, e))
+                time.sleep(self.backoff * 2 ** attempt * (1 + random.random()))
+                continue
+            if data is None or data.empty:
+                raise PriceSourceError('No data returned for ' + symbol)
+            return data
+
+    def submit(self, symbol, start=None, end=None, source=None):
+        # schedule fetch - reuse future if same request is already in flight
+        start = start or dt.date(2010, 1, 1)
+        end = end or dt.date.today()
+        key = (symbol.upper(), str(start), str(end), source or self.default_source)
+        with self.lock:
+            future = self.inflight.get(key)
+            if future is None:
+                future = self.executor.submit(self._fetch, key[0], start, end, source)
+                self.inflight[key] = future
+                future.add_done_callback(lambda f: self._release(key))
+        return future
+
+    def _release(self, key):
+        with self.lock:
+            self.inflight.pop(key, None)
+
+    def get_history(self, symbol, start=None, end=None, source=None):
+        # return daily price DataFrame for one symbol
+        return self.submit(symbol, start, end, source).result()
+
+    def get_histories(self, symbols, start=None, end=None, source=None):
+        # fetch many symbols concurrently - returns dict of DataFrames
+        futures = [(sym, self.submit(sym, start, end, source)) for sym in symbols]
+        return dict((sym, future.result()) for sym, future in futures)
+
+    def get_panel(self, symbols, start=None, end=None, source=None, field='Adj Close'):
+        # return DataFrame of a single price field with one column per symbol
+        # sources without adjusted prices fall back to plain close
+        histories = self.get_histories(symbols, start, end, source)
+        data = pd.DataFrame(dict((sym, hist[field] if field in hist else hist['Close'])
+                                 for sym, hist in histories.items()))
+        return data[list(symbols)]
+
+    def last_price(self, symbol, source=None):
+        # most recent adjusted close - only a short window is requested
+        window = self.get_source(source).recent_window
+        start = dt.date.today() - window if window else None
+        return self.get_history(symbol, start, None, source)['Adj Close'].iloc[-1]
+
+    def validate(self, symbol, source=None):
+        # check whether source has data for symbol
+        try:
+            self.last_price(symbol, source)
+        except PriceSourceError:
+            return False
+        return True
@@ -0,0 +1,217 @@
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - non-POSIX, no RSS fallback
+    resource = None
+
+MB = float(2 ** 20)
+# Python 3.9+ - older runtimes fall back to sampled RSS for stage peaks
+reset_peak = getattr(tracemalloc, 'reset_peak', None)
+
+
+def current_rss():
+    # resident set size in bytes - /proc on Linux, lifetime peak elsewhere
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, ValueError, IndexError):
+        if resource is None:
+            return 0
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RSSSampler(threading.Thread):
+    # background thread recording the highest RSS seen while a stage runs
+    def __init__(self, interval):
+        threading.Thread.__init__(self, daemon=True)
+        self.interval = interval
+        self.peak = current_rss()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.peak = max(self.peak, current_rss())
+        return self.peak
+
+
+class MemoryProfiler(object):
+    """
+    Memory Profiler Object
+
+    -Opt-in (MEMORY_PROFILE) memory accounting for analytics stages
+    -Each stage records wall time, tracemalloc peak and retained bytes,
+      peak RSS sampled by a background thread, and the allocation sites
+      that grew most - NumPy array buffers only where NumPy reports them
+      to tracemalloc (1.13+), every Python allocation otherwise
+    -Records are logged, kept in a short history for /api/memory and
+      collected per job so they show up next to its progress and result
+    -Stages nest - an outer stage's peak includes its inner stages
+    -Without tracemalloc.reset_peak (before Python 3.9) the peak is the
+      larger of retained bytes and RSS growth sampled during the stage
+    -tracemalloc is process-wide - stages running at the same time in
+      other threads are counted into each other's peaks, so their
+      records are marked unreliable
+    -Disabled stages cost one attribute check
+
+    Parameters
+    =========
+    app : Flask app
+        optional app to configure profiler from (MEMORY_PROFILE,
+        MEMORY_PROFILE_TOP, MEMORY_RSS_INTERVAL)
+
+    Methods
+    =======
+    init_app:
+        configure profiler from app config
+    stage:
+        context manager measuring one named stage
+    collect:
+        context manager gathering this thread's stage records
+    history:
+        recent records, newest last
+    budgets:
+        per-stage worst peak, retained and RSS across the history
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.top = 5  # allocation sites reported per stage
+        self.interval = 0.05  # seconds between RSS samples
+        self.logger = None
+        self.recent = deque(maxlen=200)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.open = []  # flags of running stages, every thread
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('MEMORY_PROFILE', False)
+        self.top = app.config.get('MEMORY_PROFILE_TOP', self.top)
+        self.interval = app.config.get('MEMORY_RSS_INTERVAL', self.interval)
+        self.logger = app.logger
+        app.extensions['memory_profiler'] = self
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        # peaks of enclosing stages are folded in before the peak is reset
+        stack = self.local.__dict__.setdefault('stack', [])
+        self.fold(stack)
+        stack.append(0)
+        if reset_peak is not None:
+            reset_peak()
+        flag = self.enter()
+        before = tracemalloc.take_snapshot()
+        base = tracemalloc.get_traced_memory()[0]
+        sampler = RSSSampler(self.interval)
+        rss_start = sampler.peak
+        sampler.start()
+        start = time.time()
+        try:
+            yield
+        finally:
+            seconds = time.time() - start
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, stack.pop())
+            if stack:
+                stack[-1] = max(stack[-1], peak)
+            rss_peak = sampler.stop()
+            if reset_peak is None:
+                # traced peak never resets - it is the whole process lifetime's
+                peak = base + max(current - base, rss_peak - rss_start)
+            overlapped = self.leave(flag)
+            record = {'stage': name, 'seconds': round(seconds, 4),
+                      'peak_mb': round((peak - base) / MB, 3), 'retained_mb': round((current - base) / MB, 3),
+                      'rss_peak_mb': round(rss_peak / MB, 1), 'rss_mb': round(current_rss() / MB, 1),
+                      'peak_source': 'tracemalloc' if reset_peak is not None else 'rss',
+                      'reliable': not overlapped,
+                      'top': self.largest(tracemalloc.take_snapshot(), before)}
+            self.add(record)
+
+    def enter(self):
+        # flag of a new stage - set on it and on stages of other threads running alongside
+        flag = {'thread': threading.current_thread().ident, 'overlapped': False}
+        with self.lock:
+            for other in self.open:
+                if other['thread'] != flag['thread']:
+                    other['overlapped'] = flag['overlapped'] = True
+            self.open.append(flag)
+        return flag
+
+    def leave(self, flag):
+        with self.lock:
+            self.open.remove(flag)
+        return flag['overlapped']
+
+    def fold(self, stack):
+        # carry the peak since the last reset into the innermost open stage
+        if stack:
+            stack[-1] = max(stack[-1], tracemalloc.get_traced_memory()[1])
+
+    def largest(self, after, before):
+        # allocation sites that grew most during the stage - array buffers where traced
+        domain = getattr(np.lib, 'tracemalloc_domain', None)
+        if domain is not None:
+            arrays = tracemalloc.DomainFilter(True, domain)
+            after, before = after.filter_traces([arrays]), before.filter_traces([arrays])
+        stats = [stat for stat in after.compare_to(before, 'lineno') if stat.size_diff > 0]
+        return [{'where': '{}:{}'.format(stat.traceback[0].filename, stat.traceback[0].lineno),
+                 'mb': round(stat.size_diff / MB, 3), 'count': stat.count_diff}
+                for stat in sorted(stats, key=lambda stat: stat.size_diff, reverse=True)[:self.top]]
+
+    def add(self, record):
+        self.recent.append(record)
+        records = getattr(self.local, 'records', None)
+        if records is not None:
+            records.append(record)
+        if self.logger is not None:
+            self.logger.info('memory %s: %.2fs peak %.1f MB retained %.1f MB rss peak %.1f MB%s - %s',
+                             record['stage'], record['seconds'], record['peak_mb'], record['retained_mb'],
+                             record['rss_peak_mb'], '' if record['reliable'] else ' (overlapped other stages)',
+                             ', '.join('{where} {mb:.1f} MB'.format(**site) for site in record['top']) or '-')
+
+    @contextmanager
+    def collect(self):
+        # records of every stage run by this thread inside the block
+        outer = getattr(self.local, 'records', None)
+        self.local.records = records = []
+        try:
+            yield records
+        finally:
+            self.local.records = outer
+            if outer is not None:
+                outer.extend(records)
+
+    def history(self):
+        return list(self.recent)
+
+    def budgets(self):
+        # worst case per stage - a starting point for per-request memory budgets;
+        # overlapped runs are counted, their share shows how far to trust the numbers
+        worst = {}
+        for record in list(self.recent):
+            entry = worst.setdefault(record['stage'], {'runs': 0, 'unreliable': 0, 'seconds': 0.0, 'peak_mb': 0.0,
+                                                       'retained_mb': 0.0, 'rss_peak_mb': 0.0})
+            entry['runs'] += 1
+            entry['unreliable'] += not record['reliable']
+            for key in ('seconds', 'peak_mb', 'retained_mb', 'rss_peak_mb'):
+                entry[key] = max(entry[key], record[key])
+        return worst
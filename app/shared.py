@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX, index updates are unlocked
+    fcntl = None
+
+# reference stamp of a pinned entry - held until released or its process exits
+PINNED = float('inf')
+
+
+class SharedPanels(object):
+    """
+    Shared Panels Object
+
+    -Cross-process cache for computed arrays (return panels, covariances)
+    -Each entry is a set of .npy files in one directory (ideally tmpfs,
+      e.g. /dev/shm) - attaching memory-maps them read-only, so every
+      worker process reads the same pages instead of holding a copy
+    -A small JSON index holds keys, sizes, last use and the pids attached
+      to each entry - read under a shared file lock, rewritten under an
+      exclusive one; attach only rewrites it when its use / reference
+      stamps are more than touch_every seconds old
+    -Least recently used entries are evicted beyond max_bytes, skipping
+      entries a live process published or attached to within the last
+      lease seconds (unlinking a mapped file is safe on POSIX - the
+      mapping stays valid - so references only keep hot entries from churning)
+    -Pinned entries (publish with pin=True) are held until released, past
+      the ttl as well, for files handed to worker processes by path
+      rather than attached
+
+    Parameters
+    =========
+    app : Flask app
+        optional app to configure cache from (SHARED_PANEL_DIR,
+        SHARED_PANEL_MB, SHARED_PANEL_TTL) - disabled without a directory
+
+    Methods
+    =======
+    init_app:
+        configure cache from app config
+    publish:
+        write arrays for key and return their file paths
+    attach:
+        memory-map arrays for key (None on miss)
+    release:
+        drop this process's reference to an entry
+    """
+
+    def __init__(self, app=None):
+        self.directory = None
+        self.max_bytes = 512 * 2 ** 20
+        self.ttl = 3600
+        self.lease = 300  # seconds an attach keeps an entry from eviction
+        self.touch_every = 30  # seconds between index rewrites for a repeated attach
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = app.config.get('SHARED_PANEL_DIR')
+        self.max_bytes = app.config.get('SHARED_PANEL_MB', 512) * 2 ** 20
+        self.ttl = app.config.get('SHARED_PANEL_TTL', self.ttl)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        app.extensions['shared_panels'] = self
+
+    @property
+    def enabled(self):
+        return bool(self.directory)
+
+    def name(self, key):
+        # stable file prefix for a cache key
+        return hashlib.sha1(repr(key).encode()).hexdigest()
+
+    def path(self, name, field):
+        return os.path.join(self.directory, '{}.{}.npy'.format(name, field))
+
+    @contextmanager
+    def index(self, write=True):
+        # index under a file lock - exclusive for read-modify-write, shared for reads
+        with open(os.path.join(self.directory, 'index.lock'), 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX if write else fcntl.LOCK_SH)
+            try:
+                try:
+                    with open(os.path.join(self.directory, 'index.json')) as f:
+                        entries = json.load(f)
+                except (IOError, ValueError):
+                    entries = {}
+                yield entries
+                if not write:
+                    return
+                tmp = os.path.join(self.directory, 'index.json.{}'.format(os.getpid()))
+                with open(tmp, 'w') as f:
+                    json.dump(entries, f)
+                os.replace(tmp, os.path.join(self.directory, 'index.json'))
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def publish(self, key, arrays, meta=None, pin=False):
+        # write each array atomically, then record entry - returns field -> path
+        # the publisher holds a reference, so its paths outlive an eviction pass
+        if not self.enabled:
+            return None
+        name = self.name(key)
+        paths = {}
+        for field, array in arrays.items():
+            paths[field] = self.path(name, field)
+            tmp = '{}.{}.tmp'.format(paths[field], os.getpid())
+            with open(tmp, 'wb') as f:
+                np.save(f, np.ascontiguousarray(array))
+            os.replace(tmp, paths[field])
+        now = time.time()
+        with self.index() as entries:
+            entries[name] = {'key': repr(key), 'fields': sorted(arrays), 'meta': meta or {},
+                             'bytes': sum(int(np.asarray(a).nbytes) for a in arrays.values()),
+                             'created': now, 'used': now, 'refs': {str(os.getpid()): PINNED if pin else now}}
+            self.evict(entries, now)
+        return paths
+
+    def attach(self, key):
+        # memory-map arrays for key - returns (arrays, meta) or None
+        if not self.enabled:
+            return None
+        name = self.name(key)
+        pid = str(os.getpid())
+        now = time.time()
+        arrays = None
+        with self.index(write=False) as entries:
+            entry = entries.get(name)
+            if entry is None:
+                return None
+            if now - entry['created'] <= self.ttl:
+                try:
+                    arrays = dict((field, np.load(self.path(name, field), mmap_mode='r'))
+                                  for field in entry['fields'])
+                except (IOError, ValueError):
+                    pass
+        if arrays is None:
+            # expired or unreadable - dropped unless republished or pinned meanwhile
+            with self.index() as entries:
+                if name in entries and entries[name]['created'] == entry['created'] \
+                        and not self.pinned(entries[name]):
+                    self.remove(entries, name)
+            return None
+        if now - entry['used'] > self.touch_every or now - entry['refs'].get(pid, 0) > self.touch_every:
+            with self.index() as entries:
+                current = entries.get(name)
+                if current is not None:
+                    current['used'] = now
+                    current['refs'][pid] = max(current['refs'].get(pid, 0), now)
+        return arrays, entry['meta']
+
+    def release(self, key):
+        # drop this process's reference - the entry is evictable once other references lapse
+        if not self.enabled:
+            return
+        with self.index() as entries:
+            entry = entries.get(self.name(key))
+            if entry is not None:
+                entry['refs'].pop(str(os.getpid()), None)
+
+    def held(self, entry, now):
+        # entry attached by a live process within the lease
+        for pid, stamp in list(entry['refs'].items()):
+            if now - stamp > self.lease or not pid_alive(int(pid)):
+                del entry['refs'][pid]
+        return bool(entry['refs'])
+
+    def pinned(self, entry):
+        # pinned by a live process - kept past the ttl until released
+        return any(stamp == PINNED and pid_alive(int(pid)) for pid, stamp in entry['refs'].items())
+
+    def evict(self, entries, now):
+        # drop expired unpinned entries, then least recently used unheld ones over budget
+        for name in [name for name, entry in entries.items()
+                     if now - entry['created'] > self.ttl and not self.pinned(entry)]:
+            self.remove(entries, name)
+        total = sum(entry['bytes'] for entry in entries.values())
+        for name in sorted(entries, key=lambda name: entries[name]['used']):
+            if total <= self.max_bytes:
+                break
+            if not self.held(entries[name], now):
+                total -= entries[name]['bytes']
+                self.remove(entries, name)
+
+    def remove(self, entries, name):
+        for field in entries.pop(name)['fields']:
+            try:
+                os.remove(self.path(name, field))
+            except OSError:
+                pass
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
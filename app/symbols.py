@@ -0,0 +1,184 @@
+import glob
+import os
+import threading
+import time
+
+import numpy as np
+import requests
+
+# exchange codes used by the NASDAQ Trader symbol directory
+EXCHANGES = {'Q': 'NASDAQ', 'N': 'NYSE', 'A': 'NYSE American', 'P': 'NYSE Arca', 'Z': 'Cboe BZX', 'V': 'IEX'}
+
+
+def parse_listing(text):
+    # rows of (symbol, name, exchange, etf) from a NASDAQ Trader directory file
+    # (pipe-delimited, nasdaqlisted / otherlisted) or a csv with symbol,name[,exchange][,etf]
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if not lines:
+        return []
+    delimiter = '|' if '|' in lines[0] else ','
+    header = [column.strip().lower() for column in lines[0].split(delimiter)]
+
+    def column(*names):
+        for name in names:
+            if name in header:
+                return header.index(name)
+        return None
+    symbol_col = column('symbol', 'act symbol')
+    if symbol_col is None:
+        raise ValueError('Listing has no symbol column')
+    name_col = column('security name', 'name')
+    exchange_col = column('exchange')
+    etf_col = column('etf')
+    test_col = column('test issue')
+    rows = []
+    for line in lines[1:]:
+        if line.startswith('File Creation Time'):
+            continue
+        fields = [field.strip() for field in line.split(delimiter)]
+        if len(fields) <= symbol_col or not fields[symbol_col]:
+            continue
+        if test_col is not None and test_col < len(fields) and fields[test_col] == 'Y':
+            continue
+
+        def field(col, default=''):
+            return fields[col] if col is not None and col < len(fields) else default
+        # nasdaqlisted.txt has no exchange column - every row is NASDAQ
+        exchange = field(exchange_col, 'Q' if delimiter == '|' else '')
+        rows.append((fields[symbol_col].upper(), field(name_col), EXCHANGES.get(exchange, exchange),
+                     field(etf_col) == 'Y'))
+    return rows
+
+
+class SymbolUniverse(object):
+    """
+    Symbol Universe Object
+
+    -Local index of every listed symbol, loaded from listing files in
+      SYMBOL_DIR (NASDAQ Trader directory files or plain csv)
+    -Symbols held in one sorted fixed-width array with name, exchange
+      and ETF flag alongside - exact lookups and prefix ranges are
+      binary searches, no price source is touched
+    -Listing files are re-checked for changes at most every
+      check_every seconds; download refreshes them from SYMBOL_URLS
+    -Disabled (enabled is False) while no listing is installed, so
+      callers can fall back to asking the price source
+
+    Parameters
+    =========
+    app : Flask app
+        optional app to configure universe from (SYMBOL_DIR, SYMBOL_URLS)
+
+    Methods
+    =======
+    init_app:
+        configure universe from app config
+    lookup:
+        metadata for one symbol (None if unlisted)
+    complete:
+        listed symbols starting with a prefix
+    download:
+        fetch listing files into SYMBOL_DIR and reload
+    """
+
+    def __init__(self, app=None):
+        self.directory = None
+        self.urls = ()
+        self.check_every = 60  # seconds between checks for changed listing files
+        self.lock = threading.Lock()
+        self.index = (np.array([], dtype='U1'), np.array([], dtype='U1'), np.array([], dtype='U1'),
+                      np.array([], dtype=bool))  # symbols, names, exchanges, etf - swapped as a whole
+        self.stamp = None
+        self.checked = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.directory = app.config.get('SYMBOL_DIR')
+        self.urls = app.config.get('SYMBOL_URLS', self.urls)
+        self.stamp = None
+        self.checked = 0.0
+        app.extensions['symbols'] = self
+
+    @property
+    def enabled(self):
+        return len(self.current()[0]) > 0
+
+    def files(self):
+        if not self.directory:
+            return []
+        return sorted(glob.glob(os.path.join(self.directory, '*.txt')) +
+                      glob.glob(os.path.join(self.directory, '*.csv')))
+
+    def current(self):
+        # index, reloaded when listing files changed since the last check
+        now = time.time()
+        if now - self.checked > self.check_every:
+            with self.lock:
+                if now - self.checked > self.check_every:
+                    files = self.files()
+                    stamp = tuple((path, os.path.getmtime(path)) for path in files)
+                    if stamp != self.stamp:
+                        self.load(files)
+                        self.stamp = stamp
+                    self.checked = now
+        return self.index
+
+    def load(self, files):
+        # first listing of a symbol wins - files are read in name order
+        seen = {}
+        for path in files:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                for row in parse_listing(f.read()):
+                    seen.setdefault(row[0], row)
+        rows = [seen[symbol] for symbol in sorted(seen)]
+        if not rows:
+            self.index = (np.array([], dtype='U1'), np.array([], dtype='U1'), np.array([], dtype='U1'),
+                          np.array([], dtype=bool))
+            return
+        symbols, names, exchanges, etf = zip(*rows)
+        self.index = (np.array(symbols), np.array(names), np.array(exchanges), np.array(etf, dtype=bool))
+
+    def find(self, symbol):
+        # position of symbol in the sorted array, None if unlisted
+        symbols = self.current()[0]
+        symbol = str(symbol).strip().upper()
+        if not symbol or len(symbol) > symbols.itemsize // 4:
+            return None
+        i = int(np.searchsorted(symbols, symbol))
+        return i if i < len(symbols) and symbols[i] == symbol else None
+
+    def __contains__(self, symbol):
+        return self.find(symbol) is not None
+
+    def row(self, i):
+        symbols, names, exchanges, etf = self.index
+        return {'symbol': str(symbols[i]), 'name': str(names[i]), 'exchange': str(exchanges[i]), 'etf': bool(etf[i])}
+
+    def lookup(self, symbol):
+        i = self.find(symbol)
+        return None if i is None else self.row(i)
+
+    def complete(self, prefix, limit=10):
+        # symbols in [prefix, prefix with its last character bumped) - two binary searches
+        symbols = self.current()[0]
+        prefix = str(prefix).strip().upper()
+        if not prefix or len(prefix) > symbols.itemsize // 4:
+            return []
+        lo = int(np.searchsorted(symbols, prefix))
+        hi = int(np.searchsorted(symbols, prefix[:-1] + chr(ord(prefix[-1]) + 1)))
+        return [self.row(i) for i in range(lo, min(hi, lo + limit))]
+
+    def download(self, timeout=30):
+        # replace listing files from SYMBOL_URLS - each written atomically
+        os.makedirs(self.directory, exist_ok=True)
+        for url in self.urls:
+            response = requests.get(url, timeout=timeout)
+            response.raise_for_status()
+            path = os.path.join(self.directory, url.rsplit('/', 1)[-1])
+            tmp = '{}.{}.tmp'.format(path, os.getpid())
+            with open(tmp, 'w', encoding='utf-8') as f:
+                f.write(response.text)
+            os.replace(tmp, path)
+        self.checked = 0.0
+        return len(self.current()[0])
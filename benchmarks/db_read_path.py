@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Read-path benchmark for the portfolio schema.
+
+Seeds a scratch SQLite database with N portfolios x M holdings and a year
+of snapshots, then times the queries behind the listing, portfolio,
+holding and history pages - once on the bare schema and once with the
+indexes and WAL pragmas of ProductionConfig.
+
+    python benchmarks/db_read_path.py --portfolios 2000 --holdings 50
+"""
+import argparse
+import datetime as dt
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy import create_engine, event, select, and_, func
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from app import db  # noqa: E402
+from app.models import Portfolio, Holding, PortfolioSnapshot  # noqa: E402
+from config import ProductionConfig  # noqa: E402
+
+portfolios = Portfolio.__table__
+holdings = Holding.__table__
+snapshots = PortfolioSnapshot.__table__
+
+
+def build(path, n_ports, n_holds, tuned):
+    # create and seed database - bare schema keeps only primary keys
+    engine = create_engine('sqlite:///' + path)
+    if tuned:
+        @event.listens_for(engine, 'connect')
+        def set_pragmas(dbapi_connection, connection_record):
+            for name, value in ProductionConfig.SQLITE_PRAGMAS.items():
+                dbapi_connection.execute('PRAGMA {} = {}'.format(name, value))
+    db.metadata.create_all(engine)
+    if not tuned:
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.drop(engine)
+
+    rng = np.random.RandomState(0)
+    symbols = ['S{:04d}'.format(i) for i in range(500)]
+    today = dt.date.today()
+    with engine.begin() as conn:
+        conn.execute(portfolios.insert(), [
+            dict(id=i + 1, name='port{:05d}'.format(i), cash=1000.0, market_value=float(rng.uniform(1e3, 1e6)),
+                 total_profit=float(rng.normal(0, 1e4)), invested=5e4, profit_percent=float(rng.normal(0, 0.2)),
+                 num_holdings=n_holds) for i in range(n_ports)])
+        conn.execute(holdings.insert(), [
+            dict(portfolio_id=p + 1, symbol=symbols[rng.randint(len(symbols))], shares=10,
+                 market_value=1000.0, purch_date=today, purch_price=10.0, last_price=10.0,
+                 portfolio_percent=float(rng.uniform())) for p in range(n_ports) for h in range(n_holds)])
+        conn.execute(snapshots.insert(), [
+            dict(portfolio_id=p + 1, date=today - dt.timedelta(days=d), cash=1000.0, market_value=1e5,
+                 invested=5e4, total_profit=5e4) for p in range(min(n_ports, 200)) for d in range(365)])
+    return engine
+
+
+def queries(n_ports):
+    # representative reads issued by views.py
+    target = n_ports // 2
+    year_ago = dt.date.today() - dt.timedelta(days=365)
+    return [
+        ('listing page (market_value desc)',
+         select([portfolios]).order_by(portfolios.c.market_value.desc(), portfolios.c.id.desc()).limit(26)),
+        ('portfolio holdings by percent',
+         select([holdings]).where(holdings.c.portfolio_id == target)
+         .order_by(holdings.c.portfolio_percent.desc(), holdings.c.id.desc()).limit(51)),
+        ('holding by portfolio and symbol',
+         select([holdings]).where(and_(holdings.c.portfolio_id == target, holdings.c.symbol == 'S0042'))),
+        ('holding count by portfolio',
+         select([func.count()]).select_from(holdings).where(holdings.c.portfolio_id == target)),
+        ('positions in one symbol',
+         select([holdings.c.portfolio_id, holdings.c.shares]).where(holdings.c.symbol == 'S0042')),
+        ('one-year equity curve',
+         select([snapshots]).where(and_(snapshots.c.portfolio_id == 100, snapshots.c.date >= year_ago))
+         .order_by(snapshots.c.date)),
+    ]
+
+
+def timeit(engine, query, repeat):
+    with engine.connect() as conn:
+        conn.execute(query).fetchall()
+        start = time.perf_counter()
+        for i in range(repeat):
+            conn.execute(query).fetchall()
+    return (time.perf_counter() - start) / repeat * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--portfolios', type=int, default=2000)
+    parser.add_argument('--holdings', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    engines = {mode: build(os.path.join(tmp, mode + '.sqlite'), args.portfolios, args.holdings, mode == 'tuned')
+               for mode in ('bare', 'tuned')}
+    print('{:<36}{:>12}{:>12}{:>10}'.format('query (ms)', 'bare', 'tuned', 'speedup'))
+    for label, query in queries(args.portfolios):
+        bare = timeit(engines['bare'], query, args.repeat)
+        tuned = timeit(engines['tuned'], query, args.repeat)
+        print('{:<36}{:>12.3f}{:>12.3f}{:>9.1f}x'.format(label, bare, tuned, bare / tuned))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,26 @@
 import os
+import sqlite3
+import tempfile
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 
+@event.listens_for(Engine, 'connect')
+def sqlite_pragmas(dbapi_connection, connection_record):
+    # apply SQLITE_PRAGMAS of the app opening the connection - registered once
+    # for every engine, so apps without pragmas and other databases are untouched
+    if not isinstance(dbapi_connection, sqlite3.Connection) or not has_app_context():
+        return
+    pragmas = current_app.config.get('SQLITE_PRAGMAS')
+    if pragmas:
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+        cursor.close()
+
+
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'hard to guess string'
     SQLALCHEMY_COMMIT_ON_TEARDOWN = True
@@ -13,7 +32,36 @@ class Config:
     MYPYFI_MAIL_SUBJECT_PREFIX = '[MyPyFi]'
     MYPYFI_MAIL_SENDER = 'MyPyFi Admin <MyPyFi@example.com>'
     MYPYFI_ADMIN = os.environ.get('MYPYFI_ADMIN')
-    SQLALCHEMY_TRACK_MODIFICATIONS = True
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    PRICE_SOURCE = 'yahoo'                          # default price source ('file' serves CSVs from PRICE_SOURCE_DIR,
+                                                    # 'fake' deterministic random walks)
+    PRICE_FAKE_LATENCY = 0.0                        # seconds per fetch from the 'fake' source
+    PRICE_MAX_WORKERS = 8                           # concurrent fetches / pooled connections
+    PRICE_TIMEOUT = 10                              # seconds per HTTP request
+    PRICE_RETRIES = 3                               # retries per fetch with exponential backoff
+    PRICE_BACKOFF = 0.5                             # base backoff in seconds
+    PRICE_RATE_LIMITS = {'yahoo': 5.0, 'google': 5.0}   # requests per second per source
+    PRICE_STORE_DIR = os.environ.get('PRICE_STORE_DIR') or \
+        os.path.join(basedir, 'data', 'tickers')    # on-disk ticker store ('store' source)
+    SYMBOL_DIR = os.environ.get('SYMBOL_DIR') or \
+        os.path.join(basedir, 'data', 'symbols')    # listing files of the symbol universe (manage.py symbols)
+    SYMBOL_URLS = ('https://www.nasdaqtrader.com/dynamic/SymDir/nasdaqlisted.txt',
+                   'https://www.nasdaqtrader.com/dynamic/SymDir/otherlisted.txt')   # listings fetched by download
+    FLOAT_DTYPE = 'float64'                         # 'float32' halves return panels, simulated paths and store files
+    PORTFOLIOS_PER_PAGE = 25                        # portfolio listing page size
+    HOLDINGS_PER_PAGE = 50                          # holdings per portfolio page
+    PORTFOLIO_LIST_CACHE_TTL = 30                   # seconds cached listing pages stay valid
+    BOOK_CACHE_TTL = 30                             # seconds holdings book survives writes by other processes
+    JOB_WORKERS = 2                                 # background optimizations / simulations at once
+                                                    # (job registry is per process - serve from one process)
+    JOB_IDLE_TIMEOUT = 30                           # seconds unwatched before a job is cancelled
+    JOB_TTL = 600                                   # seconds finished jobs stay available
+    SHARED_PANEL_DIR = os.environ.get('SHARED_PANEL_DIR')   # e.g. /dev/shm/mypyfi - panels shared across workers
+    SHARED_PANEL_MB = 512                           # shared panel budget before LRU eviction
+    SHARED_PANEL_TTL = 3600                         # seconds a shared panel stays valid
+    MEMORY_PROFILE = os.environ.get('MEMORY_PROFILE') == '1'   # tracemalloc + RSS per analytics stage (slow)
+    MEMORY_PROFILE_TOP = 5                          # allocation sites reported per stage
+    MEMORY_RSS_INTERVAL = 0.05                      # seconds between RSS samples while profiling
 
     @staticmethod
     def init_app(app):
@@ -30,16 +78,48 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'data-test.sqlite')
+    PRICE_SOURCE = 'file'
+    PRICE_SOURCE_DIR = os.environ.get('TEST_PRICE_DIR') or \
+        os.path.join(basedir, 'tests', 'prices')
+
+
+class LoadTestConfig(Config):
+    # scratch database and fake prices for manage.py loadtest
+    WTF_CSRF_ENABLED = False
+    SQLALCHEMY_DATABASE_URI = os.environ.get('LOADTEST_DATABASE_URL') or \
+        'sqlite:///' + os.path.join(tempfile.gettempdir(), 'mypyfi-loadtest.sqlite')
+    PRICE_SOURCE = 'fake'
+
+    @classmethod
+    def init_app(cls, app):
+        # production database settings so measurements carry over
+        ProductionConfig.init_app(app)
 
 
 class ProductionConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'data.sqlite')
+    # WAL lets readers run alongside the single writer
+    SQLITE_PRAGMAS = {'journal_mode': 'WAL', 'synchronous': 'NORMAL', 'cache_size': -64000,
+                      'temp_store': 'MEMORY', 'mmap_size': 268435456, 'busy_timeout': 5000}
+    # pooled engine settings - only applied to server databases
+    SERVER_POOL = {'SQLALCHEMY_POOL_SIZE': 10, 'SQLALCHEMY_MAX_OVERFLOW': 20,
+                   'SQLALCHEMY_POOL_TIMEOUT': 10, 'SQLALCHEMY_POOL_RECYCLE': 1800}
+
+    @classmethod
+    def init_app(cls, app):
+        Config.init_app(app)
+        if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+            app.config.setdefault('SQLITE_PRAGMAS', cls.SQLITE_PRAGMAS)
+        else:
+            for key, value in cls.SERVER_POOL.items():
+                app.config.setdefault(key, value)
 
 
 config = {
     'development': DevelopmentConfig,
     'testing': TestingConfig,
+    'loadtest': LoadTestConfig,
     'production': ProductionConfig,
 
     'default': DevelopmentConfig
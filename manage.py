@@ -1,8 +1,10 @@
 #!/usr/bin/env python
 import os
-from app import create_app, db
+import datetime as dt
+import numpy as np
+from app import create_app, db, prices
 from app.models import Portfolio, Holding
-from flask_script import Manager, Shell
+from flask_script import Manager, Shell, Server, Command, Option
 from flask_migrate import Migrate, MigrateCommand
 
 app = create_app(os.getenv('MYPYFI_CONFIG') or 'default')
@@ -15,6 +17,8 @@ def make_shell_context():
 
 
 manager.add_command("shell", Shell(make_context=make_shell_context))
+# threaded so progress streams do not block other requests
+manager.add_command('runserver', Server(threaded=True))
 manager.add_command('db', MigrateCommand)
 
 
@@ -26,5 +30,250 @@ def test():
     unittest.TextTestRunner(verbosity=2).run(tests)
 
 
+class OptimizeAll(Command):
+    """Optimize every portfolio in one pass and write the _opt portfolios."""
+
+    option_list = (
+        Option('--start', '-s', dest='start_date', default=None,
+               help='Start date for historical returns (YYYY-MM-DD) - Default: 6 months'),
+        Option('--risk-free', '-r', dest='risk_free', type=float, default=1.0,
+               help='Risk-free interest rate ( %% )'),
+        Option('--processes', '-p', dest='processes', type=int, default=None,
+               help='Worker processes - Default: one per core'),
+        Option('--estimator', '-e', dest='estimator', default='sample',
+               choices=['sample', 'ledoit_wolf', 'ewma', 'pca'], help='Covariance estimator'),
+        Option('--max-weight', dest='max_weight', type=float, default=None,
+               help='Maximum weight per holding ( %% )'),
+        Option('--turnover', dest='turnover', type=float, default=0.0,
+               help='Turnover penalty against current holdings'),
+        Option('--allocation', '-a', dest='allocation', default='max_sharpe', choices=['max_sharpe', 'hrp'],
+               help='Allocation engine - hrp ignores weight limits and turnover'),
+    )
+
+    def run(self, start_date, risk_free, processes, estimator, max_weight, turnover, allocation):
+        from app.main.batch import optimize_all
+        from app.main.constraints import PortfolioConstraints
+        if start_date:
+            start_date = dt.datetime.strptime(start_date, '%Y-%m-%d').date()
+        constraints = None
+        if max_weight is not None or turnover:
+            constraints = PortfolioConstraints(max_weight=1.0 if max_weight is None else max_weight / 100.0,
+                                               turnover=turnover)
+        batch = optimize_all(start_date, risk_free / 100.0, processes, estimator, constraints, allocation)
+        for name in sorted(batch.weights):
+            print('{}_opt: {}'.format(name, ', '.join('{} {:.1%}'.format(sym, w)
+                                                      for sym, w in batch.weights[name].items())))
+        for name in sorted(batch.failed):
+            print('{}_opt: skipped - {}'.format(name, batch.failed[name]))
+        print('Optimized {} of {} portfolios'.format(len(batch.weights), len(batch.portfolios)))
+
+
+manager.add_command('optimize-all', OptimizeAll())
+
+
+class Stress(Command):
+    """Stress every portfolio under shock scenarios or replayed history."""
+
+    option_list = (
+        Option('--shock', '-k', dest='shocks', action='append', default=[],
+               help='Scenario of shocks in %% - "AAPL MSFT: -20; XOM: 5" (repeatable)'),
+        Option('--group', '-g', dest='groups', action='append', default=[],
+               help='Group of symbols shocked by name - "TECH: AAPL MSFT GOOG" (repeatable)'),
+        Option('--factor', '-f', dest='factor', action='store_true',
+               help='Treat shocked symbols as factors spread to all holdings by beta'),
+        Option('--replay', dest='replay', default=None,
+               help='Replay every window since this date (YYYY-MM-DD)'),
+        Option('--window', '-w', dest='window', type=int, default=1, help='Replay window in days'),
+        Option('--start', '-s', dest='start_date', default=None,
+               help='Start of returns for factor betas (YYYY-MM-DD) - Default: 1 year'),
+    )
+
+    def run(self, shocks, groups, factor, replay, window, start_date):
+        from app.main.scenarios import ScenarioEngine, parse_shocks, parse_group
+        engine = ScenarioEngine()
+        try:
+            scenarios = [parse_shocks(text) for text in shocks]
+            groups = dict(parse_group(text) for text in groups)
+            returns = []
+            if scenarios and factor:
+                start = dt.datetime.strptime(start_date, '%Y-%m-%d').date() if start_date \
+                    else dt.date.today() - dt.timedelta(weeks=52)
+                returns.append(engine.factor_scenarios(scenarios, start))
+            elif scenarios:
+                returns.append(engine.shock_scenarios(scenarios, groups))
+        except ValueError as e:
+            print(e)
+            return
+        if replay:
+            returns.append(engine.historical_scenarios(dt.datetime.strptime(replay, '%Y-%m-%d').date(),
+                                                       window=window))
+        if not returns:
+            print('Give --shock and/or --replay')
+            return
+        returns = np.vstack(returns)
+        if not len(returns):
+            print('No scenarios - the replay period is shorter than the window')
+            return
+        print('{} portfolios x {} scenarios'.format(len(engine.names), len(returns)))
+        print('{:<25} {:>14} {:>14} {:>8} {:>14} {:>14}'.format('portfolio', 'value', 'worst', 'worst %',
+                                                             'mean', 'best'))
+        for row in engine.summary(returns):
+            print('{name:<25} {value:>14,.2f} {worst:>14,.2f} {worst_percent:>8.1%} {mean:>14,.2f} '
+                  '{best:>14,.2f}'.format(**row))
+
+
+manager.add_command('stress', Stress())
+
+
+class BacktestGrid(Command):
+    """Walk-forward backtest a portfolio over a grid of windows, rebalance periods and costs."""
+
+    option_list = (
+        Option('--portfolio', '-n', dest='name', required=True, help='Portfolio to backtest'),
+        Option('--start', '-s', dest='start_date', default=None,
+               help='Start date for historical returns (YYYY-MM-DD) - Default: 2 years'),
+        Option('--windows', '-w', dest='windows', default='63,126,252',
+               help='Comma-separated estimation windows (trading days)'),
+        Option('--rebalances', '-b', dest='rebalances', default='5,21,63',
+               help='Comma-separated days between rebalances'),
+        Option('--costs', '-c', dest='costs', default='0,10,25',
+               help='Comma-separated transaction costs ( basis points of turnover )'),
+        Option('--risk-free', '-r', dest='risk_free', type=float, default=1.0,
+               help='Risk-free interest rate ( %% )'),
+        Option('--processes', '-p', dest='processes', type=int, default=None,
+               help='Worker processes - Default: one per core'),
+        Option('--top', '-t', dest='top', type=int, default=10, help='Grid points to show'),
+    )
+
+    def run(self, name, start_date, windows, rebalances, costs, risk_free, processes, top):
+        from app.main.backtest import portfolio_grid
+        portfolio = Portfolio.query.filter_by(name=name).first()
+        if portfolio is None:
+            print('No portfolio named {}'.format(name))
+            return
+        start_date = dt.datetime.strptime(start_date, '%Y-%m-%d').date() if start_date \
+            else dt.date.today() - dt.timedelta(weeks=104)
+        results = portfolio_grid(portfolio, start_date, [int(x) for x in windows.split(',')],
+                                 [int(x) for x in rebalances.split(',')],
+                                 [float(x) / 10000.0 for x in costs.split(',')], risk_free / 100.0, processes)
+        print('{} grid points - best {} by Sharpe ratio'.format(len(results), min(top, len(results))))
+        print('{:>7} {:>9} {:>8} {:>9} {:>8} {:>8} {:>9}'.format('window', 'rebalance', 'cost bp', 'annual %',
+                                                               'sharpe', 'max dd %', 'turnover'))
+        for row in results[:top]:
+            if 'error' in row:
+                print('{:>7} {:>9} {:>8.1f}   {}'.format(row['window'], row['rebalance'], row['cost'] * 10000.0,
+                                                       row['error']))
+                continue
+            print('{:>7} {:>9} {:>8.1f} {:>9.2%} {:>8.2f} {:>8.2%} {:>9.2f}'.format(
+                row['window'], row['rebalance'], row['cost'] * 10000.0, row['annual_return'], row['sharpe'],
+                row['max_drawdown'], row['turnover']))
+
+
+manager.add_command('backtest-grid', BacktestGrid())
+
+
+class LoadTestCommand(Command):
+    """Seed a scratch database and drive concurrent traffic through the app with fake prices."""
+
+    option_list = (
+        Option('--portfolios', '-n', dest='portfolios', type=int, default=20, help='Portfolios to seed'),
+        Option('--holdings', '-m', dest='holdings', type=int, default=25, help='Holdings per portfolio'),
+        Option('--concurrency', '-c', dest='concurrency', type=int, default=8, help='Client threads'),
+        Option('--requests', '-r', dest='requests', type=int, default=400, help='Total requests'),
+        Option('--latency', '-l', dest='latency', type=float, default=0.0,
+               help='Seconds per fake price fetch - mimics a remote source'),
+        Option('--db', dest='database', default=None,
+               help='Scratch database URL - Default: LOADTEST_DATABASE_URL or a temp SQLite file'),
+    )
+
+    def run(self, portfolios, holdings, concurrency, requests, latency, database):
+        from app.loadtest import LoadTest
+        # separate app on the 'loadtest' config - never touches the configured database
+        test_app = create_app('loadtest')
+        if database:
+            test_app.config['SQLALCHEMY_DATABASE_URI'] = database
+        test_app.config['PRICE_FAKE_LATENCY'] = latency
+        prices.init_app(test_app)
+        load = LoadTest(test_app, portfolios, holdings, concurrency, requests)
+        print('Seeding {} portfolios x {} holdings into {}'.format(
+            portfolios, holdings, test_app.config['SQLALCHEMY_DATABASE_URI']))
+        load.seed_database()
+        rows = load.run()
+        print('{} requests in {:.1f}s with {} threads'.format(requests, load.elapsed, concurrency))
+        print('{:<15} {:>8} {:>6} {:>8} {:>9} {:>9} {:>9} {:>9} {:>8}'.format(
+            'route', 'requests', 'errors', 'req/s', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms', 'queries'))
+        for row in rows:
+            print('{route:<15} {requests:>8} {errors:>6} {per_second:>8.1f} {p50:>9.1f} {p90:>9.1f} '
+                  '{p99:>9.1f} {max:>9.1f} {queries:>8.1f}'.format(**row))
+
+
+manager.add_command('loadtest', LoadTestCommand())
+
+
+class Report(Command):
+    """Write valuation, optimization, simulation and risk reports for portfolios outside the web app."""
+
+    option_list = (
+        Option('--output', '-o', dest='output', default='reports', help='Output directory'),
+        Option('--portfolio', '-n', dest='names', action='append', default=None,
+               help='Portfolio to report (repeatable) - Default: every portfolio'),
+        Option('--processes', '-p', dest='processes', type=int, default=None,
+               help='Worker processes - Default: one per core'),
+        Option('--minutes', '-m', dest='minutes', type=float, default=None,
+               help='Time window - sections not started by then are skipped'),
+        Option('--start', '-s', dest='start_date', default=None,
+               help='Start date for historical returns (YYYY-MM-DD) - Default: 6 months'),
+        Option('--paths', dest='paths', type=int, default=2500, help='Simulation paths'),
+        Option('--risk-free', '-r', dest='risk_free', type=float, default=1.0,
+               help='Risk-free interest rate ( %% )'),
+        Option('--estimator', '-e', dest='estimator', default='sample',
+               choices=['sample', 'ledoit_wolf', 'ewma', 'pca'], help='Covariance estimator'),
+        Option('--allocation', '-a', dest='allocation', default='max_sharpe', choices=['max_sharpe', 'hrp'],
+               help='Allocation engine for optimal weights'),
+        Option('--formats', '-f', dest='formats', default='html,pdf,json,parquet',
+               help='Comma-separated output formats (html, pdf, json, parquet)'),
+    )
+
+    def run(self, output, names, processes, minutes, start_date, paths, risk_free, estimator, allocation, formats):
+        from app.main.report import report_all
+        if start_date:
+            start_date = dt.datetime.strptime(start_date, '%Y-%m-%d').date()
+        summaries = report_all(os.getenv('MYPYFI_CONFIG') or 'default', output, names, processes, minutes,
+                               start_date=start_date, paths=paths, rf=risk_free / 100.0, estimator=estimator,
+                               allocation=allocation, formats=tuple(formats.split(',')))
+        for summary in summaries:
+            errors = ', '.join(summary.get('errors') or {})
+            print('{:<20} {:<8} {}'.format(summary['name'], summary['status'], errors))
+        print('Reports written to {}'.format(os.path.abspath(output)))
+
+
+manager.add_command('report', Report())
+
+
+class Symbols(Command):
+    """Download listing files for the symbol universe or look symbols up in it."""
+
+    option_list = (
+        Option('--download', '-d', dest='download', action='store_true',
+               help='Fetch listing files from SYMBOL_URLS into SYMBOL_DIR'),
+        Option('--prefix', '-q', dest='prefix', default=None, help='Show symbols starting with prefix'),
+    )
+
+    def run(self, download, prefix):
+        from app import symbols
+        if download:
+            symbols.download()
+            print('Downloaded listings into {}'.format(symbols.directory))
+        elif not symbols.enabled:
+            print('No listing files in {} - run with --download'.format(symbols.directory))
+        if prefix:
+            for row in symbols.complete(prefix, 25):
+                print('{symbol:<8} {exchange:<14} {etf!s:<6} {name}'.format(**row))
+        print('{} symbols listed'.format(len(symbols.current()[0])))
+
+
+manager.add_command('symbols', Symbols())
+
+
 if __name__ == '__main__':
     manager.run()
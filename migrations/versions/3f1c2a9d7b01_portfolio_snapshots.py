@@ -0,0 +1,36 @@
+"""portfolio snapshots
+
+Revision ID: 3f1c2a9d7b01
+Revises: 
+Create Date: 2026-10-19 09:12:44.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d7b01'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('portfolio_snapshots',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('portfolio_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('cash', sa.Float(), nullable=True),
+    sa.Column('market_value', sa.Float(), nullable=True),
+    sa.Column('invested', sa.Float(), nullable=True),
+    sa.Column('total_profit', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['portfolio_id'], ['portfolios.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_portfolio_snapshots_portfolio_date', 'portfolio_snapshots', ['portfolio_id', 'date'], unique=True)
+
+
+def downgrade():
+    op.drop_index('ix_portfolio_snapshots_portfolio_date', table_name='portfolio_snapshots')
+    op.drop_table('portfolio_snapshots')
@@ -0,0 +1,40 @@
+"""holding snapshots
+
+Revision ID: 8a4e6b2c91d3
+Revises: 3f1c2a9d7b01
+Create Date: 2026-10-19 10:02:17.604129
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8a4e6b2c91d3'
+down_revision = '3f1c2a9d7b01'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('holding_snapshots',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('portfolio_id', sa.Integer(), nullable=False),
+    sa.Column('holding_id', sa.Integer(), nullable=True),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('symbol', sa.String(length=6), nullable=True),
+    sa.Column('shares', sa.Integer(), nullable=True),
+    sa.Column('last_price', sa.Float(), nullable=True),
+    sa.Column('purch_price', sa.Float(), nullable=True),
+    sa.Column('market_value', sa.Float(), nullable=True),
+    sa.Column('total_profit', sa.Float(), nullable=True),
+    sa.Column('portfolio_percent', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['portfolio_id'], ['portfolios.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_holding_snapshots_portfolio_date', 'holding_snapshots', ['portfolio_id', 'date'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_holding_snapshots_portfolio_date', table_name='holding_snapshots')
+    op.drop_table('holding_snapshots')
@@ -0,0 +1,30 @@
+"""portfolio listing indexes
+
+Revision ID: c52d8e1f4a77
+Revises: 8a4e6b2c91d3
+Create Date: 2026-10-19 11:26:05.913842
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c52d8e1f4a77'
+down_revision = '8a4e6b2c91d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_portfolios_market_value_id', 'portfolios', ['market_value', 'id'], unique=False)
+    op.create_index('ix_portfolios_total_profit_id', 'portfolios', ['total_profit', 'id'], unique=False)
+    op.create_index('ix_portfolios_profit_percent_id', 'portfolios', ['profit_percent', 'id'], unique=False)
+    op.create_index('ix_holdings_portfolio_percent_id', 'holdings', ['portfolio_id', 'portfolio_percent', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_holdings_portfolio_percent_id', table_name='holdings')
+    op.drop_index('ix_portfolios_profit_percent_id', table_name='portfolios')
+    op.drop_index('ix_portfolios_total_profit_id', table_name='portfolios')
+    op.drop_index('ix_portfolios_market_value_id', table_name='portfolios')
@@ -0,0 +1,28 @@
+"""read path indexes
+
+Revision ID: e7b3f90a2d16
+Revises: c52d8e1f4a77
+Create Date: 2026-10-19 12:40:51.227803
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b3f90a2d16'
+down_revision = 'c52d8e1f4a77'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_holdings_portfolio_symbol', 'holdings', ['portfolio_id', 'symbol'], unique=False)
+    op.create_index('ix_holdings_symbol', 'holdings', ['symbol'], unique=False)
+    op.create_index('ix_ticker_data_symbol_freq', 'ticker_data', ['symbol', 'freq'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_ticker_data_symbol_freq', table_name='ticker_data')
+    op.drop_index('ix_holdings_symbol', table_name='holdings')
+    op.drop_index('ix_holdings_portfolio_symbol', table_name='holdings')
@@ -0,0 +1,61 @@
+import datetime as dt
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import matplotlib
+matplotlib.use('Agg')
+
+from app import create_app, db
+from app.models import Portfolio, Holding
+from app.main import backtest, functions
+from app.main.book import invalidate_book
+from app.main.frontier import frontier_cache
+from app.main.listing import summary_cache
+from app.main.panel import panel_cache
+from app.main.risk import risk_cache
+
+# symbols with price files in tests/prices - business days 2015-01-02 to 2016-12-30
+SYMBOLS = ('AAA', 'BBB', 'CCC', 'DDD', 'EEE')
+START = dt.date(2016, 1, 1)
+
+
+class AppTestCase(unittest.TestCase):
+    # 'testing' app - file price source and a scratch database per test
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        # charts go to <tmp>/static instead of app/static
+        os.mkdir(os.path.join(self.tmp, 'static'))
+        self.charts = mock.patch.multiple(functions, basedir=os.path.join(self.tmp, 'main'))
+        self.backtest_charts = mock.patch.multiple(backtest, basedir=os.path.join(self.tmp, 'main'))
+        self.charts.start()
+        self.backtest_charts.start()
+        self.app = create_app('testing')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(self.tmp, 'test.sqlite')
+        self.app.config['WTF_CSRF_ENABLED'] = False
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        for cache in (frontier_cache, summary_cache, panel_cache, risk_cache):
+            cache.clear()
+        invalidate_book()
+        self.charts.stop()
+        self.backtest_charts.stop()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def add_portfolio(self, name='test', symbols=SYMBOLS[:4], cash=1000.0):
+        # portfolio holding 10, 20, ... shares of each symbol bought a month apart
+        portfolio = Portfolio(name=name, cash=cash)
+        db.session.add(portfolio)
+        db.session.commit()
+        for i, symbol in enumerate(symbols):
+            Holding(symbol, 10 * (i + 1), dt.date(2016, 1, 4) + dt.timedelta(days=30 * i), 40.0, portfolio.id)
+        portfolio.update()
+        return portfolio
@@ -0,0 +1,91 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import numpy as np
+
+from tests.base import AppTestCase, START
+from app import shared
+from app.prices import PriceSourceError
+from app.main.constraints import OptimizationError
+from app.main.backtest import RollingMoments, walk_forward, grid_search, portfolio_grid
+
+
+class BacktestTestCase(AppTestCase):
+    def setUp(self):
+        super(BacktestTestCase, self).setUp()
+        self.portfolio = self.add_portfolio(symbols=('AAA', 'BBB', 'CCC', 'DDD'))
+        self.rets = np.random.RandomState(1).normal(0.0004, 0.01, (300, 4))
+
+    def test_rolling_moments_match_window(self):
+        moments = RollingMoments(self.rets, 60)
+        for end in (60, 75, 200, 290):
+            moments.advance(end)
+            block = self.rets[end - 60:end]
+            np.testing.assert_allclose(moments.mean(), block.mean(axis=0))
+            np.testing.assert_allclose(moments.cov(), np.cov(block, rowvar=False), atol=1e-12)
+
+    def test_walk_forward_costs_reduce_return(self):
+        free, free_stats = walk_forward(self.rets, 60, 20, 0.0)
+        paid, paid_stats = walk_forward(self.rets, 60, 20, 0.01)
+        self.assertEqual(len(free), len(self.rets) - 60 + 1)
+        self.assertEqual(free[0], 1.0)
+        self.assertLess(paid_stats['total_return'], free_stats['total_return'])
+        self.assertAlmostEqual(paid_stats['turnover'], free_stats['turnover'])
+
+    def test_grid_search_matches_single_runs(self):
+        results = grid_search(self.rets, [60, 120], [20], [0.0, 0.001], processes=2)
+        self.assertEqual([(r['window'], r['cost']) for r in results], [(60, 0.0), (60, 0.001), (120, 0.0), (120, 0.001)])
+        for result in results:
+            _, stats = walk_forward(self.rets, result['window'], result['rebalance'], result['cost'])
+            self.assertAlmostEqual(result['sharpe'], stats['sharpe'])
+
+    def test_portfolio_grid_sorted_by_sharpe(self):
+        results = portfolio_grid(self.portfolio, START, [63, 126, 1000], [21], [0.0], processes=2)
+        # the window longer than the history is dropped
+        self.assertEqual(sorted(r['window'] for r in results), [63, 126])
+        self.assertGreaterEqual(results[0]['sharpe'], results[-1]['sharpe'])
+        with self.assertRaises(ValueError):
+            portfolio_grid(self.portfolio, START, [1000], [21], [0.0])
+
+    def test_view_reports_missing_prices(self):
+        client = self.app.test_client()
+        data = {'start_date': START.isoformat(), 'window': '63', 'rebalance': '21', 'cost': '10', 'risk_free': '1'}
+        response = client.post('/portfolio/test/backtest', data=data)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('backtest.png', response.get_data(as_text=True))
+        with mock.patch('app.main.backtest.return_panel', side_effect=PriceSourceError('no data')):
+            response = client.post('/portfolio/test/backtest', data=data)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('No price data found for the holdings of test!', response.get_data(as_text=True))
+
+    def test_view_reports_optimizer_failure(self):
+        data = {'start_date': START.isoformat(), 'window': '63', 'rebalance': '21', 'cost': '10', 'risk_free': '1'}
+        with mock.patch('app.main.backtest.walk_forward', side_effect=OptimizationError('Optimizer failed: singular')):
+            response = self.app.test_client().post('/portfolio/test/backtest', data=data)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Optimizer failed: singular', response.get_data(as_text=True))
+
+    def test_grid_search_keeps_other_points(self):
+        def degenerate(rets, window, *args):
+            if window == 120:
+                raise OptimizationError('Optimizer failed: singular')
+            return walk_forward(rets, window, *args)
+        # threads instead of processes so the patched walk_forward is the one run
+        with mock.patch('app.main.backtest.ProcessPoolExecutor', ThreadPoolExecutor), \
+                mock.patch('app.main.backtest.walk_forward', side_effect=degenerate):
+            results = portfolio_grid(self.portfolio, START, [63, 120], [21], [0.0, 0.001], processes=2)
+        self.assertEqual([r['window'] for r in results], [63, 63, 120, 120])
+        self.assertEqual(results[-1]['error'], 'Optimizer failed: singular')
+        self.assertNotIn('error', results[0])
+
+    def test_grid_search_releases_shared_panel(self):
+        shared.directory = os.path.join(self.tmp, 'shared')
+        os.makedirs(shared.directory)
+        try:
+            results = grid_search(self.rets, [60], [20, 40], [0.0], processes=2)
+            self.assertEqual(len(results), 2)
+            with shared.index(write=False) as entries:
+                self.assertEqual([entry['refs'] for entry in entries.values()], [{}])
+        finally:
+            shared.directory = None
@@ -0,0 +1,109 @@
+import datetime as dt
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from tests.base import AppTestCase, SYMBOLS, START
+from app import db, prices
+from app.models import Portfolio, PortfolioSnapshot
+from app.main.batch import BatchOptimizer, optimize_all, solve_max_sharpe, solve_chunk
+from app.main.panel import return_panel
+from app.main.constraints import OptimizationError, PortfolioConstraints
+
+
+class SolverTestCase(unittest.TestCase):
+    def test_matches_closed_form_tangency(self):
+        # uncorrelated assets - tangency weights are (mu - rf) / var, normalized
+        mu, var, rf = np.array([0.08, 0.10, 0.12]), np.array([0.04, 0.05, 0.09]), 0.01
+        expected = (mu - rf) / var
+        weights = solve_max_sharpe((mu, np.diag(var), rf))
+        np.testing.assert_allclose(weights, expected / expected.sum(), atol=1e-3)
+
+    def test_bad_warm_start_is_retried(self):
+        mu, cov = np.array([0.08, 0.10]), np.diag([0.04, 0.05])
+        weights = solve_max_sharpe((mu, cov, 0.01, np.array([np.nan, np.nan])))
+        self.assertAlmostEqual(weights.sum(), 1.0)
+
+    def test_failure_raises(self):
+        with self.assertRaises(OptimizationError):
+            solve_max_sharpe((np.array([0.1, np.nan]), np.eye(2), 0.0))
+
+    def test_chunk_returns_failures(self):
+        good = (np.array([0.08, 0.10]), np.diag([0.04, 0.05]), 0.01)
+        bad = (np.array([0.1, np.nan]), np.eye(2), 0.0)
+        results = solve_chunk([good, bad, good])
+        self.assertIsInstance(results[1], OptimizationError)
+        self.assertAlmostEqual(results[2].sum(), 1.0)
+
+
+class BatchTestCase(AppTestCase):
+    def setUp(self):
+        super(BatchTestCase, self).setUp()
+        self.first = self.add_portfolio('first')
+        self.second = self.add_portfolio('second', ('BBB', 'CCC', 'EEE'))
+
+    def test_optimize_all(self):
+        batch = optimize_all(START, 0.01, processes=1)
+        self.assertEqual(sorted(batch.weights), ['first', 'second'])
+        for name, weights in batch.weights.items():
+            self.assertAlmostEqual(sum(weights.values()), 1.0, places=6)
+            optimal = Portfolio.query.filter_by(name=name + '_opt').one()
+            original = Portfolio.query.filter_by(name=name).one()
+            self.assertAlmostEqual(optimal.market_value, original.market_value)
+            self.assertGreaterEqual(optimal.cash, 0)
+
+    def test_moments_use_each_portfolio_history(self):
+        # EEE only lists in June - 'first' does not hold it and keeps its whole window
+        get_panel = prices.get_panel
+
+        def late_listing(symbols, start=None, end=None):
+            data = get_panel(symbols, start, end)
+            if 'EEE' in data:
+                data.loc[data.index < '2016-06-01', 'EEE'] = float('nan')
+            return data
+        with mock.patch.object(prices, 'get_panel', side_effect=late_listing) as fetched:
+            batch = BatchOptimizer(start_date=START, processes=1)
+            batch.build_panel()
+        self.assertEqual(fetched.call_count, 1)
+        mu, cov = batch.moments['first']
+        rets = return_panel(list(SYMBOLS[:4]), START)
+        self.assertEqual(rets.index[0], pd.Timestamp('2016-01-04'))
+        np.testing.assert_allclose(mu, rets.mean().values * 252)
+        np.testing.assert_allclose(cov.dense(), np.cov(rets.values, rowvar=False) * 252)
+
+    def test_failed_portfolios_are_skipped(self):
+        batch = BatchOptimizer(start_date=START, processes=1)
+        batch.optimize()
+        del batch.weights['second']
+        batch.failed['second'] = 'Optimizer failed'
+        self.assertEqual(batch.write_optimal_portfolios(), 1)
+        self.assertIsNotNone(Portfolio.query.filter_by(name='first_opt').first())
+        self.assertIsNone(Portfolio.query.filter_by(name='second_opt').first())
+
+    def test_restaging_keeps_history(self):
+        optimize_all(START, 0.01, processes=1)
+        optimal = Portfolio.query.filter_by(name='first_opt').one()
+        past = dt.date.today() - dt.timedelta(days=3)
+        db.session.add(PortfolioSnapshot(portfolio_id=optimal.id, date=past, market_value=1.0))
+        db.session.commit()
+        optimize_all(START, 0.05, processes=1)
+        self.assertEqual(PortfolioSnapshot.query.filter_by(portfolio_id=optimal.id, date=past).count(), 1)
+
+    def test_infeasible_limits_skip_portfolio(self):
+        # three holdings can not be fully invested at 30% each - four can
+        batch = BatchOptimizer(start_date=START, processes=1, constraints=PortfolioConstraints(max_weight=0.3))
+        batch.optimize()
+        self.assertEqual(sorted(batch.weights), ['first'])
+        self.assertIn('second', batch.failed)
+        self.assertTrue(all(w <= 0.3 + 1e-6 for w in batch.weights['first'].values()))
+
+    def test_missing_last_price_skips_portfolio(self):
+        batch = BatchOptimizer(start_date=START, processes=1)
+        batch.optimize()
+        batch.last_prices['EEE'] = float('nan')
+        self.assertEqual(batch.write_optimal_portfolios(), 1)
+        self.assertEqual(sorted(batch.weights), ['first'])
+        self.assertIn('second', batch.failed)
+        self.assertIsNone(Portfolio.query.filter_by(name='second_opt').first())
@@ -0,0 +1,59 @@
+import datetime as dt
+from unittest import mock
+
+import numpy as np
+
+from tests.base import AppTestCase, SYMBOLS
+from app import db
+from app.models import Portfolio, Holding
+from app.main import book
+from app.main.book import HoldingsBook, holdings_book, book_cache
+
+
+class HoldingsBookTestCase(AppTestCase):
+    def setUp(self):
+        super(HoldingsBookTestCase, self).setUp()
+        self.first = self.add_portfolio('first', SYMBOLS[:3])
+        self.second = self.add_portfolio('second', SYMBOLS[2:])
+        book.invalidate_book()
+
+    def test_scoped_load_matches_full_book(self):
+        full = HoldingsBook.load()
+        scoped = HoldingsBook.load([self.first.id])
+        self.assertEqual(list(scoped.names), [self.first.id])
+        self.assertEqual(scoped.rows(self.second.id), slice(0, 0))
+        self.assertEqual(scoped.symbols_of(self.first.id), full.symbols_of(self.first.id))
+        np.testing.assert_allclose(scoped.weights(self.first.id, SYMBOLS), full.weights(self.first.id, SYMBOLS))
+        np.testing.assert_allclose(scoped.percents(self.first.id), full.percents(self.first.id))
+
+    def test_single_portfolio_does_not_load_others(self):
+        with mock.patch.object(HoldingsBook, 'load', wraps=HoldingsBook.load) as load:
+            scoped = holdings_book([self.first.id])
+            self.assertIs(holdings_book([self.first.id]), scoped)
+        load.assert_called_once_with((self.first.id,))
+        self.assertEqual(list(scoped.names), [self.first.id])
+
+    def test_cached_full_book_answers_scoped_questions(self):
+        full = holdings_book()
+        with mock.patch.object(HoldingsBook, 'load', side_effect=AssertionError('reloaded')):
+            self.assertIs(holdings_book([self.second.id]), full)
+
+    def test_write_drops_every_snapshot(self):
+        holdings_book([self.first.id])
+        holdings_book([self.second.id])
+        self.assertEqual(len(book_cache), 2)
+        Holding('EEE', 5, dt.date(2016, 3, 1), 40.0, self.first.id)
+        self.assertEqual(len(book_cache), 0)
+        self.assertIn('EEE', holdings_book([self.first.id]).symbols_of(self.first.id))
+
+    def test_percents_without_value(self):
+        empty = HoldingsBook([(1, 7, 'AAA', 10, 40.0, None, None, None)], [(7, 'empty', 0.0, 0.0)])
+        np.testing.assert_array_equal(empty.percents(7), [0.0])
+
+
+class EmptyPortfolioPageTestCase(AppTestCase):
+    def test_portfolio_without_value(self):
+        db.session.add(Portfolio(name='empty', cash=0.0))
+        db.session.commit()
+        response = self.app.test_client().get('/portfolio/empty')
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,70 @@
+import unittest
+
+import numpy as np
+
+from app.main.constraints import PortfolioConstraints, OptimizationError, parse_groups, start_weights, \
+    solve_constrained, round_shares
+
+
+class ConstraintsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.mu = np.array([0.08, 0.10, 0.12, 0.09])
+        self.cov = np.diag([0.04, 0.05, 0.09, 0.03])
+
+    def test_problem(self):
+        constraints = PortfolioConstraints(min_weight={'A': 0.1}, max_weight=0.5,
+                                           groups={'g': (['B', 'C', 'X'], 0.4)})
+        lo, hi, groups, caps = constraints.problem(['A', 'B', 'C', 'D'])
+        np.testing.assert_allclose(lo, [0.1, 0, 0, 0])
+        np.testing.assert_allclose(hi, [0.5] * 4)
+        np.testing.assert_allclose(groups.toarray(), [[0, 1, 1, 0]])
+        np.testing.assert_allclose(caps, [0.4])
+        with self.assertRaises(ValueError):
+            PortfolioConstraints(max_weight=0.3).problem(['A', 'B', 'C'])
+
+    def test_parse_groups(self):
+        self.assertEqual(parse_groups('aapl, msft: 40; XOM CVX: 25'),
+                         {'group 1': (['AAPL', 'MSFT'], 0.4), 'group 2': (['XOM', 'CVX'], 0.25)})
+        self.assertEqual(parse_groups(''), {})
+        for text in ('AAPL 40', 'AAPL: lots', 'AAPL: 140'):
+            with self.assertRaises(ValueError):
+                parse_groups(text)
+
+    def test_start_weights_inside_bounds(self):
+        lo, hi = np.zeros(4), np.full(4, 0.3)
+        x0 = start_weights(np.array([0.7, 0.1, 0.1, 0.1]), lo, hi)
+        self.assertAlmostEqual(x0.sum(), 1.0)
+        self.assertTrue((x0 <= hi + 1e-12).all())
+
+    def test_solve_respects_limits(self):
+        constraints = PortfolioConstraints(max_weight=0.35, groups={'g': (['B', 'C'], 0.4)})
+        problem = constraints.problem(['A', 'B', 'C', 'D'])
+        weights = solve_constrained((self.mu, self.cov, 0.01, problem, 0.0, None))
+        self.assertAlmostEqual(weights.sum(), 1.0, places=6)
+        self.assertTrue((weights <= 0.35 + 1e-6).all())
+        self.assertLessEqual(weights[1] + weights[2], 0.4 + 1e-6)
+
+    def test_turnover_penalty_stays_near_current(self):
+        problem = PortfolioConstraints().problem(['A', 'B', 'C', 'D'])
+        current = np.array([0.25, 0.25, 0.25, 0.25])
+        free = solve_constrained((self.mu, self.cov, 0.01, problem, 0.0, current))
+        held = solve_constrained((self.mu, self.cov, 0.01, problem, 5.0, current))
+        self.assertLess(np.abs(held - current).sum(), np.abs(free - current).sum())
+
+    def test_failed_solve_raises(self):
+        problem = PortfolioConstraints(max_weight=0.6).problem(['A', 'B'])
+        with self.assertRaises(OptimizationError):
+            solve_constrained((np.array([0.1, np.nan]), np.eye(2), 0.0, problem, 0.0, None))
+
+    def test_round_shares(self):
+        prices = np.array([10.0, 33.0, 7.5])
+        shares = round_shares([0.5, 0.3, 0.2], prices, 1000.0)
+        self.assertLessEqual(shares.dot(prices), 1000.0)
+        np.testing.assert_allclose(shares * prices / 1000.0, [0.5, 0.3, 0.2], atol=0.04)
+        capped = round_shares([0.5, 0.3, 0.2], prices, 1000.0, np.array([0.45, 1.0, 1.0]))
+        self.assertLessEqual(capped[0] * 10.0, 450.0)
+
+    def test_round_shares_rejects_unusable_prices(self):
+        for prices in ([10.0, np.nan], [10.0, 0.0], [10.0, -1.0], [np.inf, 5.0]):
+            with self.assertRaises(ValueError):
+                round_shares([0.5, 0.5], prices, 1000.0)
@@ -0,0 +1,76 @@
+import unittest
+
+import numpy as np
+
+from app.main.estimators import ESTIMATORS, CovarianceEstimate, FactorCovariance, estimate_covariance, \
+    as_estimate, estimate_arrays, from_arrays, cov_root
+
+
+class EstimatorTestCase(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(7)
+        factors = rng.normal(0.0, 0.01, (250, 2))
+        self.rets = factors.dot(rng.uniform(0.5, 1.5, (2, 8))) + rng.normal(0.0, 0.005, (250, 8))
+        self.weights = rng.dirichlet(np.ones(8), 3)
+
+    def test_sample_matches_numpy(self):
+        np.testing.assert_allclose(estimate_covariance(self.rets).dense(), np.cov(self.rets, rowvar=False))
+
+    def test_shrinkage_keeps_trace_and_pulls_to_identity(self):
+        sample = estimate_covariance(self.rets).dense()
+        shrunk = estimate_covariance(self.rets, 'ledoit_wolf').dense()
+        self.assertAlmostEqual(np.trace(shrunk), np.trace(sample))
+        off = ~np.eye(8, dtype=bool)
+        self.assertLess(np.abs(shrunk[off]).sum(), np.abs(sample[off]).sum())
+
+    def test_ewma_without_decay_is_population_covariance(self):
+        np.testing.assert_allclose(estimate_covariance(self.rets, 'ewma', decay=1.0).dense(),
+                                   np.cov(self.rets, rowvar=False, bias=True))
+
+    def test_interface_agrees_with_dense(self):
+        # every estimator answers variance / product / subset / scaled like its dense matrix
+        for name in ESTIMATORS:
+            estimate = estimate_covariance(self.rets, name)
+            cov = estimate.dense()
+            np.testing.assert_allclose(cov, cov.T, atol=1e-15, err_msg=name)
+            np.testing.assert_allclose(estimate.variance(self.weights),
+                                       np.einsum('ij,jk,ik->i', self.weights, cov, self.weights), err_msg=name)
+            np.testing.assert_allclose(estimate.product(self.weights), self.weights.dot(cov), err_msg=name)
+            idx = [1, 4, 6]
+            np.testing.assert_allclose(estimate.subset(idx).dense(), cov[np.ix_(idx, idx)], err_msg=name)
+            np.testing.assert_allclose(estimate.scaled(252).dense(), cov * 252, err_msg=name)
+
+    def test_draws_have_estimated_covariance(self):
+        for name in ('sample', 'pca'):
+            estimate = estimate_covariance(self.rets, name)
+            draws = estimate.sample(200000, np.random.RandomState(0))
+            self.assertEqual(draws.shape, (200000, 8))
+            np.testing.assert_allclose(np.cov(draws, rowvar=False), estimate.dense(), atol=2e-6, err_msg=name)
+
+    def test_pca_is_low_rank_plus_diagonal(self):
+        estimate = estimate_covariance(self.rets, 'pca', factors=2)
+        self.assertIsInstance(estimate, FactorCovariance)
+        self.assertEqual(estimate.loadings.shape, (8, 2))
+        self.assertEqual(estimate.dims, 10)
+        # total variance of each symbol is kept
+        np.testing.assert_allclose(np.diag(estimate.dense()), self.rets.var(axis=0, ddof=1))
+
+    def test_unknown_estimator(self):
+        with self.assertRaises(ValueError):
+            estimate_covariance(self.rets, 'nope')
+
+    def test_round_trip_arrays(self):
+        for name in ('sample', 'pca'):
+            estimate = estimate_covariance(self.rets, name)
+            again = from_arrays(estimate_arrays(estimate))
+            self.assertIs(type(again), type(estimate))
+            np.testing.assert_allclose(again.dense(), estimate.dense())
+        cov = np.cov(self.rets, rowvar=False)
+        self.assertIsInstance(as_estimate(cov), CovarianceEstimate)
+        estimate = as_estimate(cov)
+        self.assertIs(as_estimate(estimate), estimate)
+
+    def test_cov_root_of_singular_matrix(self):
+        cov = np.ones((3, 3))
+        root = cov_root(cov)
+        np.testing.assert_allclose(root.dot(root.T), cov, atol=1e-12)
@@ -0,0 +1,46 @@
+from unittest import mock
+
+import numpy as np
+
+from tests.base import AppTestCase, START
+from app.models import Portfolio
+from app.main.batch import solve_max_sharpe
+from app.main.estimators import CovarianceEstimate
+from app.main.frontier import frontier_cache, frontier_key, tangency_portfolio
+from app.main.functions import OptimizedPortfolio
+
+
+class FrontierTestCase(AppTestCase):
+    def setUp(self):
+        super(FrontierTestCase, self).setUp()
+        self.portfolio = self.add_portfolio(symbols=('AAA', 'BBB', 'CCC', 'DDD'))
+
+    def test_key_leaves_out_risk_free_rate(self):
+        key = frontier_key(['AAA', 'BBB'], START, None, 'sample', 'pseudo', 500, (0.0, 1.0))
+        self.assertEqual(key, frontier_key(['AAA', 'BBB'], START, None, 'sample', 'pseudo', 500, (0.0, 1.0)))
+        self.assertNotEqual(key, frontier_key(['AAA', 'BBB'], START, None, 'ewma', 'pseudo', 500, (0.0, 1.0)))
+
+    def test_tangency_warm_start(self):
+        mu = np.array([0.08, 0.12, 0.10])
+        cov = CovarianceEstimate(np.array([[0.04, 0.01, 0.0], [0.01, 0.09, 0.02], [0.0, 0.02, 0.06]]))
+        frontier = {'symbols': ['A', 'B', 'C'], 'mu': mu, 'cov': cov, 'weights': None}
+        for rf in (0.01, 0.03, 0.02):
+            weights, ret, vol = tangency_portfolio(frontier, rf)
+            # warm-started solve lands on the cold-start tangency and is kept for the next rate
+            np.testing.assert_allclose(weights, solve_max_sharpe((mu, cov, rf)), atol=1e-3)
+            self.assertIs(frontier['weights'], weights)
+            self.assertAlmostEqual(ret, weights.dot(mu))
+            self.assertAlmostEqual(vol, np.sqrt(weights.dot(cov.dense()).dot(weights)))
+
+    def test_new_rate_reuses_frontier(self):
+        build = OptimizedPortfolio.build_frontier
+        with mock.patch.object(OptimizedPortfolio, 'build_frontier', autospec=True, side_effect=build) as built:
+            first = OptimizedPortfolio(self.portfolio, START, rf=0.01, samples=100)
+            second = OptimizedPortfolio(self.portfolio, START, rf=0.05, samples=100)
+            self.assertEqual(built.call_count, 1)
+            self.assertIs(first.frontier, second.frontier)
+            OptimizedPortfolio(self.portfolio, START, rf=0.01, samples=100, estimator='ledoit_wolf')
+            self.assertEqual(built.call_count, 2)
+        self.assertEqual(len(frontier_cache), 2)
+        self.assertAlmostEqual(sum(second.weights), 1.0)
+        self.assertIsNotNone(Portfolio.query.filter_by(name='test_opt').first())
@@ -0,0 +1,67 @@
+from unittest import mock
+
+from tests.base import AppTestCase
+from app import prices
+from app.models import Portfolio, Holding
+
+
+class HoldingEditTestCase(AppTestCase):
+    def setUp(self):
+        super(HoldingEditTestCase, self).setUp()
+        self.portfolio = self.add_portfolio(symbols=('AAA', 'BBB', 'CCC'))
+        self.client = self.app.test_client()
+        with self.client.session_transaction() as sess:
+            sess['portfolio'] = 'test'
+
+    def aggregates(self):
+        portfolio = Portfolio.query.filter_by(name='test').one()
+        percents = sorted((h.id, h.portfolio_percent) for h in Holding.query.filter_by(portfolio_id=portfolio.id))
+        return (round(portfolio.market_value, 6), round(portfolio.invested, 6), portfolio.num_holdings,
+                round(portfolio.total_profit, 6), portfolio.profit_percent, percents)
+
+    def assertMatchesFullRefresh(self):
+        # incremental aggregates equal a full re-walk of every holding
+        incremental = self.aggregates()
+        Portfolio.query.filter_by(name='test').one().update()
+        self.assertEqual(incremental, self.aggregates())
+
+    def test_add_holding(self):
+        response = self.client.post('/portfolio/test/holding_add', data={
+            'symbol': ' ddd ', 'shares': '15', 'purch_date': '2016-05-02', 'purch_price': '41.5'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Holding.query.filter_by(symbol='DDD').one().shares, 15)
+        self.assertEqual(self.aggregates()[2], 4)
+        self.assertMatchesFullRefresh()
+
+    def test_edit_holding_without_price_fetch(self):
+        holding = Holding.query.filter_by(symbol='BBB').one()
+        with mock.patch.object(prices, 'last_price', side_effect=AssertionError('priced')):
+            response = self.client.post('/portfolio/test/BBB/holding_edit/{}'.format(holding.id), data={
+                'new_shares': '35', 'new_purch_price': '38.25', 'new_purch_date': ''})
+        self.assertEqual(response.status_code, 302)
+        holding = Holding.query.filter_by(symbol='BBB').one()
+        self.assertEqual((holding.shares, holding.purch_price), (35, 38.25))
+        self.assertMatchesFullRefresh()
+
+    def test_edit_to_zero_shares_drops_holding(self):
+        holding = Holding.query.filter_by(symbol='AAA').one()
+        self.client.post('/portfolio/test/AAA/holding_edit/{}'.format(holding.id), data={'new_shares': '0'})
+        self.assertIsNone(Holding.query.filter_by(symbol='AAA').first())
+        self.assertEqual(self.aggregates()[2], 2)
+        self.assertMatchesFullRefresh()
+
+    def test_delete_holding(self):
+        holding = Holding.query.filter_by(symbol='CCC').one()
+        response = self.client.get('/holding/{}/delete'.format(holding.id))
+        self.assertEqual(response.status_code, 302)
+        self.assertIsNone(Holding.query.filter_by(symbol='CCC').first())
+        self.assertMatchesFullRefresh()
+
+    def test_failed_add_leaves_no_row(self):
+        before = self.aggregates()
+        with mock.patch.object(Portfolio, 'apply_delta', side_effect=RuntimeError('lost connection')):
+            with self.assertRaises(RuntimeError):
+                self.client.post('/portfolio/test/holding_add', data={
+                    'symbol': 'DDD', 'shares': '15', 'purch_date': '2016-05-02', 'purch_price': '41.5'})
+        self.assertIsNone(Holding.query.filter_by(symbol='DDD').first())
+        self.assertEqual(self.aggregates(), before)
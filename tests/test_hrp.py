@@ -0,0 +1,58 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from tests.base import AppTestCase, START
+from app.main.frontier import frontier_cache
+from app.main.functions import OptimizedPortfolio
+from app.main.hrp import hrp_weights, cluster_order, correlation_distance
+
+
+class HRPWeightsTestCase(unittest.TestCase):
+    def test_weights_sum_to_one(self):
+        rng = np.random.RandomState(3)
+        rets = rng.normal(0, 0.01, (250, 6))
+        weights = hrp_weights(np.cov(rets, rowvar=False))
+        self.assertAlmostEqual(weights.sum(), 1.0)
+        self.assertTrue((weights > 0).all())
+
+    def test_uncorrelated_is_inverse_variance(self):
+        cov = np.diag([0.01, 0.04, 0.09, 0.16])
+        inverse = 1.0 / np.diag(cov)
+        np.testing.assert_allclose(hrp_weights(cov), inverse / inverse.sum())
+
+    def test_clusters_correlated_symbols(self):
+        # two pairs of near-identical symbols end up next to each other
+        cov = np.array([[1.0, 0.0, 0.9, 0.0], [0.0, 1.0, 0.0, 0.9], [0.9, 0.0, 1.0, 0.0], [0.0, 0.9, 0.0, 1.0]])
+        order = list(cluster_order(correlation_distance(cov)))
+        self.assertEqual(abs(order.index(0) - order.index(2)), 1)
+        self.assertEqual(abs(order.index(1) - order.index(3)), 1)
+
+    def test_singular_covariance(self):
+        cov = np.ones((3, 3)) * 0.04
+        weights = hrp_weights(cov)
+        self.assertTrue(np.isfinite(weights).all())
+        self.assertAlmostEqual(weights.sum(), 1.0)
+
+
+class HRPOptimizeTestCase(AppTestCase):
+    def setUp(self):
+        super(HRPOptimizeTestCase, self).setUp()
+        self.portfolio = self.add_portfolio(symbols=('AAA', 'BBB', 'CCC', 'DDD'))
+
+    def test_skips_frontier(self):
+        with mock.patch.object(OptimizedPortfolio, 'build_frontier', side_effect=AssertionError('traced')):
+            first = OptimizedPortfolio(self.portfolio, START, samples=100, allocation='hrp')
+            second = OptimizedPortfolio(self.portfolio, START, samples=100, allocation='hrp')
+        self.assertIs(first.frontier, second.frontier)
+        self.assertEqual(len(first.frontier['rets']), 0)
+        self.assertAlmostEqual(sum(first.weights), 1.0)
+        np.testing.assert_allclose(first.weights, hrp_weights(first.frontier['cov']))
+
+    def test_reuses_traced_frontier(self):
+        traced = OptimizedPortfolio(self.portfolio, START, samples=100)
+        with mock.patch.object(OptimizedPortfolio, 'load_moments', side_effect=AssertionError('reloaded')):
+            parity = OptimizedPortfolio(self.portfolio, START, samples=100, allocation='hrp')
+        self.assertIs(parity.frontier, traced.frontier)
+        self.assertEqual(len(frontier_cache), 1)
@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+
+import matplotlib.pyplot as plt
+
+from tests.base import AppTestCase, START
+from app import jobs
+from app.jobs import Job, JobManager, JobCancelled
+from app.main.functions import optimize_portfolio
+
+
+def wait(job, timeout=30):
+    deadline = time.time() + timeout
+    while job.status == 'running' and time.time() < deadline:
+        time.sleep(0.01)
+    return job.status
+
+
+class JobTestCase(AppTestCase):
+    def setUp(self):
+        super(JobTestCase, self).setUp()
+        self.manager = JobManager(self.app)
+
+    def test_report_and_state(self):
+        job = Job('work', redirect='/done')
+        job.report(3, 10, 'Working')
+        state = job.state()
+        self.assertEqual((state['done'], state['total'], state['message']), (3, 10, 'Working'))
+        self.assertIsNone(state['redirect'])
+        job.finish('done', result=42)
+        self.assertEqual((job.state()['result'], job.state()['redirect']), (42, '/done'))
+
+    def test_cancel_and_idle_timeout(self):
+        job = Job('work')
+        job.cancel()
+        with self.assertRaises(JobCancelled):
+            job.report(1)
+        idle = Job('idle', idle_timeout=0.01)
+        idle.seen -= 1
+        with self.assertRaises(JobCancelled):
+            idle.report(1)
+
+    def test_manager_outcomes(self):
+        done = self.manager.submit('done', lambda x, progress: x * 2, 21)
+        failed = self.manager.submit('failed', lambda progress: 1 / 0)
+        self.assertEqual(wait(done), 'done')
+        self.assertEqual(done.result, 42)
+        self.assertEqual(wait(failed), 'failed')
+        self.assertIn('division', failed.error)
+        self.assertIs(self.manager.get(done.id), done)
+
+        started = threading.Event()
+
+        def slow(progress):
+            started.set()
+            for i in range(1000):
+                progress(i, 1000)
+                time.sleep(0.005)
+        job = self.manager.submit('slow', slow)
+        started.wait(5)
+        job.cancel()
+        self.assertEqual(wait(job), 'cancelled')
+
+    def test_finished_jobs_expire(self):
+        self.manager.ttl = 0
+        job = self.manager.submit('quick', lambda progress: None)
+        wait(job)
+        job.finished -= 1
+        self.manager.submit('next', lambda progress: None)
+        self.assertIsNone(self.manager.get(job.id))
+
+    def test_stream_ends_with_status(self):
+        job = self.manager.submit('quick', lambda progress: 'ok')
+        events = list(job.stream(heartbeat=0.05))
+        self.assertTrue(events[-1].startswith('event: end'))
+        self.assertIn('"status": "done"', events[-1])
+
+    def test_concurrent_optimizations_plot_independently(self):
+        for name in ('one', 'two'):
+            self.add_portfolio(name, symbols=('AAA', 'BBB', 'CCC', 'DDD'))
+        # the app's own manager - job threads need the blueprint's engines
+        submitted = [jobs.submit('Optimizing ' + name, optimize_portfolio, name, START, 0.01)
+                     for name in ('one', 'two')]
+        for job in submitted:
+            self.assertEqual(wait(job, 120), 'done', job.error)
+        self.assertEqual(plt.get_fignums(), [])
+        self.assertTrue(os.path.exists(os.path.join(self.tmp, 'static', 'optimized_portfolio.png')))
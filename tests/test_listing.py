@@ -0,0 +1,89 @@
+import json
+
+from tests.base import AppTestCase
+from app import db
+from app.models import Portfolio, Holding
+from app.main.listing import CursorError, decode_cursor, encode_cursor, portfolio_page, holding_page
+
+
+class ListingTestCase(AppTestCase):
+    def setUp(self):
+        super(ListingTestCase, self).setUp()
+        for i, name in enumerate(['a_b', 'axb', '100%', '100x', 'zed', 'mid']):
+            db.session.add(Portfolio(name=name, cash=100.0 * (i % 3)))
+        db.session.commit()
+
+    def all_pages(self, sort, order, per_page=2, prefix=None):
+        names, cursor = [], None
+        while True:
+            rows, cursor = portfolio_page(sort, order, prefix, cursor, per_page)
+            names += [row['name'] for row in rows]
+            if not cursor:
+                return names
+
+    def test_pages_cover_every_row_in_order(self):
+        expected = [port.name for port in Portfolio.query.order_by(Portfolio.market_value.desc(),
+                                                                     Portfolio.id.desc())]
+        self.assertEqual(self.all_pages('market_value', 'desc'), expected)
+        self.assertEqual(self.all_pages('name', 'asc', 4), sorted(expected))
+
+    def test_null_sort_values_are_kept(self):
+        Portfolio.query.filter(Portfolio.name.in_(['axb', 'zed'])).update({Portfolio.profit_percent: None},
+                                                                          synchronize_session=False)
+        db.session.commit()
+        for order in ('asc', 'desc'):
+            names = self.all_pages('profit_percent', order)
+            self.assertEqual(sorted(names), sorted(port.name for port in Portfolio.query))
+            self.assertEqual(sorted(names[-2:]), ['axb', 'zed'])
+
+    def test_prefix_wildcards_are_literal(self):
+        self.assertEqual(self.all_pages('name', 'asc', prefix='a_'), ['a_b'])
+        self.assertEqual(self.all_pages('name', 'asc', prefix='100%'), ['100%'])
+
+    def test_malformed_cursor(self):
+        self.assertEqual(decode_cursor(encode_cursor(1.5, 3)), (1.5, 3))
+        for cursor in ('garbage', 'e30=', encode_cursor(1.5, 'x')):
+            with self.assertRaises(CursorError):
+                decode_cursor(cursor)
+        client = self.app.test_client()
+        self.assertEqual(client.get('/api/portfolios?after=garbage').status_code, 400)
+        self.assertEqual(client.get('/portfolio_main?after=%25%25').status_code, 400)
+
+    def test_bulk_writes_invalidate_pages(self):
+        rows, _ = portfolio_page('name', 'asc', None, None, 10)
+        port = Portfolio.query.filter_by(name='zed').one()
+        db.session.bulk_update_mappings(Portfolio, [dict(id=port.id, cash=12345.0)])
+        db.session.commit()
+        rows, _ = portfolio_page('name', 'asc', None, None, 10)
+        self.assertEqual([row['cash'] for row in rows if row['name'] == 'zed'], [12345.0])
+        db.session.bulk_insert_mappings(Portfolio, [dict(name='zed_opt', cash=1.0, market_value=1.0)])
+        db.session.commit()
+        rows, _ = portfolio_page('name', 'asc', None, None, 10)
+        self.assertIn('zed_opt', [row['name'] for row in rows])
+
+    def test_api(self):
+        client = self.app.test_client()
+        data = json.loads(client.get('/api/portfolios?per_page=4').get_data(as_text=True))
+        self.assertEqual(len(data['portfolios']), 4)
+        more = json.loads(client.get('/api/portfolios?per_page=4&after=' + data['next']).get_data(as_text=True))
+        self.assertEqual(len(more['portfolios']), 2)
+        self.assertIsNone(more['next'])
+
+
+class HoldingPageTestCase(AppTestCase):
+    def test_holding_pages(self):
+        portfolio = self.add_portfolio()
+        rows, cursor = holding_page(portfolio, None, 3)
+        rest, last = holding_page(portfolio, cursor, 3)
+        self.assertIsNone(last)
+        self.assertEqual(sorted(row.symbol for row in rows + rest), ['AAA', 'BBB', 'CCC', 'DDD'])
+        percents = [row.portfolio_percent for row in rows + rest]
+        self.assertEqual(percents, sorted(percents, reverse=True))
+
+    def test_portfolio_page_without_invested_value(self):
+        # holdings worth nothing - totals must not divide by the zero invested value
+        portfolio = self.add_portfolio(symbols=('AAA',))
+        Holding.query.update({Holding.last_price: 0.0, Holding.market_value: 0.0})
+        Portfolio.query.update({Portfolio.market_value: Portfolio.cash, Portfolio.total_profit: -400.0})
+        db.session.commit()
+        self.assertEqual(self.app.test_client().get('/portfolio/' + portfolio.name).status_code, 200)
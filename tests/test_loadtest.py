@@ -0,0 +1,44 @@
+import os
+from unittest import mock
+
+from tests.base import AppTestCase
+from app import create_app, db, prices, jobs
+from app.loadtest import LoadTest
+
+
+class LoadTestTestCase(AppTestCase):
+    def setUp(self):
+        super(LoadTestTestCase, self).setUp()
+        self.load_app = create_app('loadtest')
+        self.load_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(self.tmp, 'load.sqlite')
+        prices.init_app(self.load_app)
+
+    def tearDown(self):
+        with self.load_app.app_context():
+            db.session.remove()
+            db.get_engine(self.load_app).dispose()
+        super(LoadTestTestCase, self).tearDown()
+
+    def load(self, **kwargs):
+        load = LoadTest(self.load_app, portfolios=3, holdings=4, concurrency=2, **kwargs)
+        load.seed_database()
+        return load
+
+    def test_seed_and_report(self):
+        load = self.load(requests=24, mix={'portfolio_main': 1, 'portfolio': 1, 'holding_edit': 1})
+        self.assertEqual(len(load.targets), 12)
+        rows = load.run()
+        self.assertEqual(sum(row['requests'] for row in rows), 24)
+        self.assertEqual(sum(row['errors'] for row in rows), 0)
+        self.assertTrue(all(row['queries'] > 0 for row in rows))
+
+    def test_optimize_job_polled_to_completion(self):
+        rows = dict((row['route'], row) for row in self.load(requests=2, mix={'optimize': 1}).run())
+        self.assertEqual(rows['optimize']['errors'], 0)
+        self.assertEqual((rows['optimize_job']['requests'], rows['optimize_job']['errors']), (2, 0))
+
+    def test_missing_job_is_recorded_as_error(self):
+        # e.g. the job was started by another worker process - the poll gets a 404
+        with mock.patch.object(jobs, 'get', return_value=None):
+            rows = dict((row['route'], row) for row in self.load(requests=2, mix={'optimize': 1}).run())
+        self.assertEqual((rows['optimize_job']['requests'], rows['optimize_job']['errors']), (2, 2))
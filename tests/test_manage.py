@@ -0,0 +1,17 @@
+import os
+import unittest
+from unittest import mock
+
+
+class ManageTestCase(unittest.TestCase):
+    def test_every_command_formats_help(self):
+        # argparse %-formats help strings - a bare % breaks --help
+        with mock.patch.dict(os.environ, {'MYPYFI_CONFIG': 'testing'}):
+            import manage
+        from flask_script import Command
+        commands = dict((name, command) for name, command in manage.manager._commands.items()
+                        if isinstance(command, Command) and command.get_options())
+        self.assertIn('optimize-all', commands)
+        for name, command in commands.items():
+            parser = command.create_parser('manage.py ' + name)
+            self.assertIn('usage:', parser.format_help(), name)
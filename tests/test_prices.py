@@ -0,0 +1,136 @@
+import datetime as dt
+import os
+import threading
+import time
+import unittest
+
+import pandas as pd
+
+from tests.base import AppTestCase, SYMBOLS
+from app import prices
+from app.prices import PriceClient, PriceSource, PriceSourceError, FileSource, FakeSource, RateLimiter
+
+PRICE_DIR = os.path.join(os.path.dirname(__file__), 'prices')
+
+
+class CountingSource(PriceSource):
+    # file prices behind a call counter, optional delay and failures
+    name = 'counting'
+
+    def __init__(self, failures=0, delay=0.0):
+        self.files = FileSource(PRICE_DIR)
+        self.failures = failures
+        self.delay = delay
+        self.calls = 0
+
+    def fetch(self, symbol, start, end):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.calls <= self.failures:
+            raise IOError('connection reset')
+        return self.files.fetch(symbol, start, end)
+
+
+def counting_client(source, retries=3):
+    client = PriceClient()
+    client.default_source = source.name
+    client.retries = retries
+    client.backoff = 0.0
+    client.register_source(source)
+    return client
+
+
+class FileSourceTestCase(unittest.TestCase):
+    def test_fetch_between_dates(self):
+        data = FileSource(PRICE_DIR).fetch('aaa', dt.date(2016, 3, 1), dt.date(2016, 3, 31))
+        self.assertEqual(list(data.columns), ['Open', 'High', 'Low', 'Close', 'Volume', 'Adj Close'])
+        self.assertEqual(data.index[0], pd.Timestamp('2016-03-01'))
+        self.assertEqual(data.index[-1], pd.Timestamp('2016-03-31'))
+
+    def test_missing_symbol(self):
+        with self.assertRaises(PriceSourceError):
+            FileSource(PRICE_DIR).fetch('NOPE', None, None)
+
+    def test_fake_source_is_deterministic(self):
+        first = FakeSource().fetch('XYZ', dt.date(2016, 1, 1), dt.date(2016, 6, 30))
+        second = FakeSource().fetch('xyz', dt.date(2016, 1, 1), dt.date(2016, 6, 30))
+        self.assertTrue(first.equals(second))
+
+
+class PriceClientTestCase(AppTestCase):
+    def test_testing_config_uses_fixtures(self):
+        source = prices.get_source()
+        self.assertIsInstance(source, FileSource)
+        self.assertEqual(os.path.abspath(source.directory), os.path.abspath(PRICE_DIR))
+        # remote source names are served by the file source too
+        self.assertIs(prices.get_source('yahoo'), source)
+
+    def test_get_panel(self):
+        panel = prices.get_panel(['CCC', 'AAA'], dt.date(2016, 1, 1), dt.date(2016, 12, 31))
+        self.assertEqual(list(panel.columns), ['CCC', 'AAA'])
+        self.assertEqual(len(panel), len(pd.bdate_range('2016-01-01', '2016-12-31')))
+
+    def test_last_price_and_validate(self):
+        data = pd.read_csv(os.path.join(PRICE_DIR, 'BBB.csv'), index_col=0)
+        self.assertAlmostEqual(prices.last_price('BBB'), data['Adj Close'].iloc[-1])
+        self.assertTrue(prices.validate('EEE'))
+        self.assertFalse(prices.validate('NOPE'))
+
+    def test_get_histories(self):
+        histories = prices.get_histories(SYMBOLS, dt.date(2016, 1, 1))
+        self.assertEqual(sorted(histories), list(SYMBOLS))
+
+
+class RetryTestCase(unittest.TestCase):
+    def test_retries_transient_errors(self):
+        source = CountingSource(failures=2)
+        data = counting_client(source).get_history('AAA')
+        self.assertEqual(source.calls, 3)
+        self.assertFalse(data.empty)
+
+    def test_gives_up_after_retries(self):
+        source = CountingSource(failures=10)
+        with self.assertRaises(PriceSourceError):
+            counting_client(source, retries=2).get_history('AAA')
+        self.assertEqual(source.calls, 3)
+
+    def test_source_errors_are_not_retried(self):
+        source = CountingSource()
+        with self.assertRaises(PriceSourceError):
+            counting_client(source).get_history('NOPE')
+        self.assertEqual(source.calls, 1)
+
+    def test_coalesces_inflight_requests(self):
+        source = CountingSource(delay=0.2)
+        client = counting_client(source)
+        futures = [client.submit('AAA', dt.date(2016, 1, 1), dt.date(2016, 2, 1)) for _ in range(5)]
+        self.assertEqual(len(set(id(future) for future in futures)), 1)
+        futures[0].result()
+        self.assertEqual(source.calls, 1)
+
+
+class RateLimiterTestCase(unittest.TestCase):
+    def test_limits_rate(self):
+        limiter = RateLimiter(20.0)
+        started = time.time()
+        for _ in range(5):
+            limiter.acquire()
+        self.assertGreaterEqual(time.time() - started, 0.19)
+
+    def test_shared_between_threads(self):
+        limiter = RateLimiter(50.0, burst=2)
+        started = time.time()
+        threads = [threading.Thread(target=limiter.acquire) for _ in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # two from the burst, ten at 50 per second
+        self.assertGreaterEqual(time.time() - started, 0.19)
+
+    def test_disabled(self):
+        limiter = RateLimiter(None)
+        started = time.time()
+        for _ in range(100):
+            limiter.acquire()
+        self.assertLess(time.time() - started, 0.1)
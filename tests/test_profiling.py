@@ -0,0 +1,97 @@
+import threading
+import tracemalloc
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from app import profiling
+from app.profiling import MemoryProfiler
+
+
+class MemoryProfilerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.memory = MemoryProfiler()
+        self.memory.enabled = True
+        self.memory.interval = 0.01
+
+    def tearDown(self):
+        tracemalloc.stop()
+
+    def allocate(self, name, mb):
+        with self.memory.stage(name):
+            block = np.ones(int(mb * 2 ** 20 / 8))
+            block.sum()
+            del block
+
+    def test_disabled_records_nothing(self):
+        self.memory.enabled = False
+        self.allocate('off', 1)
+        self.assertEqual(self.memory.history(), [])
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_peak_of_freed_allocation(self):
+        self.allocate('big', 8)
+        record = self.memory.history()[-1]
+        self.assertEqual(record['peak_source'], 'tracemalloc' if profiling.reset_peak else 'rss')
+        self.assertTrue(record['reliable'])
+        self.assertLess(record['retained_mb'], 1.0)
+        if profiling.reset_peak is not None:
+            self.assertGreater(record['peak_mb'], 7.5)
+
+    def test_peak_resets_between_stages(self):
+        if profiling.reset_peak is None:
+            self.skipTest('tracemalloc.reset_peak needs Python 3.9')
+        self.allocate('big', 8)
+        self.allocate('small', 1)
+        self.assertLess(self.memory.history()[-1]['peak_mb'], 2.0)
+
+    def test_outer_stage_includes_inner_peak(self):
+        if profiling.reset_peak is None:
+            self.skipTest('tracemalloc.reset_peak needs Python 3.9')
+        with self.memory.stage('outer'):
+            self.allocate('inner', 8)
+        inner, outer = self.memory.history()
+        self.assertEqual((inner['stage'], outer['stage']), ('inner', 'outer'))
+        self.assertGreaterEqual(outer['peak_mb'], inner['peak_mb'])
+        self.assertTrue(inner['reliable'] and outer['reliable'])
+
+    def test_without_reset_peak_uses_rss(self):
+        # older runtimes - a lifetime peak from an earlier stage must not leak in
+        self.allocate('warmup', 16)
+        self.memory.interval = 60  # RSS read at start, stop and for the record only
+        with mock.patch.object(profiling, 'reset_peak', None), \
+                mock.patch.object(profiling, 'current_rss', side_effect=[100 * 2 ** 20, 103 * 2 ** 20,
+                                                                         101 * 2 ** 20]):
+            with self.memory.stage('old'):
+                pass
+        record = self.memory.history()[-1]
+        self.assertEqual(record['peak_source'], 'rss')
+        self.assertAlmostEqual(record['peak_mb'], 3.0, places=1)
+
+    def test_overlapping_stages_are_unreliable(self):
+        started, release = threading.Event(), threading.Event()
+
+        def other():
+            with self.memory.stage('other'):
+                started.set()
+                release.wait(5)
+        thread = threading.Thread(target=other)
+        thread.start()
+        started.wait(5)
+        with self.memory.stage('mine'):
+            release.set()
+        thread.join()
+        self.allocate('alone', 1)
+        records = dict((record['stage'], record) for record in self.memory.history())
+        self.assertFalse(records['mine']['reliable'])
+        self.assertFalse(records['other']['reliable'])
+        self.assertTrue(records['alone']['reliable'])
+        self.assertEqual(self.memory.budgets()['mine']['unreliable'], 1)
+
+    def test_collect_gathers_this_thread(self):
+        with self.memory.collect() as records:
+            self.allocate('collected', 1)
+        self.allocate('outside', 1)
+        self.assertEqual([record['stage'] for record in records], ['collected'])
+        self.assertEqual(self.memory.budgets()['collected']['runs'], 1)
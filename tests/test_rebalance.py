@@ -0,0 +1,49 @@
+from tests.base import AppTestCase
+from app.models import Portfolio, Holding
+
+
+class RebalanceTestCase(AppTestCase):
+    def setUp(self):
+        super(RebalanceTestCase, self).setUp()
+        self.portfolio = self.add_portfolio()
+        self.prices = {'AAA': 50.0, 'BBB': 40.0, 'CCC': 25.0, 'DDD': 100.0}
+
+    def holdings(self, portfolio):
+        return dict((holding.symbol, (holding.id, holding.shares)) for holding in portfolio.holdings)
+
+    def test_create_at_target_shares(self):
+        optimal = self.portfolio.create_optimal_portfolio({'AAA': 0.5, 'BBB': 0.5}, self.prices,
+                                                          {'AAA': 10, 'BBB': 20})
+        self.assertEqual(optimal.name, 'test_opt')
+        self.assertEqual(dict((sym, shares) for sym, (_, shares) in self.holdings(optimal).items()),
+                         {'AAA': 10, 'BBB': 20})
+        self.assertAlmostEqual(optimal.invested, 1300.0)
+        self.assertAlmostEqual(optimal.cash, round(self.portfolio.market_value - 1300.0, 2))
+        self.assertEqual(optimal.num_holdings, 2)
+
+    def test_rebalance_in_place(self):
+        first = self.holdings(self.portfolio.create_optimal_portfolio(
+            {'AAA': 0.5, 'BBB': 0.5}, self.prices, {'AAA': 10, 'BBB': 20}))
+        optimal = self.portfolio.create_optimal_portfolio({'BBB': 0.4, 'CCC': 0.6}, self.prices,
+                                                          {'BBB': 5, 'CCC': 30})
+        second = self.holdings(optimal)
+        # BBB row updated in place, AAA dropped, CCC inserted
+        self.assertEqual(second['BBB'], (first['BBB'][0], 5))
+        self.assertNotIn('AAA', second)
+        self.assertEqual(second['CCC'][1], 30)
+        self.assertEqual(Portfolio.query.filter_by(name='test_opt').count(), 1)
+
+    def test_zero_shares_are_dropped(self):
+        self.portfolio.create_optimal_portfolio({'AAA': 0.5, 'BBB': 0.5}, self.prices, {'AAA': 10, 'BBB': 20})
+        optimal = self.portfolio.create_optimal_portfolio({'AAA': 0.5, 'BBB': 0.5}, self.prices,
+                                                          {'AAA': 10, 'BBB': 0})
+        self.assertEqual(list(self.holdings(optimal)), ['AAA'])
+        self.assertEqual(Holding.query.filter_by(portfolio_id=optimal.id).count(), 1)
+
+    def test_failure_rolls_back(self):
+        self.portfolio.create_optimal_portfolio({'AAA': 1.0}, self.prices, {'AAA': 10})
+        with self.assertRaises(KeyError):
+            # no last price for EEE
+            self.portfolio.create_optimal_portfolio({'AAA': 0.5, 'EEE': 0.5}, self.prices, {'AAA': 1})
+        optimal = Portfolio.query.filter_by(name='test_opt').one()
+        self.assertEqual(dict((sym, shares) for sym, (_, shares) in self.holdings(optimal).items()), {'AAA': 10})
@@ -0,0 +1,77 @@
+import datetime as dt
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pandas as pd
+
+from tests.base import AppTestCase, START
+from app.jobs import JobCancelled
+from app.main import report
+from app.main.report import PortfolioReport, REPORT_SECTIONS, deadline_progress, report_all, write_parquet
+
+
+class ReportTestCase(AppTestCase):
+    def setUp(self):
+        super(ReportTestCase, self).setUp()
+        self.portfolio = self.add_portfolio(symbols=('AAA', 'BBB', 'CCC'))
+        self.output = os.path.join(self.tmp, 'reports')
+        self.options = {'start_date': START, 'end_date': dt.date.today() + dt.timedelta(days=10), 'paths': 200}
+
+    def test_every_section(self):
+        directory = os.path.join(self.output, 'test')
+        summary = PortfolioReport(self.portfolio, directory, formats=('html', 'json'), **self.options).run()
+        self.assertEqual(summary['status'], 'done', summary['errors'])
+        for section in REPORT_SECTIONS:
+            self.assertIn(section, summary)
+            self.assertTrue(os.path.exists(os.path.join(directory, section + '.png')))
+            self.assertTrue(os.path.exists(os.path.join(directory, section + '.json')))
+        self.assertFalse(os.path.exists(os.path.join(directory, 'risk.pdf')))
+        weights = pd.read_json(os.path.join(directory, 'optimization.json'), orient='split')
+        self.assertAlmostEqual(weights.optimal.sum(), 1.0)
+        self.assertAlmostEqual(weights.current.sum(), 1.0)
+        with open(os.path.join(directory, 'summary.json')) as f:
+            self.assertEqual(json.load(f)['name'], 'test')
+        with open(os.path.join(directory, 'report.html')) as f:
+            self.assertIn('risk.png', f.read())
+
+    def test_failed_section_does_not_stop_the_others(self):
+        directory = os.path.join(self.output, 'test')
+        with mock.patch.object(report, 'PortfolioRisk', side_effect=ValueError('no prices')):
+            summary = PortfolioReport(self.portfolio, directory, formats=('json',), **self.options).run()
+        self.assertEqual(summary['status'], 'partial')
+        self.assertEqual(summary['errors'], {'risk': 'ValueError: no prices'})
+        self.assertIn('simulation', summary)
+        self.assertEqual(sorted(summary['files']), ['optimization.json', 'simulation.json', 'valuation.json'])
+
+    def test_deadline_skips_remaining_sections(self):
+        progress = deadline_progress(time.time() - 1)
+        self.assertRaises(JobCancelled, progress, 0, 1)
+        directory = os.path.join(self.output, 'test')
+        summary = PortfolioReport(self.portfolio, directory, formats=('json',), progress=progress,
+                                  **self.options).run()
+        self.assertEqual(summary['status'], 'timeout')
+        self.assertEqual(summary['files'], [])
+
+    def test_parquet_falls_back_to_csv(self):
+        frame = pd.DataFrame({'a': [1.0, 2.0]})
+        with mock.patch.object(pd.DataFrame, 'to_parquet', side_effect=ImportError('no engine')):
+            name = write_parquet(frame, os.path.join(self.tmp, 'table'))
+        self.assertEqual(name, 'table.csv')
+        self.assertEqual(list(pd.read_csv(os.path.join(self.tmp, name), index_col=0).a), [1.0, 2.0])
+
+    def test_report_all(self):
+        self.add_portfolio('other', symbols=('DDD', 'EEE'))
+        self.add_portfolio('test_opt', symbols=('AAA',))
+        # workers as threads on this app - process workers would build their own
+        with mock.patch.object(report, 'ProcessPoolExecutor', ThreadPoolExecutor), \
+                mock.patch.object(report, 'worker_app', self.app):
+            summaries = report_all('testing', self.output, processes=1, formats=('json',), **self.options)
+        self.assertEqual([summary['name'] for summary in summaries], ['other', 'test'])
+        self.assertEqual([summary['status'] for summary in summaries], ['done', 'done'])
+        with open(os.path.join(self.output, 'index.json')) as f:
+            self.assertEqual(len(json.load(f)['portfolios']), 2)
+        self.assertTrue(os.path.exists(os.path.join(self.output, 'index.html')))
+        self.assertTrue(os.path.exists(os.path.join(self.output, 'other', 'summary.json')))
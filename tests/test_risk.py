@@ -0,0 +1,85 @@
+from unittest import mock
+import numpy as np
+import pandas as pd
+
+from tests.base import AppTestCase, START
+from app.main.forms import RiskForm
+from app import prices
+from app.main.panel import panel_cache, return_panel
+from app.main.risk import PortfolioRisk, risk_all, risk_cache, var_table
+
+
+class RiskTestCase(AppTestCase):
+    def setUp(self):
+        super(RiskTestCase, self).setUp()
+        self.portfolio = self.add_portfolio(symbols=('AAA', 'BBB', 'CCC'))
+        self.client = self.app.test_client()
+        # form defaults are relative to today - point them at the price fixtures
+        self.default = mock.patch.dict(RiskForm.start_date.kwargs, {'default': START})
+        self.default.start()
+
+    def tearDown(self):
+        self.default.stop()
+        super(RiskTestCase, self).tearDown()
+
+    def test_var_table_orders_measures(self):
+        rets = np.random.RandomState(0).normal(0.0, 0.01, (500, 3))
+        table = var_table(rets, np.array([0.5, 0.3, 0.2]), 0.95, 1, 2000)
+        for method in ('historical', 'parametric', 'monte_carlo'):
+            var, es = table[method]['var'][0], table[method]['es'][0]
+            self.assertGreater(var, 0.0)
+            self.assertGreaterEqual(es, var)
+        # components add up to the volatility part of the parametric VaR
+        mean = np.expm1(rets).mean(axis=0).dot([0.5, 0.3, 0.2])
+        self.assertAlmostEqual(table['component'][0].sum(), table['parametric']['var'][0] + mean, places=6)
+
+    def test_longer_horizon_more_risk(self):
+        one = PortfolioRisk(self.portfolio, START, 0.95, 1).results
+        ten = PortfolioRisk(self.portfolio, START, 0.95, 10).results
+        self.assertGreater(ten['parametric']['var'], one['parametric']['var'])
+
+    def test_risk_all_matches_single(self):
+        single = PortfolioRisk(self.portfolio, START, 0.99, 1).results
+        batch = risk_all([self.portfolio], START, 0.99, 1)['test']
+        self.assertAlmostEqual(batch['parametric']['var'], single['parametric']['var'])
+
+    def test_risk_all_keeps_each_portfolio_window(self):
+        # EEE only lists in June - portfolios without it keep their whole history
+        self.add_portfolio('late', symbols=('AAA', 'EEE'))
+        get_panel = prices.get_panel
+
+        def late_listing(symbols, start=None, end=None):
+            data = get_panel(symbols, start, end)
+            if 'EEE' in data:
+                data.loc[data.index < '2016-06-01', 'EEE'] = float('nan')
+            return data
+        with mock.patch.object(prices, 'get_panel', side_effect=late_listing):
+            batch = risk_all(None, START, 0.99, 1)
+            cached = PortfolioRisk(self.portfolio, START, 0.99, 1).results
+            risk_cache.clear()
+            panel_cache.clear()
+            single = PortfolioRisk(self.portfolio, START, 0.99, 1).results
+            late, full = return_panel(['AAA', 'EEE'], START), return_panel(['AAA', 'BBB', 'CCC'], START)
+        self.assertEqual(late.index[0], pd.Timestamp('2016-06-02'))
+        self.assertEqual(full.index[0], pd.Timestamp('2016-01-04'))
+        self.assertIs(cached, batch['test'])
+        for method in ('historical', 'parametric'):
+            self.assertAlmostEqual(batch['test'][method]['var'], single[method]['var'])
+
+    def test_view_uses_posted_values(self):
+        response = self.client.post('/portfolio/test/risk', data={
+            'start_date': START.isoformat(), 'confidence': '99', 'horizon': '5',
+            'estimator': 'sample', 'sampling': 'sobol'})
+        self.assertEqual(response.status_code, 200)
+        expected = PortfolioRisk(self.portfolio, START, 0.99, 5, sampling='sobol').results
+        self.assertIn('{0:.2f}%'.format(expected['parametric']['var'] * 100), response.get_data(as_text=True))
+
+    def test_view_rejected_post_uses_defaults(self):
+        response = self.client.post('/portfolio/test/risk', data={
+            'start_date': START.isoformat(), 'confidence': '200', 'horizon': '5',
+            'estimator': 'sample', 'sampling': 'sobol'})
+        self.assertEqual(response.status_code, 200)
+        html = response.get_data(as_text=True)
+        self.assertIn('Confidence must be 50% - 99.9%', html)
+        expected = PortfolioRisk(self.portfolio, START, 0.95, 1, sampling='sobol').results
+        self.assertIn('{0:.2f}%'.format(expected['parametric']['var'] * 100), html)
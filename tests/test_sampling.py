@@ -0,0 +1,83 @@
+import unittest
+
+import numpy as np
+
+from app.main.sampling import SCHEMES, SOBOL_MAX_DIM, Sampler, sobol, halton, normals, bridge_order, \
+    brownian_bridge, sample_weights, sample_returns, gbm_paths
+
+
+class SamplingTestCase(unittest.TestCase):
+    def test_sobol_first_points(self):
+        # unshifted points are the classic sequence, offset to cell centres
+        x = sobol(4, 2) - 0.5 / 2.0 ** 32
+        np.testing.assert_allclose(x, [[0.0, 0.0], [0.5, 0.5], [0.75, 0.25], [0.25, 0.75]])
+
+    def test_halton_first_points(self):
+        np.testing.assert_allclose(halton(3, 2), [[0.5, 1 / 3.0], [0.25, 2 / 3.0], [0.75, 1 / 9.0]])
+
+    def test_quasi_random_is_stratified(self):
+        # every 1/8 interval of each Sobol dimension, and of the base 2 Halton dimension, holds n/8 points
+        x = sobol(256, 5)
+        counts = np.array([np.bincount((x[:, j] * 8).astype(int), minlength=8) for j in range(5)])
+        self.assertTrue((counts == 32).all())
+        self.assertTrue((np.bincount((halton(256, 2)[:, 0] * 8).astype(int)) == 32).all())
+
+    def test_chunked_draws_match_one_draw(self):
+        for scheme in SCHEMES:
+            whole = Sampler(6, scheme, np.random.RandomState(3)).uniforms(1000)
+            if scheme in ('sobol', 'halton'):
+                sampler = Sampler(6, scheme, np.random.RandomState(3))
+                chunks = np.vstack([sampler.uniforms(300), sampler.uniforms(700)])
+                np.testing.assert_allclose(chunks, whole, err_msg=scheme)
+            self.assertEqual(whole.shape, (1000, 6))
+            self.assertTrue(((whole > 0) & (whole < 1)).all(), scheme)
+
+    def test_normal_moments(self):
+        for scheme in SCHEMES:
+            z = normals(4096, 3, scheme, np.random.RandomState(5))
+            self.assertLess(np.abs(z.mean(axis=0)).max(), 0.05, scheme)
+            self.assertLess(np.abs(z.std(axis=0) - 1).max(), 0.05, scheme)
+        np.testing.assert_allclose(normals(1000, 2, 'moment').mean(axis=0), 0.0, atol=1e-12)
+        z = normals(11, 2, 'antithetic')
+        np.testing.assert_allclose(z[:5], -z[6:11])
+
+    def test_sobol_pads_high_dimensions(self):
+        x = Sampler(SOBOL_MAX_DIM + 3, 'sobol', np.random.RandomState(0)).uniforms(64)
+        self.assertEqual(x.shape, (64, SOBOL_MAX_DIM + 3))
+
+    def test_unknown_scheme(self):
+        with self.assertRaises(ValueError):
+            Sampler(2, 'nope')
+
+    def test_brownian_bridge_visits_every_point(self):
+        order = bridge_order(10)
+        self.assertEqual(sorted(point for point, _, _ in order), list(range(1, 11)))
+        # bridged increments keep unit variance per step
+        z = np.random.RandomState(2).standard_normal((100000, 8, 1))
+        np.testing.assert_allclose(brownian_bridge(z).var(axis=0), 1.0, atol=0.03)
+        np.testing.assert_allclose(brownian_bridge(z).sum(axis=1)[:, 0], np.sqrt(8) * z[:, 0, 0])
+
+    def test_weights_and_returns(self):
+        weights = sample_weights(100, 4, 'sobol', np.random.RandomState(0))
+        np.testing.assert_allclose(weights.sum(axis=1), 1.0)
+        self.assertTrue((weights > 0).all())
+        cov = np.array([[0.04, 0.01], [0.01, 0.09]])
+        draws = sample_returns(50000, np.array([0.1, 0.2]), cov, 'moment', np.random.RandomState(0))
+        np.testing.assert_allclose(draws.mean(axis=0), [0.1, 0.2], atol=1e-12)
+        np.testing.assert_allclose(np.cov(draws, rowvar=False), cov, atol=2e-3)
+
+    def test_gbm_paths(self):
+        cov = np.array([[1e-4, 2e-5], [2e-5, 4e-4]])
+        mu = np.array([1e-3, -1e-3])
+        for scheme in ('pseudo', 'sobol'):
+            progress = []
+            paths = gbm_paths([10.0, 20.0], mu, cov, 16, 5000, scheme, np.random.RandomState(1), chunk=2048,
+                              progress=lambda done, total, message: progress.append(done))
+            self.assertEqual(paths.shape, (5000, 17, 2))
+            np.testing.assert_allclose(paths[:, 0], [[10.0, 20.0]] * 5000)
+            self.assertEqual(progress, [2048, 4096, 5000])
+            logs = np.log(paths[:, -1] / paths[:, 0])
+            np.testing.assert_allclose(logs.mean(axis=0), mu * 16, atol=2e-3)
+            np.testing.assert_allclose(logs.var(axis=0), np.diag(cov) * 16, rtol=0.1)
+        single = gbm_paths([10.0], [0.0], [[1e-4]], 4, 10, dtype=np.float32)
+        self.assertEqual(single.dtype, np.float32)
@@ -0,0 +1,67 @@
+import datetime as dt
+
+import numpy as np
+
+from tests.base import AppTestCase, START
+from app.models import Holding
+from app.main.scenarios import ScenarioEngine, parse_shocks, parse_group
+
+
+class ScenarioTestCase(AppTestCase):
+    def setUp(self):
+        super(ScenarioTestCase, self).setUp()
+        self.first = self.add_portfolio('first', ('AAA', 'BBB'))
+        self.second = self.add_portfolio('second', ('BBB', 'CCC', 'DDD'))
+        self.engine = ScenarioEngine()
+
+    def test_parse(self):
+        self.assertEqual(parse_shocks('aaa, bbb: -20; CCC: 5'), {'AAA': -0.2, 'BBB': -0.2, 'CCC': 0.05})
+        self.assertEqual(parse_group('tech: aaa, bbb ccc'), ('TECH', ['AAA', 'BBB', 'CCC']))
+        for text in ('AAA -20', 'AAA: lots'):
+            with self.assertRaises(ValueError):
+                parse_shocks(text)
+        for text in ('TECH AAA', 'TECH:', ': AAA'):
+            with self.assertRaises(ValueError):
+                parse_group(text)
+
+    def test_exposure_matrix(self):
+        self.assertEqual(self.engine.names, ['first', 'second'])
+        self.assertEqual(self.engine.symbols, ['AAA', 'BBB', 'CCC', 'DDD'])
+        dense = self.engine.exposure.toarray()
+        holdings = Holding.query.filter_by(portfolio_id=self.second.id).all()
+        for holding in holdings:
+            self.assertAlmostEqual(dense[1, self.engine.symbols.index(holding.symbol)], holding.market_value)
+        self.assertEqual(dense[0, 2], 0.0)
+
+    def test_shocks_and_groups(self):
+        returns = self.engine.shock_scenarios([{'AAA': -0.1}, {'TECH': -0.2, 'CCC': 0.05}],
+                                              {'TECH': ['BBB', 'CCC', 'ZZZ']})
+        np.testing.assert_allclose(returns, [[-0.1, 0, 0, 0], [0, -0.2, 0.05, 0]])
+        pnl = self.engine.pnl(returns)
+        dense = self.engine.exposure.toarray()
+        np.testing.assert_allclose(pnl, dense.dot(returns.T))
+
+    def test_unknown_names_rejected(self):
+        with self.assertRaises(ValueError) as raised:
+            self.engine.shock_scenarios([{'AAA': -0.1, 'TECK': -0.2}], {'TECH': ['BBB']})
+        self.assertIn('TECK', str(raised.exception))
+
+    def test_summary(self):
+        returns = self.engine.shock_scenarios([{'BBB': -0.5}, {'BBB': 0.1}, {'CCC': -0.3}])
+        rows = dict((row['name'], row) for row in self.engine.summary(returns))
+        self.assertEqual(rows['first']['worst_scenario'], 0)
+        self.assertAlmostEqual(rows['first']['worst_percent'], rows['first']['worst'] / rows['first']['value'])
+        self.assertLess(rows['second']['worst'], rows['second']['mean'])
+        self.assertGreater(rows['second']['best'], 0)
+
+    def test_summary_without_scenarios(self):
+        rows = self.engine.summary(np.zeros((0, len(self.engine.symbols))))
+        self.assertEqual([row['name'] for row in rows], ['first', 'second'])
+        self.assertTrue(all(row['worst'] == 0.0 and row['worst_scenario'] is None for row in rows))
+
+    def test_historical_replay(self):
+        returns = self.engine.historical_scenarios(START, dt.date(2016, 3, 31), window=5)
+        daily = self.engine.historical_scenarios(START, dt.date(2016, 3, 31))
+        self.assertEqual(len(returns), len(daily) - 4)
+        np.testing.assert_allclose(np.log1p(returns[0]), np.log1p(daily[:5]).sum(axis=0))
+        self.assertEqual(len(self.engine.historical_scenarios(START, dt.date(2016, 1, 8), window=30)), 0)
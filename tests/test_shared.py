@@ -0,0 +1,108 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from app.shared import SharedPanels, PINNED
+
+
+class SharedPanelsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.shared = SharedPanels()
+        self.shared.directory = self.tmp
+        self.pid = str(os.getpid())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def entries(self):
+        with open(os.path.join(self.tmp, 'index.json')) as f:
+            return json.load(f)
+
+    def test_round_trip(self):
+        values = np.arange(12.0).reshape(3, 4)
+        paths = self.shared.publish('panel', {'values': values}, {'columns': ['a', 'b', 'c', 'd']})
+        self.assertTrue(os.path.exists(paths['values']))
+        arrays, meta = self.shared.attach('panel')
+        np.testing.assert_array_equal(arrays['values'], values)
+        self.assertIsInstance(arrays['values'], np.memmap)
+        self.assertEqual(meta, {'columns': ['a', 'b', 'c', 'd']})
+        self.assertIsNone(self.shared.attach('other'))
+
+    def test_publisher_holds_reference(self):
+        self.shared.max_bytes = 100
+        paths = self.shared.publish('first', {'x': np.zeros(10)})
+        # a later publish over budget can not evict the entry this process just wrote
+        self.shared.publish('second', {'x': np.zeros(10)})
+        self.assertEqual(set(self.entries()), {self.shared.name('first'), self.shared.name('second')})
+        self.assertTrue(os.path.exists(paths['x']))
+        # once the lease lapses the least recently used entry goes
+        self.shared.lease = -1
+        self.shared.publish('third', {'x': np.zeros(10)})
+        self.assertFalse(os.path.exists(paths['x']))
+
+    def test_pinned_outlives_ttl(self):
+        # grid workers reopen the file by path long after it was published
+        paths = self.shared.publish('grid', {'x': np.zeros(10)}, pin=True)
+        self.shared.ttl = -1
+        self.assertIsNone(self.shared.attach('grid'))
+        self.shared.publish('other', {'x': np.zeros(10)})
+        self.assertTrue(os.path.exists(paths['x']))
+        self.shared.release('grid')
+        self.shared.publish('more', {'x': np.zeros(10)})
+        self.assertFalse(os.path.exists(paths['x']))
+
+    def test_pinned_until_released(self):
+        self.shared.max_bytes = 100
+        self.shared.lease = -1
+        paths = self.shared.publish('grid', {'x': np.zeros(10)}, pin=True)
+        self.assertEqual(self.entries()[self.shared.name('grid')]['refs'], {self.pid: PINNED})
+        self.shared.publish('other', {'x': np.zeros(10)})
+        self.assertTrue(os.path.exists(paths['x']))
+        self.shared.release('grid')
+        self.shared.publish('more', {'x': np.zeros(10)})
+        self.assertFalse(os.path.exists(paths['x']))
+
+    def test_dead_process_references_dropped(self):
+        self.shared.max_bytes = 100
+        paths = self.shared.publish('first', {'x': np.zeros(10)})
+        with mock.patch('app.shared.pid_alive', return_value=False):
+            self.shared.publish('second', {'x': np.zeros(10)})
+        self.assertFalse(os.path.exists(paths['x']))
+
+    def test_repeated_attach_does_not_rewrite_index(self):
+        self.shared.publish('panel', {'x': np.ones(3)})
+        index = os.path.join(self.tmp, 'index.json')
+        before = os.stat(index).st_ino
+        for _ in range(5):
+            self.assertIsNotNone(self.shared.attach('panel'))
+        self.assertEqual(os.stat(index).st_ino, before)
+        # stale use stamps are refreshed
+        with mock.patch('app.shared.time.time', return_value=time.time() + 60):
+            self.shared.attach('panel')
+        self.assertNotEqual(os.stat(index).st_ino, before)
+        self.assertGreater(self.entries()[self.shared.name('panel')]['used'], time.time() + 30)
+
+    def test_expired_and_missing_entries_removed(self):
+        paths = self.shared.publish('old', {'x': np.ones(3)})
+        self.shared.ttl = -1
+        self.assertIsNone(self.shared.attach('old'))
+        self.assertEqual(self.entries(), {})
+        self.assertFalse(os.path.exists(paths['x']))
+        self.shared.ttl = 3600
+        paths = self.shared.publish('gone', {'x': np.ones(3)})
+        os.remove(paths['x'])
+        self.assertIsNone(self.shared.attach('gone'))
+        self.assertEqual(self.entries(), {})
+
+    def test_disabled(self):
+        self.shared.directory = None
+        self.assertIsNone(self.shared.publish('panel', {'x': np.ones(3)}))
+        self.assertIsNone(self.shared.attach('panel'))
+        self.shared.release('panel')
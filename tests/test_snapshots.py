@@ -0,0 +1,51 @@
+import datetime as dt
+from unittest import mock
+
+from tests.base import AppTestCase
+from app import db
+from app.models import PortfolioSnapshot, HoldingSnapshot
+from app.main.valuation import PortfolioValuation
+
+
+class SnapshotTestCase(AppTestCase):
+    def setUp(self):
+        super(SnapshotTestCase, self).setUp()
+        self.portfolio = self.add_portfolio()
+        self.today = dt.date.today()
+
+    def collide(self, model, date):
+        # insert a conflicting row just before the first bulk insert of model -
+        # as if a concurrent refresh wrote the same day meanwhile
+        insert = db.session.bulk_insert_mappings
+        calls = []
+
+        def bulk_insert(mapper, rows, *args, **kwargs):
+            if mapper is model and not calls:
+                calls.append(mapper)
+                db.session.execute(PortfolioSnapshot.__table__.insert(),
+                                   dict(portfolio_id=self.portfolio.id, date=date, cash=0.0))
+            return insert(mapper, rows, *args, **kwargs)
+        return mock.patch.object(db.session, 'bulk_insert_mappings', bulk_insert), calls
+
+    def test_refresh_replaces_todays_rows(self):
+        self.portfolio.update()
+        self.portfolio.update()
+        self.assertEqual(PortfolioSnapshot.query.filter_by(date=self.today).count(), 1)
+        self.assertEqual(HoldingSnapshot.query.filter_by(date=self.today).count(), 4)
+
+    def test_concurrent_refresh_is_retried(self):
+        patch, calls = self.collide(PortfolioSnapshot, self.today)
+        with patch:
+            self.portfolio.update()
+        self.assertEqual(calls, [PortfolioSnapshot])
+        today = PortfolioSnapshot.query.filter_by(date=self.today).one()
+        self.assertAlmostEqual(today.market_value, self.portfolio.market_value)
+
+    def test_concurrent_backfill_is_retried(self):
+        patch, calls = self.collide(PortfolioSnapshot, dt.date(2016, 6, 1))
+        with patch:
+            added = PortfolioValuation(self.portfolio).update_snapshots()
+        self.assertEqual(calls, [PortfolioSnapshot])
+        self.assertTrue(added)
+        past = PortfolioSnapshot.query.filter(PortfolioSnapshot.date < self.today)
+        self.assertEqual(past.count(), past.with_entities(PortfolioSnapshot.date).distinct().count())
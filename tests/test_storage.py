@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import inspect
+
+from app import create_app, db
+
+
+class StorageProfileTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def pragma(self, config_name, name):
+        app = create_app(config_name)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(self.tmp, config_name + '.sqlite')
+        with app.app_context():
+            try:
+                return db.session.execute('PRAGMA ' + name).scalar()
+            finally:
+                db.session.remove()
+                db.get_engine(app).dispose()
+
+    def test_pragmas_only_for_configured_apps(self):
+        self.assertEqual(self.pragma('production', 'journal_mode'), 'wal')
+        self.assertEqual(self.pragma('production', 'busy_timeout'), 5000)
+        # a later app on another config keeps SQLite defaults
+        self.assertEqual(self.pragma('testing', 'journal_mode'), 'delete')
+        self.assertEqual(self.pragma('loadtest', 'synchronous'), 1)
+
+    def test_read_path_indexes(self):
+        app = create_app('testing')
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(self.tmp, 'indexes.sqlite')
+        with app.app_context():
+            db.create_all()
+            inspector = inspect(db.engine)
+            indexes = dict((table, set(index['name'] for index in inspector.get_indexes(table)))
+                           for table in ('portfolios', 'holdings', 'ticker_data', 'portfolio_snapshots'))
+            plan = ' '.join(str(row) for row in db.session.execute(
+                'EXPLAIN QUERY PLAN SELECT id FROM holdings WHERE portfolio_id = 1 AND symbol = "AAA"'))
+            db.session.remove()
+        self.assertTrue({'ix_holdings_portfolio_symbol', 'ix_holdings_symbol'} <= indexes['holdings'])
+        self.assertIn('ix_ticker_data_symbol_freq', indexes['ticker_data'])
+        self.assertIn('ix_portfolios_market_value_id', indexes['portfolios'])
+        self.assertIn('ix_portfolio_snapshots_portfolio_date', indexes['portfolio_snapshots'])
+        self.assertIn('ix_holdings_portfolio_symbol', plan)
@@ -0,0 +1,50 @@
+import datetime as dt
+import os
+
+import numpy as np
+
+from tests.base import AppTestCase
+from app import prices
+from app.models import Ticker_Dataset
+from app.prices import StoreSource, PriceSourceError
+
+
+class StoreTestCase(AppTestCase):
+    def setUp(self):
+        super(StoreTestCase, self).setUp()
+        prices.store_dir = os.path.join(self.tmp, 'tickers')
+        prices.reset()
+        self.data = prices.get_history('AAA', dt.date(2016, 1, 1), dt.date(2016, 6, 30))
+
+    def test_round_trip(self):
+        store = StoreSource(prices.store_dir, 'float32')
+        path = store.save('aaa', self.data)
+        self.assertEqual(os.path.basename(path), 'AAA.npz')
+        stored = store.fetch('AAA', dt.date(2016, 2, 1), dt.date(2016, 2, 29))
+        expected = self.data.loc['2016-02-01':'2016-02-29']
+        self.assertEqual(list(stored.columns), list(self.data.columns))
+        self.assertEqual(stored['Close'].dtype, np.float32)
+        self.assertEqual(stored['Volume'].dtype, np.int64)
+        np.testing.assert_allclose(stored['Adj Close'].values, expected['Adj Close'].values, rtol=1e-6)
+        self.assertTrue((stored.index == expected.index).all())
+
+    def test_resampled_dataset_read_back(self):
+        store = prices.get_source('store')
+        weekly = self.data.resample('W').last().dropna()
+        path = store.save('AAA', weekly, 'W')
+        self.assertEqual(os.path.basename(path), 'AAA_W.npz')
+        self.assertEqual(len(store.fetch('AAA', None, None, 'W')), len(weekly))
+        # the daily file is separate - and missing until saved
+        with self.assertRaises(PriceSourceError):
+            store.fetch('AAA', None, None)
+        self.assertEqual(store.path('AAA', 'B'), store.path('AAA'))
+
+    def test_ticker_add_saves_dataset(self):
+        client = self.app.test_client()
+        response = client.post('/ticker_add', data={'symbol': 'aaa', 'name': 'Triple A', 'start': '2016-01-01',
+                                                    'end': '2016-06-30', 'freq': 'W'})
+        self.assertEqual(response.status_code, 302)
+        dataset = Ticker_Dataset.query.filter_by(symbol='AAA', freq='W').one()
+        data = dataset.load()
+        self.assertEqual(len(data), dataset.vals)
+        self.assertEqual(data.index[0].weekday(), 6)
@@ -0,0 +1,105 @@
+import json
+import os
+import time
+import unittest
+from unittest import mock
+
+from tests.base import AppTestCase
+from app import symbols
+from app.symbols import SymbolUniverse, parse_listing
+
+NASDAQ = """Symbol|Security Name|Market Category|Test Issue|Financial Status|Round Lot Size|ETF|NextShares
+AAPL|Apple Inc. - Common Stock|Q|N|N|100|N|N
+ZXZZT|NASDAQ TEST STOCK|G|Y|N|100|N|N
+QQQ|Invesco QQQ Trust, Series 1|G|N|N|100|Y|N
+File Creation Time: 0101202100:00|||||||
+"""
+
+OTHER = """ACT Symbol|Security Name|Exchange|CQS Symbol|ETF|Round Lot Size|Test Issue|NASDAQ Symbol
+A|Agilent Technologies, Inc. Common Stock|N|A|N|100|N|A
+AA|Alcoa Corporation Common Stock |N|AA|N|100|N|AA
+AAPL|Duplicate listing|N|AAPL|N|100|N|AAPL
+SPY|SPDR S&P 500 ETF Trust|P|SPY|Y|100|N|SPY
+"""
+
+
+class ParseListingTestCase(unittest.TestCase):
+    def test_nasdaq_listed(self):
+        rows = parse_listing(NASDAQ)
+        self.assertEqual(rows, [('AAPL', 'Apple Inc. - Common Stock', 'NASDAQ', False),
+                                ('QQQ', 'Invesco QQQ Trust, Series 1', 'NASDAQ', True)])
+
+    def test_other_listed(self):
+        rows = parse_listing(OTHER)
+        self.assertEqual(rows[1], ('AA', 'Alcoa Corporation Common Stock', 'NYSE', False))
+        self.assertEqual(rows[3], ('SPY', 'SPDR S&P 500 ETF Trust', 'NYSE Arca', True))
+
+    def test_csv(self):
+        self.assertEqual(parse_listing('symbol,name\nmsft,Microsoft\n,blank\n'), [('MSFT', 'Microsoft', '', False)])
+        self.assertEqual(parse_listing(''), [])
+        self.assertRaises(ValueError, parse_listing, 'name,exchange\nApple,Q\n')
+
+
+class SymbolUniverseTestCase(AppTestCase):
+    def setUp(self):
+        super(SymbolUniverseTestCase, self).setUp()
+        self.directory = os.path.join(self.tmp, 'symbols')
+        os.mkdir(self.directory)
+        self.write('nasdaqlisted.txt', NASDAQ)
+        self.write('otherlisted.txt', OTHER)
+        self.app.config['SYMBOL_DIR'] = self.directory
+        self.universe = SymbolUniverse(self.app)
+
+    def write(self, name, text):
+        with open(os.path.join(self.directory, name), 'w') as f:
+            f.write(text)
+
+    def test_lookup(self):
+        self.assertTrue(self.universe.enabled)
+        # first file in name order wins a duplicate listing
+        self.assertEqual(self.universe.lookup(' aapl '), {'symbol': 'AAPL', 'name': 'Apple Inc. - Common Stock',
+                                                          'exchange': 'NASDAQ', 'etf': False})
+        self.assertIn('SPY', self.universe)
+        self.assertNotIn('ZXZZT', self.universe)
+        self.assertIsNone(self.universe.lookup('TOOLONGSYMBOL'))
+        self.assertIsNone(self.universe.lookup(''))
+
+    def test_complete(self):
+        self.assertEqual([row['symbol'] for row in self.universe.complete('a')], ['A', 'AA', 'AAPL'])
+        self.assertEqual([row['symbol'] for row in self.universe.complete('AA', limit=1)], ['AA'])
+        self.assertEqual(self.universe.complete('B'), [])
+        self.assertEqual(self.universe.complete(''), [])
+
+    def test_disabled_without_listing(self):
+        self.app.config['SYMBOL_DIR'] = os.path.join(self.tmp, 'missing')
+        universe = SymbolUniverse(self.app)
+        self.assertFalse(universe.enabled)
+        self.assertEqual(universe.complete('A'), [])
+        self.assertIsNone(universe.lookup('AAPL'))
+
+    def test_reloads_changed_files(self):
+        self.assertNotIn('MSFT', self.universe)
+        self.write('extra.csv', 'symbol,name\nMSFT,Microsoft\n')
+        # not re-checked before check_every has passed
+        self.assertNotIn('MSFT', self.universe)
+        self.universe.checked = time.time() - self.universe.check_every - 1
+        self.assertIn('MSFT', self.universe)
+
+    def test_download(self):
+        self.universe.urls = ('https://example.com/dir/nasdaqlisted.txt', 'https://example.com/dir/new.csv')
+        responses = [mock.Mock(text=NASDAQ), mock.Mock(text='symbol,name\nMSFT,Microsoft\n')]
+        with mock.patch('app.symbols.requests.get', side_effect=responses) as get:
+            count = self.universe.download()
+        self.assertEqual(get.call_count, 2)
+        self.assertEqual(count, 6)
+        self.assertIn('MSFT', self.universe)
+        self.assertEqual(sorted(os.listdir(self.directory)), ['nasdaqlisted.txt', 'new.csv', 'otherlisted.txt'])
+
+    def test_api(self):
+        with mock.patch.multiple(symbols, directory=self.directory, checked=0.0, stamp=None):
+            client = self.app.test_client()
+            found = json.loads(client.get('/api/symbols?q=aa&limit=2').get_data(as_text=True))
+            self.assertEqual([row['symbol'] for row in found['symbols']], ['AA', 'AAPL'])
+            row = json.loads(client.get('/api/symbols/spy').get_data(as_text=True))
+            self.assertEqual(row['exchange'], 'NYSE Arca')
+            self.assertEqual(client.get('/api/symbols/MSFT').status_code, 404)
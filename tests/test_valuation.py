@@ -0,0 +1,68 @@
+import datetime as dt
+import os
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from tests.base import AppTestCase
+from app import prices
+from app.models import PortfolioSnapshot
+from app.main.valuation import PortfolioValuation, equity_curve
+
+PRICE_DIR = os.path.join(os.path.dirname(__file__), 'prices')
+
+
+def close(symbol, date):
+    data = pd.read_csv(os.path.join(PRICE_DIR, symbol + '.csv'), index_col=0, parse_dates=True)
+    return data['Adj Close'][pd.Timestamp(date)]
+
+
+class ValuationTestCase(AppTestCase):
+    def setUp(self):
+        super(ValuationTestCase, self).setUp()
+        # AAA bought 2016-01-04, BBB 2016-02-03, CCC 2016-03-04
+        self.portfolio = self.add_portfolio(symbols=('AAA', 'BBB', 'CCC'))
+
+    def test_value_series_counts_holdings_from_purchase(self):
+        series = PortfolioValuation(self.portfolio).value_series(dt.date(2016, 1, 4), dt.date(2016, 3, 31))
+        self.assertEqual(series.index[0], pd.Timestamp('2016-01-04'))
+        day = dt.date(2016, 2, 10)
+        row = series.loc[pd.Timestamp(day)]
+        self.assertAlmostEqual(row.market_value, 1000.0 + 10 * close('AAA', day) + 20 * close('BBB', day))
+        self.assertAlmostEqual(row.invested, 30 * 40.0)
+        self.assertAlmostEqual(row.total_profit, row.market_value - row.invested - row.cash)
+        self.assertEqual(series.invested.iloc[-1], 60 * 40.0)
+
+    def test_missing_prices_are_not_losses(self):
+        index = pd.bdate_range('2016-01-04', '2016-01-15')
+        panel = pd.DataFrame({'AAA': 40.0, 'BBB': 50.0, 'CCC': 60.0}, index=index)
+        panel.loc[index[2:4], 'AAA'] = float('nan')  # gap - filled with the last price
+        panel.loc[index[:3], 'BBB'] = float('nan')  # no price yet - days skipped
+        held = PortfolioValuation(self.portfolio)
+        held.purch_date[:] = np.datetime64('2016-01-04')
+        with mock.patch.object(prices, 'get_panel', return_value=panel):
+            series = held.value_series(dt.date(2016, 1, 4), dt.date(2016, 1, 15))
+        self.assertEqual(series.index[0], index[3])
+        self.assertEqual(len(series), len(index) - 3)
+        self.assertTrue((series.market_value == 1000.0 + 10 * 40.0 + 20 * 50.0 + 30 * 60.0).all())
+
+    def test_empty_portfolio(self):
+        empty = self.add_portfolio('empty', symbols=())
+        self.assertTrue(PortfolioValuation(empty).value_series().empty)
+        self.assertEqual(PortfolioValuation(empty).update_snapshots(), 0)
+
+    def test_update_snapshots_is_incremental(self):
+        valuation = PortfolioValuation(self.portfolio)
+        added = valuation.update_snapshots()
+        # one row per trading day from the first purchase to the end of the price files
+        self.assertEqual(added, len(pd.bdate_range('2016-01-04', '2016-12-30')))
+        self.assertEqual(valuation.update_snapshots(), 0)
+        curve = equity_curve(self.portfolio, dt.date(2016, 1, 1), dt.date(2016, 12, 31))
+        self.assertEqual(len(curve), added)
+        self.assertEqual([snap.date for snap in curve], sorted(snap.date for snap in curve))
+
+    def test_refresh_records_today(self):
+        self.portfolio.update()
+        today = PortfolioSnapshot.query.filter_by(portfolio_id=self.portfolio.id, date=dt.date.today()).one()
+        self.assertAlmostEqual(today.market_value, self.portfolio.market_value)